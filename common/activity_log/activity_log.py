@@ -21,7 +21,13 @@ class ActivityLogError(Exception):
         return self.message
 
 class ActivityLog:
-    def __init__(self, log_two_ends: bool = False, range_for_partition: int = 20):
+    def __init__(
+        self,
+        log_two_ends: bool = False,
+        range_for_partition: int = 20,
+        appends_per_fsync: int = 0,
+        max_partitions: int = 1024,
+    ):
         self._dir = './log'
         os.makedirs(self._dir, exist_ok=True)
 
@@ -29,6 +35,10 @@ class ActivityLog:
         # Cantidad de ends a loggear, UNICAMENTE para el join, es 2
         # porque loggea los ends de juegos y reviews
         self._range_for_partition = range_for_partition
+        # Cantidad maxima de archivos de procesed_lines por cliente, los msg_ids
+        # derivados (ver utils.derive_msg_id) estan dispersos y sin esto cada uno
+        # terminaria en un archivo distinto
+        self._max_partitions = max_partitions
         self._procesed_lines_file_prefix = 'procesed_lines'
         self._ends_file_prefix = 'ends'
         self._middleware_dir = os.path.join(self._dir, 'middleware')
@@ -40,6 +50,23 @@ class ActivityLog:
         self._general_log_path = f'{self._dir}/{GENERAL_LOG_FILE_NAME}'
         create_file_if_unexistent(self._general_log_path)
 
+        # Indice en memoria de los msg_ids ya procesados de cada cliente, para
+        # no tener que recorrer los archivos de procesed_lines por cada mensaje.
+        # Se reconstruye desde disco la primera vez que se consulta a un cliente
+        # (por ejemplo, despues de un reinicio) y se actualiza junto con cada
+        # append a disco, por lo que siempre refleja lo que ya esta bajado.
+        self._processed_msg_ids: Dict[str, Set[str]] = {}
+        # Idem pero para los ends de cada cliente, la key es (client_id, end_logging)
+        self._logged_ends: Dict[Tuple[str, str], Set[str]] = {}
+
+        # Group commit: los archivos de msg_ids son append only, cada append es un
+        # unico write. Si appends_per_fsync > 0, cada esa cantidad de appends se
+        # hace fsync de todos los archivos escritos desde el ultimo fsync. Con 0
+        # no se hace fsync (alcanza con el page cache ante caidas del proceso).
+        self._appends_per_fsync = appends_per_fsync
+        self._appends_since_fsync = 0
+        self._files_pending_fsync: Set[str] = set()
+
     '''
     UTILITY
     '''
@@ -49,10 +76,11 @@ class ActivityLog:
         return length + line
     
     def _get_partition_file_name(self, msg_id: int):
-        return f"{self._procesed_lines_file_prefix}_{msg_id//self._range_for_partition}.txt"
+        partition = (msg_id // self._range_for_partition) % self._max_partitions
+        return f"{self._procesed_lines_file_prefix}_{partition}.bin"
     
     def _get_ends_file_name(self, end_logging: str = ''):
-        return f'{self._ends_file_prefix}{end_logging}.txt'
+        return f'{self._ends_file_prefix}{end_logging}.bin'
 
     # def _get_ends_file_path(self, client_id: str, end_logging: str = ''): 
     #     return os.path.join(self._dir, client_id, self._ends_file_name)
@@ -89,34 +117,88 @@ class ActivityLog:
 
     #     os.replace(temp_file_path, file_path)
 
-    def __append_msg_ids(self, directory: str, file_name: str, msg_ids: List[str]) -> bool:
-        # If file is large this is really ineficient
-        temp_file_path = os.path.join(directory, 'temp_append.txt')
-        file_path = os.path.join(directory, file_name)
+    def __append_msg_ids(
+        self, directory: str, file_name: str, msg_ids: List[str], logged_msg_ids: Set[str]
+    ) -> bool:
+        '''
+        Appends msg_ids as a single checksummed record, so the whole append
+        is either fully on disk or discarded as corrupted on the next read.
+
+        Duplicates are detected with logged_msg_ids (the in memory index of the
+        file), if any of the msg_ids is already there nothing is written.
+
+        Returns if a duplicate was found
+        '''
+        for msg_id in msg_ids:
+            if msg_id in logged_msg_ids:
+                logging.debug(f'Found duplicate, discarding: {msg_ids}')
+                return True
 
         os.makedirs(directory, exist_ok=True)
-        create_file_if_unexistent(file_path)
-        found_duplicate = False
-        with open(file_path, 'r') as original, open(temp_file_path, 'w') as temp: 
-            for line in original: 
-                line = line.strip()
-                for msg_id in msg_ids:
-                    if line == msg_id:
-                        found_duplicate = True
-                        logging.debug(f'Found duplicate, discarding: {msg_ids}')
-                        break
-                if found_duplicate: break
-                temp.write(line + '\n')
-
-            for msg_id in msg_ids:
-                temp.write(msg_id + '\n')
-
-        if found_duplicate:
-            os.remove(temp_file_path)
-        else:
-            os.replace(temp_file_path, file_path)
-
-        return found_duplicate #To indicate if duplicate was found or not for duplicate detection for END
+        file_path = os.path.join(directory, file_name)
+        with open(file_path, 'ab') as log:
+            log.write(self.__encode_for_general_log(msg_ids))
+
+        logged_msg_ids.update(msg_ids)
+        self.__fsync_if_needed(file_path)
+
+        return False #To indicate if duplicate was found or not for duplicate detection for END
+
+    def __fsync_if_needed(self, file_path: str):
+        if self._appends_per_fsync <= 0:
+            return
+
+        self._files_pending_fsync.add(file_path)
+        self._appends_since_fsync += 1
+        if self._appends_since_fsync >= self._appends_per_fsync:
+            self.sync()
+
+    def sync(self):
+        '''
+        Forces every msg_id appended since the last fsync to disk
+        '''
+        for file_path in self._files_pending_fsync:
+            if not os.path.exists(file_path):
+                # Client logs were removed in the meantime
+                continue
+
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        self._files_pending_fsync = set()
+        self._appends_since_fsync = 0
+
+    def __read_msg_ids_file(self, file_path: str) -> List[str]:
+        '''
+        Returns every msg_id stored on an append only msg_ids file.
+
+        Only the last record can be corrupted (the process died mid append),
+        in that case it's truncated so next appends start on a valid offset.
+        '''
+        if not os.path.exists(file_path):
+            return []
+
+        with open(file_path, 'rb') as log:
+            data = log.read()
+
+        msg_ids = []
+        offset = 0
+        while offset < len(data):
+            try:
+                record, bytes_read = self.__decode_record(data, offset)
+            except ActivityLogError as e:
+                logging.debug(f'Discarding corrupted record at the end of {file_path}: {e}')
+                with open(file_path, 'r+b') as log:
+                    log.truncate(offset)
+                break
+
+            msg_ids.extend(record)
+            offset += bytes_read
+
+        return msg_ids
 
     def _get_file_name_for_middleware_queue(self, queue_name: str) -> str: 
         return f'{queue_name}.bin'
@@ -188,6 +270,38 @@ class ActivityLog:
         return (result, CHECKSUM_LENGTH_BYTES + checksum)
 
 
+    def __decode_record(self, data: bytes, offset: int) -> Tuple[List[str], int]:
+        '''
+        Same as __decode_general_log_line but reads the record starting at offset
+        without copying the rest of data. Returns the record and the amount of
+        bytes read.
+        '''
+        record_start = offset + CHECKSUM_LENGTH_BYTES
+        if record_start > len(data):
+            raise ActivityLogError((
+                f'Invalid checksum length, should be {CHECKSUM_LENGTH_BYTES}, '
+                f'but was {len(data) - offset}'
+            ))
+
+        checksum = int.from_bytes(data[offset:record_start], byteorder='big')
+        record_end = record_start + checksum
+        if record_end > len(data):
+            raise ActivityLogError('Checksum does not match')
+
+        result = []
+        position = record_start
+        while position < record_end:
+            field_start = position + FIELD_LENGTH_BYTES
+            field_length = int.from_bytes(data[position:field_start], "big", signed=False)
+            position = field_start + field_length
+            if position > record_end:
+                raise ActivityLogError('Field length exceeds record length')
+
+            result.append(data[field_start:position].decode("utf-8"))
+
+        return (result, CHECKSUM_LENGTH_BYTES + checksum)
+
+
     '''
     GENERAL LOGGING
     '''
@@ -206,6 +320,9 @@ class ActivityLog:
 
 
     def _log_to_processed_lines(self, client_id: str, msg_ids: List[str]): 
+        # Se carga el indice antes de escribir, asi queda consistente con disco
+        processed_msg_ids = self.__get_processed_msg_ids(client_id)
+
         msg_ids_by_file = self.__get_msg_ids_by_file(msg_ids)
         # {
         #   'procesed_lines_75290.csv': ['1', '2', '3', ...], 
@@ -214,7 +331,7 @@ class ActivityLog:
         client_dir = os.path.join(self._dir, client_id)
         os.makedirs(client_dir, exist_ok=True)
         for file_name, msg_ids in msg_ids_by_file.items():
-            self.__append_msg_ids(client_dir, file_name, msg_ids)
+            self.__append_msg_ids(client_dir, file_name, msg_ids, processed_msg_ids)
 
 
     def _log_to_general_log(self, client_id: str, data: List[str], msg_ids: List[str]):
@@ -263,7 +380,12 @@ class ActivityLog:
 
         client_dir = os.path.join(self._dir, client_id)
         file_name = self._get_ends_file_name(end_logging)
-        end_was_duplicate = self.__append_msg_ids(client_dir, file_name, [msg_id])
+        end_was_duplicate = self.__append_msg_ids(
+            client_dir, 
+            file_name, 
+            [msg_id], 
+            self.__get_logged_ends(client_id, end_logging),
+        )
 
         return end_was_duplicate
 
@@ -300,16 +422,15 @@ class ActivityLog:
         '''
         Returns the raw amount of ends read for certain type of end
         '''
-        full_path = os.path.join(self._dir, client_id, self._get_ends_file_name(end_logging))
-        os.makedirs(os.path.join(self._dir, client_id), exist_ok=True) 
-        create_file_if_unexistent(full_path)
+        return len(self.__get_logged_ends(client_id, end_logging))
 
-        amount = 0
-        with open(full_path, 'r') as ends:
-            for _ in ends:
-                amount += 1
+    def __get_logged_ends(self, client_id: str, end_logging: str = '') -> Set[str]:
+        key = (client_id, str(end_logging))
+        if not key in self._logged_ends:
+            full_path = os.path.join(self._dir, client_id, self._get_ends_file_name(end_logging))
+            self._logged_ends[key] = set(self.__read_msg_ids_file(full_path))
 
-        return amount
+        return self._logged_ends[key]
 
     def read_general_log(self):
         '''
@@ -339,6 +460,10 @@ class ActivityLog:
         if Path(client_folder_full_path).exists():
             shutil.rmtree(client_folder_full_path)
 
+        self._processed_msg_ids.pop(client_id, None)
+        for key in [key for key in self._logged_ends if key[0] == client_id]:
+            del self._logged_ends[key]
+
     def remove_all_logs(self):
         '''
         Removes every client log, the general log
@@ -347,6 +472,9 @@ class ActivityLog:
         if Path(self._dir).exists():
             shutil.rmtree(self._dir)
 
+        self._processed_msg_ids = {}
+        self._logged_ends = {}
+
     def remove_queue_state(self, queue_name: str):
         file_path = os.path.join(
             self._middleware_dir, 
@@ -357,25 +485,43 @@ class ActivityLog:
     '''
     DUPLICATE FILTER
     '''
-    # TODO: Por ahi se puede recibir un grupo de msg_ids, agruparlos por archivo y buscar 
-    # de a grupos para no abrir y cerrar un archivo tantas veces
+    def __load_processed_msg_ids(self, client_id: str) -> Set[str]:
+        '''
+        Rebuilds the set of processed msg_ids of a client from
+        every procesed_lines file on its log folder
+        '''
+        client_dir = os.path.join(self._dir, client_id)
+        processed_msg_ids = set()
+        if not os.path.isdir(client_dir):
+            return processed_msg_ids
+
+        for file_name in os.listdir(client_dir):
+            if not file_name.startswith(self._procesed_lines_file_prefix):
+                continue
+
+            processed_msg_ids.update(
+                self.__read_msg_ids_file(os.path.join(client_dir, file_name))
+            )
+
+        return processed_msg_ids
+
+    def __get_processed_msg_ids(self, client_id: str) -> Set[str]:
+        if not client_id in self._processed_msg_ids:
+            self._processed_msg_ids[client_id] = self.__load_processed_msg_ids(client_id)
+
+        return self._processed_msg_ids[client_id]
+
     def is_msg_id_already_processed(self, client_id: str, msg_id: str) -> bool:
-        full_path = os.path.join(
-            self._dir,
-            client_id, 
-            self._get_partition_file_name(int(msg_id))
-        )
+        return msg_id in self.__get_processed_msg_ids(client_id)
 
-        if not os.path.exists(full_path):
-            return False 
-        
-        with open(full_path, 'r') as log:
-            for line in log:
-                line = line.strip()
-                if line == msg_id:
-                    return True
-                
-        return False 
+    def filter_already_processed(self, client_id: str, msg_ids: Iterable[str]) -> Set[str]:
+        '''
+        Returns the subset of msg_ids that were already processed for
+        the given client
+        '''
+        processed_msg_ids = self.__get_processed_msg_ids(client_id)
+
+        return {msg_id for msg_id in msg_ids if msg_id in processed_msg_ids}
     
     '''
     RECOVERY
@@ -470,8 +616,9 @@ class ActivityLog:
                     # idem checkeo anterior
                     continue
                 
-                batch, count = result.get(queue_name, (b'', 0))
-                result[queue_name] = (batch + msg, count + 1)
+                batch, count = result.get(queue_name, (bytearray(), 0))
+                batch += msg
+                result[queue_name] = (batch, count + 1)
 
         return result
     
@@ -8,6 +8,7 @@ sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 from pathlib import Path
 import unittest
 from activity_log.activity_log import ActivityLog
+from utils.utils import derive_msg_id
 from typing import *
 from .constants import *
 
@@ -97,13 +98,120 @@ class ActivityLogTests(unittest.TestCase):
         file_name = self._activity_log._get_partition_file_name(int(msg_id[0]))
         path = os.path.join(self._dir, client_id, file_name)
 
-        with open(path, "r") as log:
-            count = 0
-            for line in log:
-                self.assertEqual(line.strip(), msg_id[0])
-                count += 1
+        records = self.read_msg_ids_records(path)
 
-            self.assertEqual(count, 1)
+        self.assertEqual(records, [[msg_id[0]]])
+
+    def test_04_can_filter_already_processed_msg_ids_in_batch(self):
+        client_id = "1"
+        self._activity_log._log_to_processed_lines(client_id, ["2", "45", "1040"])
+
+        already_processed = self._activity_log.filter_already_processed(
+            client_id, ["1", "2", "45", "46", "1040"]
+        )
+
+        self.assertEqual(already_processed, {"2", "45", "1040"})
+        self.assertEqual(
+            self._activity_log.filter_already_processed("2", ["2", "45"]), set()
+        )
+
+    def test_05_processed_lines_index_is_rebuilt_from_disk(self):
+        client_id = "1"
+        msg_ids = ["2", "45", "1040"]
+        self._activity_log._log_to_processed_lines(client_id, msg_ids)
+
+        # Simulates a restart
+        self._activity_log = ActivityLog()
+
+        for msg_id in msg_ids:
+            self.assertEqual(
+                self._activity_log.is_msg_id_already_processed(client_id, msg_id), True
+            )
+        self.assertEqual(
+            self._activity_log.is_msg_id_already_processed(client_id, "3"), False
+        )
+
+    def test_06_processed_lines_index_is_cleared_with_client_logs(self):
+        client_id = "1"
+        self._activity_log._log_to_processed_lines(client_id, ["2"])
+
+        self._activity_log.remove_client_logs(client_id)
+
+        self.assertEqual(
+            self._activity_log.is_msg_id_already_processed(client_id, "2"), False
+        )
+
+    def test_07_corrupted_last_record_is_discarded_and_truncated(self):
+        client_id = "1"
+        self._activity_log._log_to_processed_lines(client_id, ["2", "3"])
+
+        file_name = self._activity_log._get_partition_file_name(2)
+        path = os.path.join(self._dir, client_id, file_name)
+        with open(path, "ab") as log:
+            # Died in the middle of an append: length says 20 bytes, only 3 were written
+            log.write((20).to_bytes(CHECKSUM_LENGTH_BYTES, "big") + b"\x00\x00\x00")
+
+        # Simulates a restart
+        self._activity_log = ActivityLog()
+
+        self.assertEqual(
+            self._activity_log.filter_already_processed(client_id, ["2", "3", "4"]),
+            {"2", "3"},
+        )
+
+        self._activity_log._log_to_processed_lines(client_id, ["4"])
+        self.assertEqual(self.read_msg_ids_records(path), [["2", "3"], ["4"]])
+
+    def test_08_appends_are_grouped_for_fsync(self):
+        client_id = "1"
+        self._activity_log = ActivityLog(appends_per_fsync=3)
+
+        self._activity_log._log_to_processed_lines(client_id, ["1"])
+        self._activity_log._log_to_processed_lines(client_id, ["2"])
+        self.assertEqual(len(self._activity_log._files_pending_fsync), 1)
+
+        self._activity_log._log_to_processed_lines(client_id, ["45"])
+        self.assertEqual(len(self._activity_log._files_pending_fsync), 0)
+
+    def test_09_folded_partition_files_filter_derived_msg_ids(self):
+        client_id = "1"
+        self._activity_log = ActivityLog(max_partitions=4)
+        # Ids derivados (ver utils.derive_msg_id) de los tres rangos, dispersos
+        derived = [derive_msg_id(str(game), str(review)) for game in range(5) for review in range(5)]
+        derived += [derive_msg_id(str(1 << 40), str(i)) for i in range(5)]
+        derived += [derive_msg_id(str(1 << 70), str(i)) for i in range(5)]
+        logged, not_logged = derived[::2], derived[1::2]
+
+        self._activity_log._log_to_processed_lines(client_id, logged)
+
+        client_dir = os.path.join(self._dir, client_id)
+        self.assertLessEqual(len(os.listdir(client_dir)), 4)
+        # Se relee desde disco, varios ids comparten archivo
+        reloaded = ActivityLog(max_partitions=4)
+        self.assertEqual(reloaded.filter_already_processed(client_id, derived), set(logged))
+        self.assertEqual(reloaded.filter_already_processed(client_id, not_logged), set())
+
+    def read_msg_ids_records(self, path: str) -> List[List[str]]:
+        with open(path, "rb") as log:
+            data = log.read()
+
+        records = []
+        while len(data) > 0:
+            checksum = int.from_bytes(data[:CHECKSUM_LENGTH_BYTES], "big", signed=False)
+            record = data[CHECKSUM_LENGTH_BYTES : CHECKSUM_LENGTH_BYTES + checksum]
+            data = data[CHECKSUM_LENGTH_BYTES + checksum :]
+
+            fields = []
+            while len(record) > 0:
+                field_length = int.from_bytes(record[:FIELD_LENGTH_BYTES], "big")
+                fields.append(
+                    record[FIELD_LENGTH_BYTES : FIELD_LENGTH_BYTES + field_length].decode()
+                )
+                record = record[FIELD_LENGTH_BYTES + field_length :]
+
+            records.append(fields)
+
+        return records
 
     """
     GENERAL LOG TESTS
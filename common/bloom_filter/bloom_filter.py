@@ -0,0 +1,63 @@
+import base64
+import hashlib
+import math
+from typing import *
+
+
+class BloomFilter:
+    """
+    Bloom filter over strings with double hashing (a single blake2b digest
+    per key). It can say that a key is not there with certainty, a positive
+    may be a false positive.
+    """
+
+    def __init__(self, amount_of_bits: int, amount_of_hashes: int, bits: bytearray = None):
+        self._amount_of_bits = amount_of_bits
+        self._amount_of_hashes = amount_of_hashes
+        self._bits = bits if bits is not None else bytearray((amount_of_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, expected_items: int, false_positive_rate: float) -> "BloomFilter":
+        expected_items = max(expected_items, 1)
+        amount_of_bits = math.ceil(
+            -expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)
+        )
+        amount_of_hashes = max(1, round(amount_of_bits / expected_items * math.log(2)))
+
+        return cls(amount_of_bits, amount_of_hashes)
+
+    @staticmethod
+    def hash_key(key: str) -> Tuple[int, int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        # El segundo hash tiene que ser impar para recorrer todas las posiciones
+        return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+
+    def __positions(self, key_hash: Tuple[int, int]) -> Iterator[int]:
+        first_hash, second_hash = key_hash
+        for i in range(self._amount_of_hashes):
+            yield (first_hash + i * second_hash) % self._amount_of_bits
+
+    def add(self, key: str):
+        for position in self.__positions(BloomFilter.hash_key(key)):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def contains_hash(self, key_hash: Tuple[int, int]) -> bool:
+        for position in self.__positions(key_hash):
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                return False
+
+        return True
+
+    def __contains__(self, key: str) -> bool:
+        return self.contains_hash(BloomFilter.hash_key(key))
+
+    def encode(self) -> str:
+        bits = base64.b64encode(bytes(self._bits)).decode("ascii")
+        return f"{self._amount_of_bits}:{self._amount_of_hashes}:{bits}"
+
+    @classmethod
+    def decode(cls, data: str) -> "BloomFilter":
+        amount_of_bits, amount_of_hashes, bits = data.split(":", 2)
+        return cls(
+            int(amount_of_bits), int(amount_of_hashes), bytearray(base64.b64decode(bits))
+        )
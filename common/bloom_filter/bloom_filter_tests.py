@@ -0,0 +1,42 @@
+import unittest
+
+from common.bloom_filter.bloom_filter import BloomFilter
+
+
+class BloomFilterTests(unittest.TestCase):
+    def test_01_added_keys_are_always_found(self):
+        bloom_filter = BloomFilter.for_capacity(1000, 0.01)
+        keys = [str(app_id) for app_id in range(0, 3000, 3)]
+        for key in keys:
+            bloom_filter.add(key)
+
+        self.assertTrue(all(key in bloom_filter for key in keys))
+
+    def test_02_false_positive_rate_is_close_to_the_configured_one(self):
+        bloom_filter = BloomFilter.for_capacity(1000, 0.01)
+        for app_id in range(1000):
+            bloom_filter.add(str(app_id))
+
+        false_positives = sum(
+            str(app_id) in bloom_filter for app_id in range(1000, 11000)
+        )
+        self.assertLess(false_positives, 300)
+
+    def test_03_empty_filter_contains_nothing(self):
+        bloom_filter = BloomFilter.for_capacity(0, 0.01)
+
+        self.assertNotIn("10", bloom_filter)
+
+    def test_04_filter_survives_encoding(self):
+        bloom_filter = BloomFilter.for_capacity(100, 0.01)
+        for app_id in ["10", "20", "730"]:
+            bloom_filter.add(app_id)
+
+        decoded = BloomFilter.decode(bloom_filter.encode())
+
+        self.assertTrue(all(app_id in decoded for app_id in ["10", "20", "730"]))
+        self.assertEqual(decoded.encode(), bloom_filter.encode())
+
+
+if __name__ == "__main__":
+    unittest.main()
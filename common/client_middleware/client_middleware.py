@@ -200,19 +200,12 @@ class ClientMiddleware:
         self.__context.term()
 
     def get_last_message_id(self, batch: bytes) -> int:
-        rows_left = batch
         last_row = None
         # get last batch
-        while True:
-            row, row_length = self.__protocol.get_first_row(rows_left)
-
-            rows_left = rows_left[row_length:]
-
-            if rows_left == b"":
-                last_row = row
-                break
+        for row in self.__protocol.iter_rows(batch):
+            last_row = row
         # get first field from last batch
-        return int(self.__protocol.get_row_field(field=0, encoded_row=last_row))
+        return int(self.__protocol.get_field(last_row, 0))
 
     def get_row_from_message(self, message: bytes) -> list[str]:
         return self.__protocol.decode(message)
@@ -0,0 +1,114 @@
+from typing import *
+
+# Rows are [CLIENT_ID, MSG_ID, KEY, ...]
+CLIENT_ID_INDEX = 0
+MSG_ID_INDEX = 1
+KEY_INDEX = 2
+
+RANGE_SEPARATOR = "-"
+TOKEN_SEPARATOR = ";"
+
+
+def encode_msg_id_ranges(msg_ids: Iterable[str]) -> str:
+    """
+    Compacts msg_ids into sorted ranges, e.g. ['5', '1', '2', '3', '8'] -> '1-3;5;8'.
+    A single msg_id is encoded as itself, so a regular row is also a
+    combined row of one msg_id.
+    """
+    numeric_msg_ids = set()
+    tokens = []
+    for msg_id in msg_ids:
+        if msg_id.isdigit():
+            numeric_msg_ids.add(int(msg_id))
+        else:
+            tokens.append(msg_id)
+
+    range_start = None
+    previous = None
+    for msg_id in sorted(numeric_msg_ids):
+        if range_start is None:
+            range_start = msg_id
+        elif msg_id != previous + 1:
+            tokens.append(_encode_range(range_start, previous))
+            range_start = msg_id
+        previous = msg_id
+
+    if range_start is not None:
+        tokens.append(_encode_range(range_start, previous))
+
+    return TOKEN_SEPARATOR.join(tokens)
+
+
+def _encode_range(start: int, end: int) -> str:
+    if start == end:
+        return str(start)
+
+    return f"{start}{RANGE_SEPARATOR}{end}"
+
+
+def expand_msg_ids(msg_id_field: str) -> List[str]:
+    """
+    Inverse of encode_msg_id_ranges, '1-3;5' -> ['1', '2', '3', '5']
+    """
+    msg_ids = []
+    for token in msg_id_field.split(TOKEN_SEPARATOR):
+        start, separator, end = token.partition(RANGE_SEPARATOR)
+        if separator and start.isdigit() and end.isdigit():
+            msg_ids.extend(str(msg_id) for msg_id in range(int(start), int(end) + 1))
+        else:
+            msg_ids.append(token)
+
+    return msg_ids
+
+
+def expand_combined_rows(rows: List[List[str]]) -> List[List[str]]:
+    """
+    Returns one [CLIENT_ID, MSG_ID, KEY] row per msg_id of every (combined or
+    regular) row, so duplicates can still be filtered msg_id by msg_id
+    """
+    expanded_rows = []
+    for row in rows:
+        msg_id_field = row[MSG_ID_INDEX]
+        if TOKEN_SEPARATOR not in msg_id_field and RANGE_SEPARATOR not in msg_id_field:
+            expanded_rows.append(row)
+            continue
+
+        client_id = row[CLIENT_ID_INDEX]
+        key = row[KEY_INDEX]
+        for msg_id in expand_msg_ids(msg_id_field):
+            expanded_rows.append([client_id, msg_id, key])
+
+    return expanded_rows
+
+
+class Combiner:
+    """
+    Partial aggregation of the rows going to a counter: the rows of a batch
+    with the same (CLIENT_ID, KEY) and queue are sent as a single
+    [CLIENT_ID, MSG_ID_RANGES, KEY] row. Only those three fields are kept.
+    """
+
+    def __init__(self):
+        # queue_name -> (client_id, key) -> [msg_id, ...]
+        self._msg_ids_per_queue: Dict[str, Dict[Tuple[str, str], List[str]]] = {}
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def add(self, row: List[str], queue_name: str):
+        msg_ids_per_key = self._msg_ids_per_queue.setdefault(queue_name, {})
+        msg_ids_per_key.setdefault(
+            (row[CLIENT_ID_INDEX], row[KEY_INDEX]), []
+        ).append(row[MSG_ID_INDEX])
+        self.rows_in += 1
+
+    def drain(self) -> Iterator[Tuple[List[str], str]]:
+        """
+        Yields (combined_row, queue_name) for everything added since the last drain
+        """
+        msg_ids_per_queue = self._msg_ids_per_queue
+        self._msg_ids_per_queue = {}
+
+        for queue_name, msg_ids_per_key in msg_ids_per_queue.items():
+            for (client_id, key), msg_ids in msg_ids_per_key.items():
+                self.rows_out += 1
+                yield [client_id, encode_msg_id_ranges(msg_ids), key], queue_name
@@ -0,0 +1,60 @@
+import unittest
+
+from common.combiner.combiner import (
+    Combiner,
+    encode_msg_id_ranges,
+    expand_combined_rows,
+    expand_msg_ids,
+)
+
+
+class CombinerTests(unittest.TestCase):
+    def test_01_contiguous_msg_ids_are_encoded_as_ranges(self):
+        self.assertEqual(encode_msg_id_ranges(["5", "1", "2", "3", "8", "9"]), "1-3;5;8-9")
+
+    def test_02_single_msg_id_is_encoded_as_itself(self):
+        self.assertEqual(encode_msg_id_ranges(["42"]), "42")
+        self.assertEqual(expand_msg_ids("42"), ["42"])
+
+    def test_03_ranges_are_expanded_back(self):
+        msg_ids = ["10", "11", "12", "20", "7"]
+
+        self.assertEqual(
+            sorted(expand_msg_ids(encode_msg_id_ranges(msg_ids)), key=int),
+            sorted(msg_ids, key=int),
+        )
+
+    def test_04_rows_are_combined_per_queue_client_and_key(self):
+        combiner = Combiner()
+        combiner.add(["c1", "1", "730", "text"], "0_counter")
+        combiner.add(["c1", "2", "730", "text"], "0_counter")
+        combiner.add(["c2", "3", "730", "text"], "0_counter")
+        combiner.add(["c1", "4", "570", "text"], "1_counter")
+
+        self.assertEqual(
+            sorted(combiner.drain()),
+            [
+                (["c1", "1-2", "730"], "0_counter"),
+                (["c1", "4", "570"], "1_counter"),
+                (["c2", "3", "730"], "0_counter"),
+            ],
+        )
+        self.assertEqual(list(combiner.drain()), [])
+        self.assertEqual((combiner.rows_in, combiner.rows_out), (4, 3))
+
+    def test_05_combined_and_regular_rows_are_expanded(self):
+        rows = [["c1", "1-3", "730"], ["c1", "7", "570"]]
+
+        self.assertEqual(
+            expand_combined_rows(rows),
+            [
+                ["c1", "1", "730"],
+                ["c1", "2", "730"],
+                ["c1", "3", "730"],
+                ["c1", "7", "570"],
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
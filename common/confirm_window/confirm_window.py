@@ -0,0 +1,96 @@
+from collections import deque
+from itertools import chain
+from typing import *
+
+# (origin_seq, exchange, routing_key, body)
+Publish = Tuple[int, str, str, bytes]
+
+
+class ConfirmWindow:
+    """
+    Bookkeeping of the publisher confirms of a channel, without I/O.
+
+    Every publish gets the next seq (the delivery tag the broker confirms it
+    with). A delivery is only acked once every publish made before ack() was
+    called for it has been confirmed. Nacked publishes are kept to be
+    republished; their new seqs keep the origin_seq of the first attempt, so
+    the deliveries that were waiting for them keep waiting.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        # seq -> (origin_seq, exchange, routing_key, body)
+        self._unconfirmed: Dict[int, Publish] = {}
+        self._nacked: List[Publish] = []
+        self._seq = 0
+        # (delivery_tag, last seq published before acking it)
+        self._pending_acks: Deque[Tuple[int, int]] = deque()
+
+    def published(
+        self,
+        exchange: str,
+        routing_key: str,
+        body: bytes,
+        origin_seq: Optional[int] = None,
+    ) -> int:
+        self._seq += 1
+        self._unconfirmed[self._seq] = (
+            origin_seq or self._seq,
+            exchange,
+            routing_key,
+            body,
+        )
+        return self._seq
+
+    def is_full(self) -> bool:
+        return len(self._unconfirmed) >= self._size
+
+    def confirm(self, delivery_tag: int, multiple: bool, nacked: bool) -> int:
+        """
+        Returns how many publishes were nacked by this confirm
+        """
+        if multiple:
+            confirmed = [seq for seq in self._unconfirmed if seq <= delivery_tag]
+        else:
+            confirmed = [delivery_tag]
+
+        amount_nacked = 0
+        for seq in confirmed:
+            publish = self._unconfirmed.pop(seq, None)
+            if publish and nacked:
+                self._nacked.append(publish)
+                amount_nacked += 1
+
+        return amount_nacked
+
+    def take_nacked(self) -> List[Publish]:
+        nacked, self._nacked = self._nacked, []
+        return nacked
+
+    def add_pending_ack(self, delivery_tag: int):
+        self._pending_acks.append((delivery_tag, self._seq))
+
+    def has_pending_work(self) -> bool:
+        return bool(self._pending_acks or self._nacked)
+
+    def take_releasable_acks(self) -> List[int]:
+        """
+        Delivery tags (in order) whose publishes were all confirmed
+        """
+        # Nacked publishes not republished yet are still unconfirmed
+        oldest_unconfirmed = min(
+            (
+                origin_seq
+                for origin_seq, *_ in chain(self._unconfirmed.values(), self._nacked)
+            ),
+            default=None,
+        )
+
+        releasable = []
+        while self._pending_acks and (
+            oldest_unconfirmed is None or self._pending_acks[0][1] < oldest_unconfirmed
+        ):
+            delivery_tag, _ = self._pending_acks.popleft()
+            releasable.append(delivery_tag)
+
+        return releasable
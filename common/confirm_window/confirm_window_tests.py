@@ -0,0 +1,78 @@
+import unittest
+
+from common.confirm_window.confirm_window import ConfirmWindow
+
+
+class ConfirmWindowTests(unittest.TestCase):
+    def test_01_window_is_full_until_a_confirm_arrives(self):
+        window = ConfirmWindow(2)
+        window.published("", "q", b"1")
+        self.assertFalse(window.is_full())
+        window.published("", "q", b"2")
+        self.assertTrue(window.is_full())
+
+        window.confirm(1, multiple=False, nacked=False)
+        self.assertFalse(window.is_full())
+
+    def test_02_acks_wait_for_the_publishes_made_before_them(self):
+        window = ConfirmWindow(10)
+        window.published("", "q", b"1")
+        window.add_pending_ack(100)
+        window.published("", "q", b"2")
+        window.add_pending_ack(101)
+
+        self.assertEqual(window.take_releasable_acks(), [])
+        window.confirm(2, multiple=False, nacked=False)
+        # 101 is behind 100, which is still waiting for publish 1
+        self.assertEqual(window.take_releasable_acks(), [])
+        window.confirm(1, multiple=False, nacked=False)
+        self.assertEqual(window.take_releasable_acks(), [100, 101])
+
+    def test_03_multiple_confirms_every_seq_up_to_the_tag(self):
+        window = ConfirmWindow(10)
+        for body in [b"1", b"2", b"3"]:
+            window.published("", "q", body)
+        window.add_pending_ack(7)
+
+        window.confirm(2, multiple=True, nacked=False)
+        self.assertEqual(window.take_releasable_acks(), [])
+        window.confirm(3, multiple=True, nacked=False)
+        self.assertEqual(window.take_releasable_acks(), [7])
+
+    def test_04_nacked_publishes_hold_the_acks_until_republished_and_confirmed(self):
+        window = ConfirmWindow(10)
+        window.published("", "q", b"1")
+        window.published("ex", "q", b"2")
+        window.add_pending_ack(5)
+
+        self.assertEqual(window.confirm(2, multiple=True, nacked=True), 2)
+        self.assertFalse(window.is_full())
+        self.assertTrue(window.has_pending_work())
+        self.assertEqual(window.take_releasable_acks(), [])
+
+        nacked = window.take_nacked()
+        self.assertEqual(nacked, [(1, "", "q", b"1"), (2, "ex", "q", b"2")])
+        for origin_seq, exchange, routing_key, body in nacked:
+            window.published(exchange, routing_key, body, origin_seq=origin_seq)
+
+        window.confirm(3, multiple=False, nacked=False)
+        self.assertEqual(window.take_releasable_acks(), [])
+        window.confirm(4, multiple=False, nacked=False)
+        self.assertEqual(window.take_releasable_acks(), [5])
+        self.assertFalse(window.has_pending_work())
+
+    def test_05_acks_after_a_republish_only_wait_for_their_own_publishes(self):
+        window = ConfirmWindow(10)
+        window.published("", "q", b"1")
+        window.add_pending_ack(5)
+        window.confirm(1, multiple=False, nacked=False)
+        window.published("", "q", b"2")
+        window.add_pending_ack(6)
+
+        self.assertEqual(window.take_releasable_acks(), [5])
+        window.confirm(2, multiple=False, nacked=False)
+        self.assertEqual(window.take_releasable_acks(), [6])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,385 @@
+import csv
+import os
+import shutil
+import logging
+from typing import *
+
+from common.activity_log.activity_log import ActivityLog
+from common.protocol.protocol import Protocol
+from utils.utils import group_msg_ids_per_client_by_field
+
+CHECKPOINT_FILE_PREFIX = "checkpoint"
+SPILL_DIR_PREFIX = "spill"
+TEMP_SUFFIX = ".tmp"
+
+PARTITION_FILE_PREFIX = "partition"
+NOT_PARTITIONED_FILE_NAME = "platform_count.csv"
+
+LENGTH_BYTES = 4
+
+FIRST_MSG_ID = 0
+COUNT = 1
+
+
+class CounterStore:
+    """
+    In memory counter per client: {client_id: {key: [first_msg_id, count]}}.
+
+    Each batch is absorbed in O(batch):
+        1) It's logged through the activity log (general log + processed lines)
+        2) The delta is appended to the client checkpoint (checkpoint_<generation>.bin)
+        3) It's applied in memory
+
+    When the amount of keys in memory exceeds max_keys_in_memory, the biggest
+    client is spilled to spill_<generation>/ (same csv format as the partition files)
+    and a new checkpoint generation is started. Results are only materialized
+    when they are read (at END).
+    """
+
+    def __init__(
+        self,
+        storage_dir: str,
+        activity_log: ActivityLog,
+        range_for_partition: int = -1,
+        max_keys_in_memory: int = 100000,
+    ):
+        self._storage_dir = storage_dir
+        self._activity_log = activity_log
+        self._range_for_partition = range_for_partition
+        self._max_keys_in_memory = max_keys_in_memory
+
+        self._counts: Dict[str, Dict[str, List]] = {}
+        self._generations: Dict[str, int] = {}
+        self._keys_in_memory = 0
+
+    """
+    FILES
+    """
+
+    def _client_dir(self, client_id: str) -> str:
+        return os.path.join(self._storage_dir, client_id)
+
+    def _checkpoint_path(self, client_id: str, generation: int) -> str:
+        return os.path.join(
+            self._client_dir(client_id), f"{CHECKPOINT_FILE_PREFIX}_{generation}.bin"
+        )
+
+    def _spill_dir(self, client_id: str, generation: int) -> str:
+        return os.path.join(
+            self._client_dir(client_id), f"{SPILL_DIR_PREFIX}_{generation}"
+        )
+
+    def _file_name_for_key(self, key: str) -> str:
+        if self._range_for_partition == -1:
+            return NOT_PARTITIONED_FILE_NAME
+
+        return f"{PARTITION_FILE_PREFIX}_{int(key)//self._range_for_partition}.csv"
+
+    @staticmethod
+    def _get_generation(name: str) -> int:
+        # checkpoint_3.bin -> 3, spill_3 -> 3
+        return int(name.split(".")[0].rsplit("_", maxsplit=1)[1])
+
+    def _get_spilled_generations(self, client_id: str) -> List[int]:
+        client_dir = self._client_dir(client_id)
+        if not os.path.isdir(client_dir):
+            return []
+
+        return sorted(
+            self._get_generation(name)
+            for name in os.listdir(client_dir)
+            if name.startswith(SPILL_DIR_PREFIX) and not name.endswith(TEMP_SUFFIX)
+        )
+
+    """
+    CHECKPOINT
+    """
+
+    @staticmethod
+    def _encode_delta(marker: str, delta: Dict[str, List]) -> List[str]:
+        # [marker, key1, first_msg_id1, count1, key2, ...]
+        fields = [marker]
+        for key, (first_msg_id, count) in delta.items():
+            fields += [key, first_msg_id, str(count)]
+
+        return fields
+
+    @staticmethod
+    def _decode_delta(fields: List[str]) -> Tuple[str, Dict[str, List]]:
+        marker = fields[0]
+        delta = {}
+        for i in range(1, len(fields), 3):
+            delta[fields[i]] = [fields[i + 1], int(fields[i + 2])]
+
+        return marker, delta
+
+    def _append_to_checkpoint(self, checkpoint_path: str, fields: List[str]):
+        with open(checkpoint_path, "ab") as checkpoint:
+            checkpoint.write(Protocol.encode(fields, add_checksum=True))
+
+    def _read_checkpoint(self, checkpoint_path: str) -> List[List[str]]:
+        """
+        Returns every record of the checkpoint. Only the last one can be
+        corrupted (died mid append), if so it's truncated.
+        """
+        with open(checkpoint_path, "rb") as checkpoint:
+            data = checkpoint.read()
+
+        records = []
+        offset = 0
+        while offset < len(data):
+            record_start = offset + LENGTH_BYTES
+            record_end = record_start + int.from_bytes(
+                data[offset:record_start], "big", signed=False
+            )
+            if record_start > len(data) or record_end > len(data):
+                logging.debug(f"Discarding corrupted record of {checkpoint_path}")
+                with open(checkpoint_path, "r+b") as checkpoint:
+                    checkpoint.truncate(offset)
+                break
+
+            records.append(Protocol.decode(data[record_start:record_end]))
+            offset = record_end
+
+        return records
+
+    """
+    MEMORY
+    """
+
+    def _apply_delta(self, client_id: str, delta: Dict[str, List]):
+        counts = self._counts.setdefault(client_id, {})
+        for key, (first_msg_id, count) in delta.items():
+            if key in counts:
+                counts[key][COUNT] += count
+            else:
+                counts[key] = [first_msg_id, count]
+                self._keys_in_memory += 1
+
+    def add_batch_per_client(self, batch: List[List[str]]):
+        """
+        Batch needs to have the following format:
+
+            [[CLIENT_ID, MSG_ID, KEY], ...]
+
+        Duplicates need to be filtered beforehand.
+        """
+        CLIENT_ID_INDEX = 0
+        MSG_ID_INDEX = 1
+        FIELD_TO_COUNT_BY = 2
+
+        msg_ids_per_record_by_client_id = group_msg_ids_per_client_by_field(
+            batch,
+            CLIENT_ID_INDEX,
+            MSG_ID_INDEX,
+            FIELD_TO_COUNT_BY,
+        )
+        for client_id, new_records in msg_ids_per_record_by_client_id.items():
+            self.add_batch(client_id, new_records)
+
+        if self._keys_in_memory > self._max_keys_in_memory:
+            biggest_client = max(self._counts, key=lambda c: len(self._counts[c]))
+            self.spill(biggest_client)
+
+    def add_batch(self, client_id: str, new_records: Dict[str, List[str]]):
+        """
+        new_records: {key: [msg_id1, msg_id2, ...]}
+        """
+        if not new_records:
+            return
+
+        delta = {}
+        used_msg_ids = []
+        for key, msg_ids in new_records.items():
+            delta[key] = [msg_ids[0], len(msg_ids)]
+            used_msg_ids.extend(msg_ids)
+
+        os.makedirs(self._client_dir(client_id), exist_ok=True)
+        generation = self._generations.setdefault(client_id, 0)
+        checkpoint_path = self._checkpoint_path(client_id, generation)
+
+        # El primer msg_id del batch identifica al delta, asi al recuperar se sabe
+        # si el ultimo delta del log general llego a bajarse al checkpoint o no
+        fields = self._encode_delta(used_msg_ids[0], delta)
+        self._activity_log.log(client_id, [checkpoint_path] + fields, used_msg_ids)
+        self._append_to_checkpoint(checkpoint_path, fields)
+        self._apply_delta(client_id, delta)
+
+    def spill(self, client_id: str):
+        """
+        Writes the in memory counts of client_id to spill_<generation>/ and
+        starts a new checkpoint generation.
+
+        The spill dir is written as .tmp and renamed once it's complete, so a
+        checkpoint whose generation has a spill dir is already contained in it.
+        """
+        generation = self._generations.get(client_id, 0)
+        counts = self._counts.get(client_id, {})
+
+        spill_dir = self._spill_dir(client_id, generation)
+        temp_spill_dir = spill_dir + TEMP_SUFFIX
+        if os.path.exists(temp_spill_dir):
+            shutil.rmtree(temp_spill_dir)
+        os.makedirs(temp_spill_dir)
+
+        records_per_file = {}
+        for key, (first_msg_id, count) in counts.items():
+            records_per_file.setdefault(self._file_name_for_key(key), []).append(
+                [key, first_msg_id, str(count)]
+            )
+
+        for file_name, records in records_per_file.items():
+            with open(os.path.join(temp_spill_dir, file_name), "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerows(records)
+
+        os.replace(temp_spill_dir, spill_dir)
+
+        checkpoint_path = self._checkpoint_path(client_id, generation)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        logging.debug(
+            f"Spilled {len(counts)} keys of client {client_id} to {spill_dir}"
+        )
+        self._keys_in_memory -= len(counts)
+        self._counts[client_id] = {}
+        self._generations[client_id] = generation + 1
+
+    """
+    RESULTS
+    """
+
+    def read_results(self, client_id: str):
+        """
+        Generator that returns every [key, first_msg_id, count] of the client,
+        merging spills and memory one partition file at a time.
+        """
+        memory_per_file = {}
+        for key, value in self._counts.get(client_id, {}).items():
+            memory_per_file.setdefault(self._file_name_for_key(key), {})[key] = value
+
+        spill_dirs = [
+            self._spill_dir(client_id, generation)
+            for generation in self._get_spilled_generations(client_id)
+        ]
+        file_names = set(memory_per_file)
+        for spill_dir in spill_dirs:
+            file_names.update(os.listdir(spill_dir))
+
+        for file_name in file_names:
+            merged = {}
+            for spill_dir in spill_dirs:
+                file_path = os.path.join(spill_dir, file_name)
+                if not os.path.exists(file_path):
+                    continue
+
+                with open(file_path, "r", newline="") as f:
+                    for key, first_msg_id, count in csv.reader(f):
+                        self._merge(merged, key, first_msg_id, int(count))
+
+            for key, (first_msg_id, count) in memory_per_file.get(file_name, {}).items():
+                self._merge(merged, key, first_msg_id, count)
+
+            for key, (first_msg_id, count) in merged.items():
+                yield [key, first_msg_id, str(count)]
+
+    @staticmethod
+    def _merge(merged: Dict[str, List], key: str, first_msg_id: str, count: int):
+        # Las generaciones se recorren en orden, el primer msg_id es el mas viejo
+        if key in merged:
+            merged[key][COUNT] += count
+        else:
+            merged[key] = [first_msg_id, count]
+
+    def remove_client(self, client_id: str):
+        """
+        Removes the in memory state of the client, files are
+        removed along with the client storage dir
+        """
+        self._keys_in_memory -= len(self._counts.pop(client_id, {}))
+        self._generations.pop(client_id, None)
+
+    """
+    RECOVERY
+    """
+
+    def recover(
+        self,
+        full_file_path_to_recover: Optional[str] = None,
+        file_state: Optional[List[str]] = None,
+    ):
+        """
+        Rebuilds the in memory state from every client checkpoint.
+
+        full_file_path_to_recover and file_state are the ones returned by
+        ActivityLog.recover(), if they belong to a live checkpoint and the delta
+        didn't get to be appended, it's appended now.
+        """
+        if not os.path.isdir(self._storage_dir):
+            return
+
+        for client_id in os.listdir(self._storage_dir):
+            if os.path.isdir(self._client_dir(client_id)):
+                self._recover_client(client_id)
+
+        if not full_file_path_to_recover or not file_state:
+            return
+
+        client_dir, file_name = full_file_path_to_recover.rsplit("/", maxsplit=1)
+        client_id = client_dir.rsplit("/", maxsplit=1)[-1]
+        if not file_name.startswith(CHECKPOINT_FILE_PREFIX) or not os.path.isdir(
+            client_dir
+        ):
+            return
+
+        if self._get_generation(file_name) != self._generations.get(client_id, 0):
+            # That generation was already spilled, delta is contained in the spill
+            return
+
+        records = []
+        if os.path.exists(full_file_path_to_recover):
+            records = self._read_checkpoint(full_file_path_to_recover)
+
+        marker, delta = self._decode_delta(file_state)
+        if records and records[-1][0] == marker:
+            return
+
+        logging.debug(f"Recovering last delta of {full_file_path_to_recover}")
+        self._append_to_checkpoint(full_file_path_to_recover, file_state)
+        self._apply_delta(client_id, delta)
+
+    def _recover_client(self, client_id: str):
+        client_dir = self._client_dir(client_id)
+        spilled_generations = set()
+        checkpoint_generations = []
+        for name in os.listdir(client_dir):
+            if name.startswith(SPILL_DIR_PREFIX) and name.endswith(TEMP_SUFFIX):
+                # Died while spilling, the checkpoint is still there
+                shutil.rmtree(os.path.join(client_dir, name))
+            elif name.startswith(SPILL_DIR_PREFIX):
+                spilled_generations.add(self._get_generation(name))
+            elif name.startswith(CHECKPOINT_FILE_PREFIX):
+                checkpoint_generations.append(self._get_generation(name))
+
+        if not spilled_generations and not checkpoint_generations:
+            return
+
+        generation = max(spilled_generations) + 1 if spilled_generations else 0
+        for checkpoint_generation in checkpoint_generations:
+            checkpoint_path = self._checkpoint_path(client_id, checkpoint_generation)
+            if checkpoint_generation in spilled_generations:
+                # Died after spilling but before removing the checkpoint
+                os.remove(checkpoint_path)
+                continue
+
+            for record in self._read_checkpoint(checkpoint_path):
+                _, delta = self._decode_delta(record)
+                self._apply_delta(client_id, delta)
+            generation = max(generation, checkpoint_generation)
+
+        self._generations[client_id] = generation
+        logging.debug(
+            f"Recovered {len(self._counts.get(client_id, {}))} keys in memory "
+            f"for client {client_id} (generation {generation})"
+        )
@@ -0,0 +1,129 @@
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from common.activity_log.activity_log import ActivityLog
+from common.counter_store.counter_store import CounterStore
+
+
+class CounterStoreTests(unittest.TestCase):
+    def setUp(self):
+        self._log_dir = "./log"
+        self._storage_dir = "./tmp_counter_store"
+        for dir in (self._log_dir, self._storage_dir):
+            if Path(dir).exists():
+                shutil.rmtree(dir)
+
+        self._activity_log = ActivityLog()
+        self._store = CounterStore(
+            self._storage_dir, self._activity_log, range_for_partition=10
+        )
+
+    def tearDown(self):
+        for dir in (self._log_dir, self._storage_dir):
+            if Path(dir).exists():
+                shutil.rmtree(dir)
+
+    def _new_store(self, max_keys_in_memory=100000) -> CounterStore:
+        # Simula un reinicio del nodo
+        self._activity_log = ActivityLog()
+        return CounterStore(
+            self._storage_dir,
+            self._activity_log,
+            range_for_partition=10,
+            max_keys_in_memory=max_keys_in_memory,
+        )
+
+    def _results(self, store: CounterStore, client_id: str):
+        return sorted(store.read_results(client_id))
+
+    def test_01_batches_are_summed_in_memory(self):
+        self._store.add_batch_per_client(
+            [["1", "1", "5"], ["1", "2", "5"], ["1", "3", "15"], ["2", "1", "5"]]
+        )
+        self._store.add_batch_per_client([["1", "4", "5"], ["1", "5", "15"]])
+
+        self.assertEqual(
+            self._results(self._store, "1"), [["15", "3", "2"], ["5", "1", "3"]]
+        )
+        self.assertEqual(self._results(self._store, "2"), [["5", "1", "1"]])
+        self.assertTrue(self._activity_log.is_msg_id_already_processed("1", "4"))
+
+    def test_02_state_is_recovered_from_checkpoint(self):
+        self._store.add_batch_per_client([["1", "1", "5"], ["1", "2", "15"]])
+        self._store.add_batch_per_client([["1", "3", "5"]])
+
+        store = self._new_store()
+        store.recover(*self._activity_log.recover())
+
+        self.assertEqual(
+            self._results(store, "1"), [["15", "2", "1"], ["5", "1", "2"]]
+        )
+
+    def test_03_spills_when_memory_budget_is_exceeded(self):
+        store = self._new_store(max_keys_in_memory=2)
+        store.add_batch_per_client([["1", "1", "5"], ["1", "2", "15"]])
+        store.add_batch_per_client([["1", "3", "25"]])
+        store.add_batch_per_client([["1", "4", "5"]])
+
+        client_dir = os.path.join(self._storage_dir, "1")
+        self.assertIn("spill_0", os.listdir(client_dir))
+        self.assertNotIn("checkpoint_0.bin", os.listdir(client_dir))
+
+        expected = [["15", "2", "1"], ["25", "3", "1"], ["5", "1", "2"]]
+        self.assertEqual(self._results(store, "1"), expected)
+
+        recovered = self._new_store(max_keys_in_memory=2)
+        recovered.recover(*self._activity_log.recover())
+        self.assertEqual(self._results(recovered, "1"), expected)
+
+    def test_04_last_delta_is_recovered_if_it_never_reached_the_checkpoint(self):
+        self._store.add_batch_per_client([["1", "1", "5"]])
+        self._store.add_batch_per_client([["1", "2", "5"], ["1", "3", "15"]])
+
+        # Died right after writing the general log
+        checkpoint_path = os.path.join(self._storage_dir, "1", "checkpoint_0.bin")
+        with open(checkpoint_path, "rb") as f:
+            data = f.read()
+        first_record_length = int.from_bytes(data[:4], "big") + 4
+        with open(checkpoint_path, "r+b") as f:
+            f.truncate(first_record_length + 5)
+
+        store = self._new_store()
+        store.recover(*self._activity_log.recover())
+        expected = [["15", "3", "1"], ["5", "1", "2"]]
+        self.assertEqual(self._results(store, "1"), expected)
+
+        # Recovering again must not apply the delta twice
+        store = self._new_store()
+        store.recover(*self._activity_log.recover())
+        self.assertEqual(self._results(store, "1"), expected)
+
+    def test_05_stale_checkpoint_and_unfinished_spill_are_discarded(self):
+        store = self._new_store(max_keys_in_memory=1)
+        store.add_batch_per_client([["1", "1", "5"], ["1", "2", "15"]])
+        store.add_batch_per_client([["1", "3", "5"]])
+
+        client_dir = os.path.join(self._storage_dir, "1")
+        # Died after renaming the spill but before removing its checkpoint
+        shutil.copytree(
+            os.path.join(client_dir, "spill_0"), os.path.join(client_dir, "spill_1.tmp")
+        )
+        shutil.copyfile(
+            os.path.join(client_dir, "checkpoint_1.bin"),
+            os.path.join(client_dir, "checkpoint_0.bin"),
+        )
+
+        recovered = self._new_store(max_keys_in_memory=1)
+        recovered.recover(*self._activity_log.recover())
+
+        self.assertNotIn("checkpoint_0.bin", os.listdir(client_dir))
+        self.assertNotIn("spill_1.tmp", os.listdir(client_dir))
+        self.assertEqual(
+            self._results(recovered, "1"), [["15", "2", "1"], ["5", "1", "2"]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import *
+
+KEY_SIZE = 16
+# Appends are written once they add up to this many bytes (or on flush)
+WRITE_BUFFER_BYTES = 64 * 1024
+TEMP_SUFFIX = ".tmp"
+
+
+class LanguageCache:
+    """
+    LRU of detected languages keyed by a hash of the text (blake2b of 16 bytes),
+    so equal reviews are classified only once no matter the client or msg_id.
+
+    With persist_path, every new entry is also appended to that file as
+    [KEY (16 bytes), LENGTH (1 byte), LANGUAGE] and the cache is reloaded
+    from it on startup. A truncated last record (crash while writing) is
+    ignored. Once the file has more than twice max_entries records it is
+    rewritten with only what's in memory.
+
+    The languages depend on how they were detected, so the fingerprint of the
+    detector settings goes in the file name (cache.bin -> cache_<fingerprint>.bin)
+    and a file written with other settings is never loaded.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        persist_path: Optional[str] = None,
+        fingerprint: str = "",
+    ):
+        self._max_entries = max_entries
+        self._persist_path = persist_path
+        if persist_path is not None and fingerprint:
+            root, extension = os.path.splitext(persist_path)
+            self._persist_path = f"{root}_{fingerprint}{extension}"
+
+        self._entries: OrderedDict[bytes, str] = OrderedDict()
+        self._pending_writes = bytearray()
+        self._records_in_file = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        if self._persist_path is not None:
+            self.__load()
+
+    @staticmethod
+    def key_of(text: str) -> bytes:
+        return hashlib.blake2b(text.encode(), digest_size=KEY_SIZE).digest()
+
+    def get(self, text: str) -> Optional[str]:
+        key = LanguageCache.key_of(text)
+        language = self._entries.get(key)
+        if language is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return language
+
+    def put(self, text: str, language: str):
+        key = LanguageCache.key_of(text)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+
+        self.__insert(key, language)
+        if self._persist_path is None:
+            return
+
+        encoded_language = language.encode()
+        self._pending_writes += key + bytes([len(encoded_language)]) + encoded_language
+        self._records_in_file += 1
+        if len(self._pending_writes) >= WRITE_BUFFER_BYTES:
+            self.flush()
+
+    def __insert(self, key: bytes, language: str):
+        self._entries[key] = language
+        if len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def flush(self):
+        """
+        Writes the pending entries to the persisted file
+        """
+        if self._persist_path is None or not self._pending_writes:
+            return
+
+        os.makedirs(os.path.dirname(self._persist_path) or ".", exist_ok=True)
+        if self._records_in_file > 2 * self._max_entries:
+            self.__compact()
+            return
+
+        with open(self._persist_path, "ab") as f:
+            f.write(self._pending_writes)
+        self._pending_writes = bytearray()
+
+    def __compact(self):
+        temp_path = self._persist_path + TEMP_SUFFIX
+        with open(temp_path, "wb") as f:
+            for key, language in self._entries.items():
+                encoded_language = language.encode()
+                f.write(key + bytes([len(encoded_language)]) + encoded_language)
+
+        os.replace(temp_path, self._persist_path)
+        self._pending_writes = bytearray()
+        self._records_in_file = len(self._entries)
+
+    def __load(self):
+        if not os.path.exists(self._persist_path):
+            return
+
+        with open(self._persist_path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+        while offset + KEY_SIZE + 1 <= len(data):
+            key = data[offset : offset + KEY_SIZE]
+            length = data[offset + KEY_SIZE]
+            start = offset + KEY_SIZE + 1
+            if start + length > len(data):
+                break
+
+            self.__insert(key, data[start : start + length].decode())
+            self._records_in_file += 1
+            offset = start + length
+
+        if offset < len(data):
+            # Se descarta el registro incompleto, sino los proximos appends quedan corridos
+            with open(self._persist_path, "r+b") as f:
+                f.truncate(offset)
+
+        logging.info(f"Loaded {len(self._entries)} cached languages")
+
+    def log_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        logging.info(
+            f"[LANGUAGE CACHE] entries: {len(self._entries)}/{self._max_entries} | "
+            f"hit rate: {hit_rate:.2%} ({self.hits}/{lookups})"
+        )
@@ -0,0 +1,82 @@
+import os
+import shutil
+import unittest
+
+from common.language_cache.language_cache import LanguageCache
+
+TEST_DIR = "tmp_language_cache"
+CACHE_PATH = os.path.join(TEST_DIR, "cache.bin")
+
+
+class LanguageCacheTests(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_01_stored_languages_are_hits(self):
+        cache = LanguageCache(10)
+        self.assertIsNone(cache.get("great game"))
+        cache.put("great game", "en")
+
+        self.assertEqual(cache.get("great game"), "en")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_02_least_recently_used_is_evicted(self):
+        cache = LanguageCache(2)
+        cache.put("a", "en")
+        cache.put("b", "es")
+        cache.get("a")
+        cache.put("c", "fr")
+
+        self.assertEqual(cache.get("a"), "en")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_03_persisted_entries_are_reloaded(self):
+        cache = LanguageCache(10, CACHE_PATH)
+        cache.put("buen juego", "es")
+        cache.put("great game", "en")
+        cache.flush()
+
+        reloaded = LanguageCache(10, CACHE_PATH)
+        self.assertEqual(reloaded.get("buen juego"), "es")
+        self.assertEqual(reloaded.get("great game"), "en")
+
+    def test_04_truncated_last_record_is_ignored(self):
+        cache = LanguageCache(10, CACHE_PATH)
+        cache.put("buen juego", "es")
+        cache.put("great game", "en")
+        cache.flush()
+        with open(CACHE_PATH, "r+b") as f:
+            f.truncate(os.path.getsize(CACHE_PATH) - 1)
+
+        reloaded = LanguageCache(10, CACHE_PATH)
+        self.assertEqual(reloaded.get("buen juego"), "es")
+        self.assertIsNone(reloaded.get("great game"))
+
+        reloaded.put("bon jeu", "fr")
+        reloaded.flush()
+        self.assertEqual(LanguageCache(10, CACHE_PATH).get("bon jeu"), "fr")
+
+    def test_05_file_is_compacted_to_the_entries_in_memory(self):
+        cache = LanguageCache(2, CACHE_PATH)
+        for i in range(10):
+            cache.put(f"review {i}", "en")
+        cache.flush()
+
+        reloaded = LanguageCache(10, CACHE_PATH)
+        self.assertEqual(len(reloaded), 2)
+        self.assertEqual(reloaded.get("review 9"), "en")
+
+    def test_06_entries_of_another_fingerprint_are_not_loaded(self):
+        cache = LanguageCache(10, CACHE_PATH, fingerprint="a1")
+        cache.put("great game", "en")
+        cache.flush()
+
+        self.assertTrue(os.path.exists(os.path.join(TEST_DIR, "cache_a1.bin")))
+        self.assertIsNone(LanguageCache(10, CACHE_PATH, fingerprint="b2").get("great game"))
+        self.assertIsNone(LanguageCache(10, CACHE_PATH).get("great game"))
+        self.assertEqual(LanguageCache(10, CACHE_PATH, fingerprint="a1").get("great game"), "en")
+
+
+if __name__ == "__main__":
+    unittest.main()
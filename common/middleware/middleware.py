@@ -1,14 +1,20 @@
 import logging
 import threading
 import time
+from collections import deque
 import pika
 import pika.exceptions
+import pika.spec
 
 from common.activity_log.activity_log import ActivityLog
+from common.confirm_window.confirm_window import ConfirmWindow
 from common.protocol.protocol import Protocol
 
 END_TRANSMISSION_MESSAGE = "END"
 
+# Max time waited for confirms on each I/O round when the confirm window is full
+CONFIRM_WAIT_SECONDS = 0.001
+
 
 class MiddlewareError(Exception):
     def __init__(self, message=None):
@@ -33,7 +39,37 @@ class Middleware:
         is_async: bool = False,
         on_connected_callback=None,
         use_logging: bool = False,
+        max_batch_bytes: int = 0,
+        linger_ms: int = 0,
+        publisher_confirms: bool = False,
+        confirm_window: int = 1000,
+        ack_every: int = 1,
+        ack_linger_ms: int = 100,
+        before_ack=None,
+        session_dictionary_batches: bool = False,
     ):
+        """
+        Batches are flushed when they reach batch_size rows, when the next row
+        would make them exceed max_batch_bytes, or when linger_ms have passed
+        since their first row. Both are off (0) by default, so batches only
+        leave by row count or when publish_batch is called.
+
+        With publisher_confirms, at most confirm_window publishes are left
+        unconfirmed by the broker, and ack() only acks a delivery once every
+        publish made before it has been confirmed. While a publish waits for
+        room in the window, deliveries and timers are not run: they are
+        deferred until the callback being processed returns.
+
+        With ack_every > 1 acks are coalesced: they are sent with multiple=True
+        every ack_every deliveries or ack_linger_ms after the first pending one.
+        before_ack (e.g. ActivityLog.sync) is called right before they go out.
+
+        With session_dictionary_batches the session id of the rows (their first
+        field) is sent once per batch (see
+        Protocol.encode_session_dictionary_batch). Every consumer decodes both
+        formats, so it can be turned on node by node. Batches are kept (and
+        logged) in the legacy format, they are re-encoded when they are sent.
+        """
         self._connection = (
             self.__create_connection(broker_ip)
             if not is_async
@@ -44,31 +80,67 @@ class Middleware:
             self._channel.basic_qos(prefetch_count=prefetch_count)
         self.__protocol = protocol
         self.__batch_size = batch_size
+        self.__max_batch_bytes = max_batch_bytes
+        self.__session_dictionary_batches = session_dictionary_batches
+        # The linger timer runs on the blocking connection (call_later), the async
+        # connection is only used by the client handler, which doesn't batch
+        self.__linger_seconds = linger_ms / 1000 if not is_async else 0
         self.__batchs_per_queue = {}
+        self.__exchange_per_queue = {}
+        self.__linger_timer_per_queue = {}
         self.is_running = threading.Event()
         self._logger = None
 
+        self.__publisher_confirms = publisher_confirms and not is_async
+        self.__confirm_window = ConfirmWindow(confirm_window)
+        self.__release_scheduled = False
+        # Consumer callbacks and timers run one at a time, the ones that come
+        # up while another one is running wait here
+        self.__dispatching = False
+        self.__deferred_dispatches = deque()
+        # Never wait for more acks than half of the unacked deliveries rabbit
+        # lets us have, otherwise the consumer would stall until the linger
+        self.__ack_every = (
+            max(1, min(ack_every, prefetch_count // 2)) if not is_async else 1
+        )
+        self.__ack_linger_seconds = ack_linger_ms / 1000
+        self.__before_ack = before_ack
+        # Every delivery_tag <= __last_acked_tag was already acked
+        self.__last_acked_tag = 0
+        self.__acked_tags = set()
+        self.__individually_acked_tags = set()
+        self.__ack_timer = None
+
+        if self.__publisher_confirms:
+            # BlockingChannel.confirm_delivery() makes every basic_publish wait
+            # for its own confirm (a round trip per publish), so confirms are
+            # handled by the underlying channel (pika private API) and processed
+            # while pika flushes I/O. Only __on_delivery_confirmation runs there
+            self._channel._impl.confirm_delivery(
+                ack_nack_callback=self.__on_delivery_confirmation
+            )
+
         if use_logging:
             self._logger = ActivityLog()
             self.__batchs_per_queue = self._logger.recover_middleware_state()
 
             for queue_name, data in self.__batchs_per_queue.items():
                 batch, amount = data
-                if amount == self.__batch_size:
+                if self.__is_batch_full(batch, amount):
                     logging.debug(
                         f"[MIDDLEWARE] While recovering, reached batch limit for {queue_name}, sending {batch}"
                     )
-                    self._channel.basic_publish(
-                        exchange="",
-                        routing_key=queue_name,
-                        body=batch, 
-                    )
+                    self.__basic_publish("", queue_name, self.__encode_batch(batch))
                     self._logger.remove_queue_state(queue_name)
 
-                    self.__batchs_per_queue[queue_name] = [
-                        b"",
+                    self.__batchs_per_queue[queue_name] = (
+                        bytearray(),
                         0,
-                    ]
+                    )
+                else:
+                    self.__batchs_per_queue[queue_name] = (bytearray(batch), amount)
+                    if amount > 0 and self.__linger_seconds > 0:
+                        self.__start_linger_timer(queue_name)
 
             logging.debug("[MIDDLEWARE] RECOVERED STATE:")
             for queue_name, data in self.__batchs_per_queue.items():
@@ -89,94 +161,148 @@ class Middleware:
     def create_queue(self, name):
         if not name in self.__batchs_per_queue:
             self.__batchs_per_queue[name] = (
-                b"",
+                bytearray(),
                 0,
             )
         self._channel.queue_declare(queue=name)
 
     def create_anonymous_queue(self):
-        result = self._channel.queue_declare(queue="")
+        # Server named and exclusive, it goes away with the connection
+        result = self._channel.queue_declare(queue="", exclusive=True)
         return result.method.queue
 
+    def create_exchange(self, exchange_name: str, exchange_type="fanout"):
+        self._channel.exchange_declare(exchange_name, exchange_type)
+
     def attach_callback(self, queue_name, callback):
         self._channel.basic_consume(
-            queue=queue_name, on_message_callback=callback, auto_ack=False
+            queue=queue_name,
+            on_message_callback=lambda *args: self.__dispatch(callback, *args),
+            auto_ack=False,
         )
 
+    def __dispatch(self, fn, *args):
+        if self.__dispatching:
+            self.__deferred_dispatches.append((fn, args))
+            return
+
+        self.__dispatching = True
+        try:
+            fn(*args)
+            while self.__deferred_dispatches:
+                deferred_fn, deferred_args = self.__deferred_dispatches.popleft()
+                deferred_fn(*deferred_args)
+        finally:
+            self.__dispatching = False
+
+    def __call_later(self, delay: float, fn):
+        return self._connection.call_later(delay, lambda: self.__dispatch(fn))
+
     def turn_fair_dispatch(self):
         # Fairness
         self._channel.basic_qos(prefetch_count=1)
+        # With a single unacked delivery there is nothing to coalesce
+        self.__flush_acks()
+        self.__ack_every = 1
 
     def publish_batch(self, queue_name="", exchange_name=""):
-        try:
-            batch, amount_of_messages = self.__batchs_per_queue[queue_name]
+        if not queue_name in self.__batchs_per_queue:
+            return
 
-            if amount_of_messages == 0:
-                return
+        self.__exchange_per_queue[queue_name] = exchange_name
+        self.__flush_queue_batch(queue_name)
 
-            self._channel.basic_publish(
-                exchange=exchange_name, routing_key=queue_name, body=batch
-            )
+    def __is_batch_full(self, queue_batch: bytes, amount_of_messages: int) -> bool:
+        return amount_of_messages >= self.__batch_size or (
+            self.__max_batch_bytes > 0 and len(queue_batch) >= self.__max_batch_bytes
+        )
 
-            self.__batchs_per_queue[queue_name] = (b"", 0)
-        except KeyError:
+    def __flush_queue_batch(self, queue_name: str):
+        queue_batch, amount_of_messages = self.__batchs_per_queue[queue_name]
+
+        linger_timer = self.__linger_timer_per_queue.pop(queue_name, None)
+        if linger_timer is not None:
+            self._connection.remove_timeout(linger_timer)
+
+        if amount_of_messages == 0:
             return
 
+        self.__basic_publish(
+            self.__exchange_per_queue.get(queue_name, ""),
+            queue_name,
+            self.__encode_batch(queue_batch),
+        )
+        if self._logger:
+            self._logger.remove_queue_state(queue_name)
+
+        self.__batchs_per_queue[queue_name] = (
+            bytearray(),
+            0,
+        )
+
+    def __encode_batch(self, queue_batch: bytes) -> bytes:
+        if self.__session_dictionary_batches:
+            return self.__protocol.encode_session_dictionary_batch(queue_batch)
+
+        return bytes(queue_batch)
+
+    def __flush_on_linger(self, queue_name: str):
+        # Runs inside process_data_events, same thread as the consumer callbacks
+        self.__linger_timer_per_queue.pop(queue_name, None)
+        logging.debug(f"[MIDDLEWARE] Linger expired for {queue_name}, flushing batch")
+        self.__flush_queue_batch(queue_name)
+
     def publish_message(self, message: list[str], queue_name="", exchange_name=""):
-        self._channel.basic_publish(
-            exchange=exchange_name,
-            routing_key=queue_name,
-            body=self.__protocol.add_to_batch(current_batch=b"", row=message),
+        self.__basic_publish(
+            exchange_name,
+            queue_name,
+            self.__protocol.add_to_batch(current_batch=b"", row=message),
         )
 
     def publish(self, message: list[str], queue_name="", exchange_name=""):
+        self.__add_to_queue_batch(
+            self.__protocol.encode_many([message]), queue_name, exchange_name
+        )
+
+    def publish_to_queues(
+        self, message: list[str], queue_names: list[str], exchange_name=""
+    ):
+        # Same row to several queues (fan-out), it's encoded only once
+        encoded_row = self.__protocol.encode_many([message])
+        for queue_name in queue_names:
+            self.__add_to_queue_batch(encoded_row, queue_name, exchange_name)
+
+    def __add_to_queue_batch(self, encoded_row: bytes, queue_name: str, exchange_name: str):
+        # Batches are bytearrays, appending a row doesn't copy what's already in the batch
         queue_batch, amount_of_messages = self.__batchs_per_queue[queue_name]
-        # logging.debug(
-        #     f"Publishing: {queue_batch} | amount_of_messages: {amount_of_messages}"
-        # )
-        # prev_batch_length = len(queue_batch)
-        # bytes1,bytes2,bytes3,
-        new_batch = self.__protocol.add_to_batch(queue_batch, message)
-
-        # Just log the last message for simplificty sake
-        # if 'q1' in queue_name:
-        #     logging.debug('PREPARE FOR KILL')
-        #     time.sleep(0.1)
+        self.__exchange_per_queue[queue_name] = exchange_name
+
+        if (
+            self.__max_batch_bytes > 0
+            and amount_of_messages > 0
+            and len(queue_batch) + len(encoded_row) > self.__max_batch_bytes
+        ):
+            # Row doesn't fit, the current batch leaves first so messages stay bounded
+            self.__flush_queue_batch(queue_name)
+            queue_batch, amount_of_messages = self.__batchs_per_queue[queue_name]
+
         if self._logger:
-            added_msg = new_batch[len(queue_batch) :]
-            # logging.debug(
-            #     f"[MIDDLEWARE] Recived message: {added_msg}, for: {queue_name}"
-            # )
-            self._logger.log_for_middleware(queue_name, added_msg)
-
-            # logging.debug("[MIDDLEWARE] STATE BEFORE KILL: ")
-            # for name, data in self.__batchs_per_queue.items():
-            #     if "q1" in name:
-            #         logging.debug(f"{name}: {data}")
-
-            # if 'q1' in queue_name:
-            #     logging.debug("KILL ME")
-            #     time.sleep(0.1)
-
-        if amount_of_messages + 1 == self.__batch_size:
-            # logging.debug(f"[MIDDLEWARE] Sent batch {new_batch} for {queue_name}")
-            self._channel.basic_publish(
-                exchange=exchange_name,
-                routing_key=queue_name,
-                body=new_batch,
-            )
-            if self._logger:
-                self._logger.remove_queue_state(queue_name)
-            # logging.debug(f"RESETING BATCH TO 0 FOR {queue_name}")
-            self.__batchs_per_queue[queue_name] = (
-                b"",
-                0,
-            )
-        else:
-            # logging.debug(
-            #     f"[MIDDLEWARE] Saved {new_batch[len(queue_batch):]} for {queue_name}"
-            # )
-            self.__batchs_per_queue[queue_name] = (new_batch, amount_of_messages + 1)
+            self._logger.log_for_middleware(queue_name, encoded_row)
+
+        queue_batch += encoded_row
+        amount_of_messages += 1
+        self.__batchs_per_queue[queue_name] = (queue_batch, amount_of_messages)
+
+        if self.__is_batch_full(queue_batch, amount_of_messages):
+            self.__flush_queue_batch(queue_name)
+        elif amount_of_messages == 1 and self.__linger_seconds > 0:
+            self.__start_linger_timer(queue_name)
+
+    def __start_linger_timer(self, queue_name: str):
+        self.__linger_timer_per_queue[queue_name] = self.__call_later(
+            self.__linger_seconds,
+            lambda: self.__flush_on_linger(queue_name),
+        )
 
     def get_rows_from_message(self, message) -> list[list[str]]:
         return self.__protocol.decode_batch(message)
@@ -188,9 +314,7 @@ class Middleware:
         end_message: list[str] = [END_TRANSMISSION_MESSAGE],
     ):
         end_message = self.__protocol.add_to_batch(current_batch=b"", row=end_message)
-        self._channel.basic_publish(
-            exchange=exchange_name, routing_key=queue, body=end_message
-        )
+        self.__basic_publish(exchange_name, queue, end_message)
         logging.debug(f"Sent: {end_message} to: {queue}")
 
     def start_consuming(self):
@@ -227,12 +351,129 @@ class Middleware:
         self._connection.add_callback_threadsafe(self.stop_consuming)
 
     def ack(self, delivery_tag):
-        self._channel.basic_ack(delivery_tag=delivery_tag)
+        if not self.__publisher_confirms:
+            self.__ack_delivery(delivery_tag)
+            return
+
+        # Everything published while processing this delivery has to be confirmed first
+        self.__confirm_window.add_pending_ack(delivery_tag)
+        self.__release_confirmed_acks()
+
+    """
+    PUBLISHER CONFIRMS
+    """
+
+    def __basic_publish(self, exchange: str, routing_key: str, body: bytes, origin_seq=None):
+        self._channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body)
+        if not self.__publisher_confirms:
+            return
+
+        self.__confirm_window.published(exchange, routing_key, body, origin_seq)
+        if self.__confirm_window.is_full():
+            self.__wait_for_confirms()
+
+    def __wait_for_confirms(self):
+        # process_data_events could dispatch deliveries and timers in the middle
+        # of this publish, so they are deferred (confirms are not, they come
+        # through __on_delivery_confirmation)
+        dispatching, self.__dispatching = self.__dispatching, True
+        try:
+            while self.__confirm_window.is_full():
+                self._connection.process_data_events(time_limit=CONFIRM_WAIT_SECONDS)
+        finally:
+            self.__dispatching = dispatching
+
+        if not dispatching and self.__deferred_dispatches:
+            # Published outside of a callback, nothing else will run them
+            self.__dispatch(lambda: None)
+
+    def __on_delivery_confirmation(self, method_frame):
+        # Runs while pika processes I/O, only updates state. Acks and republishes
+        # are done from a timer, outside of the I/O processing
+        method = method_frame.method
+        nacked = self.__confirm_window.confirm(
+            method.delivery_tag,
+            multiple=method.multiple,
+            nacked=isinstance(method, pika.spec.Basic.Nack),
+        )
+        if nacked:
+            logging.error(f"[MIDDLEWARE] {nacked} publishes were nacked, republishing them")
+
+        if self.__confirm_window.has_pending_work() and not self.__release_scheduled:
+            self.__release_scheduled = True
+            self.__call_later(0, self.__release_confirmed_acks)
+
+    def __release_confirmed_acks(self):
+        self.__release_scheduled = False
+
+        for origin_seq, exchange, routing_key, body in self.__confirm_window.take_nacked():
+            self.__basic_publish(exchange, routing_key, body, origin_seq=origin_seq)
+
+        for delivery_tag in self.__confirm_window.take_releasable_acks():
+            self.__ack_delivery(delivery_tag)
+
+    """
+    ACK COALESCING
+    """
+
+    def __ack_delivery(self, delivery_tag: int):
+        if self.__ack_every <= 1:
+            self._channel.basic_ack(delivery_tag=delivery_tag)
+            return
+
+        self.__acked_tags.add(delivery_tag)
+        if len(self.__acked_tags) >= self.__ack_every:
+            self.__flush_acks()
+        elif self.__ack_timer is None:
+            self.__ack_timer = self.__call_later(
+                self.__ack_linger_seconds, self.__on_ack_linger
+            )
+
+    def __on_ack_linger(self):
+        self.__ack_timer = None
+        self.__flush_acks()
+
+    def __flush_acks(self):
+        if self.__ack_timer is not None:
+            self._connection.remove_timeout(self.__ack_timer)
+            self.__ack_timer = None
+
+        if not self.__acked_tags:
+            return
+
+        if self.__before_ack:
+            self.__before_ack()
+
+        # multiple=True acks every delivery up to the tag, so it can only cover
+        # the contiguous tags the node already acked (tags acked one by one in
+        # a previous flush don't break the sequence)
+        tag = self.__last_acked_tag
+        multiple_ack_tag = None
+        while tag + 1 in self.__acked_tags or tag + 1 in self.__individually_acked_tags:
+            tag += 1
+            if tag in self.__acked_tags:
+                self.__acked_tags.remove(tag)
+                multiple_ack_tag = tag
+            else:
+                self.__individually_acked_tags.remove(tag)
+        self.__last_acked_tag = tag
+
+        if multiple_ack_tag is not None:
+            self._channel.basic_ack(delivery_tag=multiple_ack_tag, multiple=True)
+
+        # After a gap (a delivery the node didn't ack yet) they go one by one,
+        # they can't wait for it
+        for delivery_tag in sorted(self.__acked_tags):
+            self._channel.basic_ack(delivery_tag=delivery_tag)
+            self.__individually_acked_tags.add(delivery_tag)
+        self.__acked_tags.clear()
 
     def shutdown(self):
         try:
             self.is_running.set()
             if self._connection.is_open:
+                if self.__ack_every > 1:
+                    self._connection.add_callback_threadsafe(self.__flush_acks)
                 self._connection.add_callback_threadsafe(self._connection.close)
 
         except pika.exceptions.StreamLostError as e:
@@ -251,24 +492,24 @@ class Middleware:
     def bind_queue_to_exchange(
         self, exchange_name: str, queue_name: str, exchange_type="fanout"
     ):
-        self._channel.exchange_declare(exchange_name, exchange_type)
+        self.create_exchange(exchange_name, exchange_type)
         self._channel.queue_bind(exchange=exchange_name, queue=queue_name)
 
     def add_client_id_and_send_batch(
         self, client_id: str, batch: bytes, queue_name: str = "", exchange_name=""
     ):
-        self._channel.basic_publish(
-            exchange="",
-            routing_key=queue_name,
-            body=self.__protocol.insert_before_batch(batch, [client_id]),
-        ),
+        self.__basic_publish(
+            "",
+            queue_name,
+            self.__protocol.insert_before_batch(batch, [client_id]),
+        )
 
     def execute_from_another_thread(self, fn):
-        logging.info(
+        logging.debug(
             f"Executing from another thread: {threading.currentThread().ident}"
         )
         self._connection.add_callback_threadsafe(fn)
-        logging.info("added threadsafe callback")
+        logging.debug("added threadsafe callback")
 
     def check_connection(self):
         try:
@@ -0,0 +1,160 @@
+import csv
+import heapq
+import logging
+import math
+import os
+from array import array
+from typing import *
+
+from utils.utils import group_batch_by_field
+
+RUN_FILE_PREFIX = "run"
+TEMP_SUFFIX = ".tmp"
+
+NO_RECORDS = 0
+
+RUN_NAME = 0
+RUN_VALUE = 1
+RUN_MSG_ID = 2
+
+
+class PercentileStore:
+    """
+    Stores the records of each client as unsorted runs (one csv per batch,
+    run_<n>.csv) and keeps a running count of them, so ingesting a batch is
+    O(batch). Sorting is deferred to the END, where only the records above
+    the percentile get sorted.
+
+    Runs are written to a .tmp file and renamed, so a run is either complete
+    or not there at all.
+    """
+
+    def __init__(self, storage_dir: str):
+        self._storage_dir = storage_dir
+
+        self._msg_ids: Dict[str, Set[str]] = {}
+        self._amount_of_runs: Dict[str, int] = {}
+
+    def _client_dir(self, client_id: str) -> str:
+        return os.path.join(self._storage_dir, client_id)
+
+    def __get_run_paths(self, client_id: str) -> List[str]:
+        client_dir = self._client_dir(client_id)
+        if not os.path.isdir(client_dir):
+            return []
+
+        return [
+            os.path.join(client_dir, name)
+            for name in os.listdir(client_dir)
+            if name.startswith(RUN_FILE_PREFIX) and not name.endswith(TEMP_SUFFIX)
+        ]
+
+    def __read_runs(self, client_id: str):
+        for run_path in self.__get_run_paths(client_id):
+            with open(run_path, "r", newline="") as run:
+                for record in csv.reader(run):
+                    yield record
+
+    def __load_client(self, client_id: str):
+        if client_id in self._msg_ids:
+            return
+
+        # Despues de un reinicio, se reconstruye el estado leyendo las runs una sola vez
+        self._msg_ids[client_id] = {
+            record[RUN_MSG_ID] for record in self.__read_runs(client_id)
+        }
+        self._amount_of_runs[client_id] = len(self.__get_run_paths(client_id))
+
+    def add_batch_per_client(self, records: List[List[str]]):
+        """
+        Records need to have the following format:
+
+            [[CLIENT_ID, MSG_ID, NAME, VALUE], ...]
+        """
+        for client_id, batch in group_batch_by_field(records).items():
+            self.add_batch(client_id, batch)
+
+    def add_batch(self, client_id: str, records: List[List[str]]):
+        """
+        Records need to have the following format:
+
+            [[MSG_ID, NAME, VALUE], ...]
+
+        Records with an already stored MSG_ID are discarded.
+        """
+        self.__load_client(client_id)
+        msg_ids = self._msg_ids[client_id]
+
+        run = []
+        for msg_id, name, value in records:
+            if msg_id in msg_ids:
+                logging.debug(f"Filtered {msg_id} beacause it was duplicated")
+                continue
+
+            msg_ids.add(msg_id)
+            run.append([name, value, msg_id])
+
+        if not run:
+            return
+
+        client_dir = self._client_dir(client_id)
+        os.makedirs(client_dir, exist_ok=True)
+
+        run_number = self._amount_of_runs[client_id]
+        run_path = os.path.join(client_dir, f"{RUN_FILE_PREFIX}_{run_number}.csv")
+        temp_run_path = run_path + TEMP_SUFFIX
+        with open(temp_run_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerows(run)
+
+        os.replace(temp_run_path, run_path)
+        self._amount_of_runs[client_id] = run_number + 1
+
+    def count(self, client_id: str) -> int:
+        self.__load_client(client_id)
+
+        return len(self._msg_ids[client_id])
+
+    def get_percentile(self, client_id: str, percentile: int) -> int:
+        """
+        Returns the value at the ordinal rank of the percentile (rounded up,
+        without interpolating), or NO_RECORDS if there is no such rank.
+        """
+        amount_of_records = self.count(client_id)
+        rank = math.ceil((percentile / 100) * amount_of_records)
+        logging.debug(f"Ordinal rank is {rank}")
+        if rank == 0:
+            return NO_RECORDS
+
+        values = array(
+            "q", (int(record[RUN_VALUE]) for record in self.__read_runs(client_id))
+        )
+
+        # Seleccion con un heap acotado al lado mas chico del rank, sin ordenar todo
+        if rank <= amount_of_records - rank + 1:
+            return heapq.nsmallest(rank, values)[-1]
+
+        return heapq.nlargest(amount_of_records - rank + 1, values)[-1]
+
+    def read_records_from(self, client_id: str, min_value: int):
+        """
+        Generator that returns every [NAME, VALUE, MSG_ID] of the client with
+        VALUE >= min_value, sorted by value and name
+        """
+        records = [
+            record
+            for record in self.__read_runs(client_id)
+            if int(record[RUN_VALUE]) >= min_value
+        ]
+        records.sort(key=lambda record: (int(record[RUN_VALUE]), record[RUN_NAME]))
+
+        for record in records:
+            yield record
+
+    def remove_client(self, client_id: str):
+        """
+        Removes the in memory state of the client, runs are removed along
+        with the client storage dir
+        """
+        self._msg_ids.pop(client_id, None)
+        self._amount_of_runs.pop(client_id, None)
@@ -0,0 +1,64 @@
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from common.percentile_store.percentile_store import PercentileStore
+
+
+class PercentileStoreTests(unittest.TestCase):
+    def setUp(self):
+        self._dir = "./tmp_percentile_store"
+        if Path(self._dir).exists():
+            shutil.rmtree(self._dir)
+
+        self._store = PercentileStore(self._dir)
+
+    def tearDown(self):
+        if Path(self._dir).exists():
+            shutil.rmtree(self._dir)
+
+    def _add_values(self, client_id: str, values):
+        self._store.add_batch_per_client(
+            [[client_id, str(i), f"game_{i}", str(value)] for i, value in values]
+        )
+
+    def test_01_percentile_is_the_value_at_the_ordinal_rank(self):
+        self._add_values("1", enumerate([50, 10, 90, 30, 70]))
+        self._add_values("1", zip(range(5, 10), [20, 100, 60, 40, 80]))
+
+        self.assertEqual(self._store.count("1"), 10)
+        self.assertEqual(self._store.get_percentile("1", 90), 90)
+        self.assertEqual(self._store.get_percentile("1", 10), 10)
+        self.assertEqual(self._store.get_percentile("1", 55), 60)
+
+    def test_02_no_records_returns_zero(self):
+        self.assertEqual(self._store.get_percentile("1", 90), 0)
+
+    def test_03_records_from_value_are_sorted(self):
+        self._add_values("1", enumerate([50, 10, 90, 30, 90]))
+
+        self.assertEqual(
+            list(self._store.read_records_from("1", 50)),
+            [["game_0", "50", "0"], ["game_2", "90", "2"], ["game_4", "90", "4"]],
+        )
+
+    def test_04_duplicated_msg_ids_are_discarded_after_restart(self):
+        self._add_values("1", enumerate([50, 10]))
+        # Temp run de una escritura que no llego a completarse
+        with open(os.path.join(self._dir, "1", "run_1.csv.tmp"), "w") as f:
+            f.write("game_9,9")
+
+        store = PercentileStore(self._dir)
+        store.add_batch_per_client([["1", "1", "game_1", "10"], ["1", "2", "game_2", "5"]])
+
+        self.assertEqual(store.count("1"), 3)
+        self.assertEqual(store.get_percentile("1", 100), 50)
+        self.assertEqual(
+            list(store.read_records_from("1", 0)),
+            [["game_2", "5", "2"], ["game_1", "10", "1"], ["game_0", "50", "0"]],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,16 @@ from typing import *
 
 FIELD_LENGTH_BYTES_AMOUNT = 4
 
+# Versioned batches start with BATCH_VERSION_MARKER and a version byte. A legacy
+# batch (implicit version 1) starts with the length of its first row, it would
+# need a row of 4GB to start with the marker, so both formats can coexist
+BATCH_VERSION_MARKER = 0xFF
+SESSION_DICTIONARY_BATCH_VERSION = 2
+# [MARKER][VERSION][REFERENCE_BYTES][SESSIONS_AMOUNT (2 bytes)]
+SESSION_DICTIONARY_HEADER_BYTES = 5
+SESSIONS_AMOUNT_BYTES = 2
+MAX_SESSIONS_PER_BATCH = 2 ** (8 * SESSIONS_AMOUNT_BYTES) - 1
+
 class ProtocolError(Exception):
     def __init__(self, message: str):
         super().__init__(message)
@@ -38,19 +48,34 @@ class Protocol:
     
     @staticmethod
     def encode(row: List[str], add_checksum=False) -> bytes:
-        result = b""
+        result = bytearray()
         for field in row:
             encoded_field = field.encode("utf-8")
-            encoded_field_length = len(encoded_field).to_bytes(
+            result += len(encoded_field).to_bytes(
                 FIELD_LENGTH_BYTES_AMOUNT, "big", signed=False
             )
-            result += encoded_field_length
             result += encoded_field
 
         if add_checksum: 
-            result = Protocol._add_checksum(result)
+            return Protocol._add_checksum(bytes(result))
 
-        return result
+        return bytes(result)
+
+    @staticmethod
+    def encode_many(rows: List[List[str]]) -> bytes:
+        """
+        Encodes every row as a batch (each row prefixed by its length), the
+        same result as calling add_to_batch row by row but in linear time
+        """
+        result = bytearray()
+        for row in rows:
+            encoded_row = Protocol.encode(row)
+            result += len(encoded_row).to_bytes(
+                FIELD_LENGTH_BYTES_AMOUNT, "big", signed=False
+            )
+            result += encoded_row
+
+        return bytes(result)
     
     @staticmethod
     def add_to_batch(current_batch: bytes, row: List[str]) -> bytes:
@@ -72,35 +97,197 @@ class Protocol:
 
     @staticmethod
     def decode_batch(message: bytes, has_checksum = False) -> list[list[str]]:
-        res = []
-        while len(message) > 0:
-            row_length = int.from_bytes(message[:4], "big", signed=False)
-            message = message[4:]
+        if Protocol.is_session_dictionary_batch(message):
+            sessions, rows = Protocol.__split_session_dictionary_batch(message)
+            return [[sessions[reference]] + Protocol.decode(row) for reference, row in rows]
+
+        return [Protocol.decode(row) for row in Protocol.__iter_legacy_rows(message)]
+
+    @staticmethod
+    def is_session_dictionary_batch(message: bytes) -> bool:
+        if len(message) < 2 or message[0] != BATCH_VERSION_MARKER:
+            return False
+
+        if message[1] != SESSION_DICTIONARY_BATCH_VERSION:
+            raise ProtocolError(f"ERROR: Unknown batch version: {message[1]}")
+
+        return True
+
+    @staticmethod
+    def encode_session_dictionary_batch(batch: bytes) -> bytes:
+        """
+        Re-encodes a batch whose rows start with the session id: the distinct
+        session ids are written once at the start of the batch, and every row
+        only keeps a 1 byte reference to its session id (2 bytes with more than
+        256 sessions in the batch) followed by the rest of its fields.
+
+        [MARKER][VERSION][REFERENCE_BYTES][SESSIONS_AMOUNT]
+        [SESSION_ID_LENGTH][SESSION_ID]...
+        [ROW_LENGTH][REFERENCE][FIELDS]...
+
+        The batch is returned as is when it isn't smaller that way (e.g. a
+        single row) or when some row has no fields
+        """
+        if Protocol.is_session_dictionary_batch(batch):
+            return bytes(batch)
+
+        reference_per_session = {}
+        rows = []
+        for row in Protocol.__iter_legacy_rows(batch):
+            if len(row) < FIELD_LENGTH_BYTES_AMOUNT:
+                return bytes(batch)
+
+            session_end = FIELD_LENGTH_BYTES_AMOUNT + int.from_bytes(
+                row[:FIELD_LENGTH_BYTES_AMOUNT], "big", signed=False
+            )
+            # Session ids are kept encoded, they are never decoded here
+            session_id = bytes(row[FIELD_LENGTH_BYTES_AMOUNT:session_end])
+            reference = reference_per_session.setdefault(
+                session_id, len(reference_per_session)
+            )
+            rows.append((reference, row[session_end:]))
 
-            row = message[:row_length]
-            res.append(Protocol.decode(row))
+        if not rows or len(reference_per_session) > MAX_SESSIONS_PER_BATCH:
+            return bytes(batch)
 
-            message = message[row_length:]
+        reference_bytes = 1 if len(reference_per_session) <= 256 else 2
 
-        return res
+        result = bytearray(
+            (BATCH_VERSION_MARKER, SESSION_DICTIONARY_BATCH_VERSION, reference_bytes)
+        )
+        result += len(reference_per_session).to_bytes(
+            SESSIONS_AMOUNT_BYTES, "big", signed=False
+        )
+        for session_id in reference_per_session:
+            result += len(session_id).to_bytes(
+                FIELD_LENGTH_BYTES_AMOUNT, "big", signed=False
+            )
+            result += session_id
+
+        for reference, fields in rows:
+            result += (reference_bytes + len(fields)).to_bytes(
+                FIELD_LENGTH_BYTES_AMOUNT, "big", signed=False
+            )
+            result += reference.to_bytes(reference_bytes, "big", signed=False)
+            result += fields
+
+        if len(result) >= len(batch):
+            return bytes(batch)
+
+        return bytes(result)
+
+    @staticmethod
+    def to_legacy_batch(message: bytes) -> bytes:
+        """
+        Inverse of encode_session_dictionary_batch, legacy batches are returned as is
+        """
+        if not Protocol.is_session_dictionary_batch(message):
+            return message
+
+        sessions, rows = Protocol.__split_session_dictionary_batch(message, decode=False)
+        result = bytearray()
+        for reference, fields in rows:
+            session_id = sessions[reference]
+            result += (
+                FIELD_LENGTH_BYTES_AMOUNT + len(session_id) + len(fields)
+            ).to_bytes(FIELD_LENGTH_BYTES_AMOUNT, "big", signed=False)
+            result += len(session_id).to_bytes(
+                FIELD_LENGTH_BYTES_AMOUNT, "big", signed=False
+            )
+            result += session_id
+            result += fields
+
+        return bytes(result)
+
+    @staticmethod
+    def __split_session_dictionary_batch(
+        message: bytes, decode: bool = True
+    ) -> Tuple[List[Union[str, bytes]], Iterator[Tuple[int, memoryview]]]:
+        """
+        Returns the session ids of the dictionary and an iterator of
+        (reference, fields of the row without the session id)
+        """
+        view = memoryview(message)
+        reference_bytes = view[2]
+        sessions_amount = int.from_bytes(
+            view[3:SESSION_DICTIONARY_HEADER_BYTES], "big", signed=False
+        )
+
+        sessions = []
+        offset = SESSION_DICTIONARY_HEADER_BYTES
+        for _ in range(sessions_amount):
+            session_start = offset + FIELD_LENGTH_BYTES_AMOUNT
+            offset = session_start + int.from_bytes(
+                view[offset:session_start], "big", signed=False
+            )
+            session_id = view[session_start:offset]
+            sessions.append(str(session_id, "utf-8") if decode else bytes(session_id))
+
+        def rows():
+            for row in Protocol.__iter_legacy_rows(view[offset:]):
+                yield (
+                    int.from_bytes(row[:reference_bytes], "big", signed=False),
+                    row[reference_bytes:],
+                )
+
+        return sessions, rows()
 
     @staticmethod
     def decode(message: bytes, has_checksum=False) -> List[str]:
         if has_checksum: 
             message = Protocol.__remove_and_validate_checksum(message)
 
+        view = memoryview(message)
         result = []
-        while len(message) > 0:
-            field_length = int.from_bytes(message[:4], "big", signed=False)
-            message = message[4:]
-
-            field = message[:field_length]
-            field = field.decode("utf-8")
-            result.append(field)
-            message = message[field_length:]
+        offset = 0
+        while offset < len(view):
+            field_start = offset + FIELD_LENGTH_BYTES_AMOUNT
+            offset = field_start + int.from_bytes(
+                view[offset:field_start], "big", signed=False
+            )
+            result.append(str(view[field_start:offset], "utf-8"))
 
         return result
 
+    @staticmethod
+    def iter_rows(message: bytes) -> Iterator[memoryview]:
+        """
+        Lazily yields every encoded row of a batch as a memoryview over the
+        original message, without copying it. Rows can be decoded with
+        decode() or inspected field by field with get_field().
+        Session dictionary batches are copied back to the legacy format first
+        """
+        return Protocol.__iter_legacy_rows(Protocol.to_legacy_batch(message))
+
+    @staticmethod
+    def __iter_legacy_rows(message: bytes) -> Iterator[memoryview]:
+        view = memoryview(message)
+        offset = 0
+        while offset < len(view):
+            row_start = offset + FIELD_LENGTH_BYTES_AMOUNT
+            offset = row_start + int.from_bytes(
+                view[offset:row_start], "big", signed=False
+            )
+            yield view[row_start:offset]
+
+    @staticmethod
+    def get_field(row_view: memoryview, i: int) -> str:
+        """
+        Decodes only the i-th field of an encoded row, skipping the previous ones
+        """
+        offset = 0
+        for _ in range(i):
+            offset += FIELD_LENGTH_BYTES_AMOUNT + int.from_bytes(
+                row_view[offset : offset + FIELD_LENGTH_BYTES_AMOUNT], "big", signed=False
+            )
+
+        field_start = offset + FIELD_LENGTH_BYTES_AMOUNT
+        if field_start > len(row_view):
+            raise IndexError(f"Row has no field {i}")
+
+        field_length = int.from_bytes(row_view[offset:field_start], "big", signed=False)
+        return str(row_view[field_start : field_start + field_length], "utf-8")
+
     @staticmethod
     def insert_total_length(message: bytes) -> bytes:
         return (
@@ -139,9 +326,7 @@ class Protocol:
 
     @staticmethod
     def get_row_field(field: int, encoded_row: bytes) -> int:
-        return Protocol.decode(encoded_row)[
-            field
-        ]  # [:4] in order to avoid the row total length
+        return Protocol.get_field(memoryview(encoded_row), field)
 
 
 class TestProtocol(unittest.TestCase):
@@ -213,6 +398,83 @@ class TestProtocol(unittest.TestCase):
         # Assert the result
         self.assertEqual(decoded, expected_decoded)
 
+    def test_iter_rows_and_get_field(self):
+        batch = (
+            b"\x00\x00\x00\x12\x00\x00\x00\x05Hello\x00\x00\x00\x05World"
+            b"\x00\x00\x00\x10\x00\x00\x00\x04Test\x00\x00\x00\x04Data"
+        )
+
+        rows = list(Protocol.iter_rows(batch))
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(Protocol.get_field(rows[0], 1), "World")
+        self.assertEqual(Protocol.get_field(rows[1], 0), "Test")
+        self.assertEqual(Protocol.decode(rows[1]), ["Test", "Data"])
+        with self.assertRaises(IndexError):
+            Protocol.get_field(rows[0], 2)
+
+    def test_decode_batch_with_non_ascii_and_empty_fields(self):
+        rows = [["ñandú", ""], ["", "日本語", "x"]]
+        batch = b""
+        for row in rows:
+            batch = Protocol.add_to_batch(batch, row)
+
+        self.assertEqual(Protocol.decode_batch(batch), rows)
+        self.assertEqual(Protocol.decode_batch(bytearray(batch)), rows)
+
+    def test_encode_many(self):
+        rows = [["Hello", "World"], ["Test", "Data"], []]
+
+        expected_batch = b""
+        for row in rows:
+            expected_batch = Protocol.add_to_batch(expected_batch, row)
+
+        self.assertEqual(Protocol.encode_many(rows), expected_batch)
+        self.assertEqual(Protocol.decode_batch(Protocol.encode_many(rows)), rows)
+
+    def test_session_dictionary_batch(self):
+        rows = [
+            ["c1", "1", "730", "Great game"],
+            ["c2", "2", "570", ""],
+            ["c1", "3", "730", "ñandú"],
+            ["c1", "4", "END"],
+        ]
+        batch = Protocol.encode_many(rows)
+
+        encoded = Protocol.encode_session_dictionary_batch(batch)
+
+        self.assertLess(len(encoded), len(batch))
+        self.assertTrue(Protocol.is_session_dictionary_batch(encoded))
+        self.assertFalse(Protocol.is_session_dictionary_batch(batch))
+        self.assertEqual(Protocol.decode_batch(encoded), rows)
+        self.assertEqual(Protocol.to_legacy_batch(encoded), batch)
+        self.assertEqual(
+            [Protocol.get_field(row, 0) for row in Protocol.iter_rows(encoded)],
+            ["c1", "c2", "c1", "c1"],
+        )
+
+    def test_session_dictionary_batch_with_two_byte_references(self):
+        rows = [[f"client_{i % 300}", str(i)] for i in range(600)]
+        batch = Protocol.encode_many(rows)
+
+        encoded = Protocol.encode_session_dictionary_batch(batch)
+
+        self.assertEqual(encoded[2], 2)
+        self.assertEqual(Protocol.decode_batch(encoded), rows)
+
+    def test_session_dictionary_batch_is_not_used_when_not_smaller(self):
+        single_row = Protocol.encode_many([["c1", "1", "730"]])
+        with_empty_row = Protocol.encode_many([["c1", "1"], ["c1", "2"], []])
+
+        self.assertEqual(Protocol.encode_session_dictionary_batch(single_row), single_row)
+        self.assertEqual(
+            Protocol.encode_session_dictionary_batch(with_empty_row), with_empty_row
+        )
+
+    def test_unknown_batch_version(self):
+        with self.assertRaises(ProtocolError):
+            Protocol.decode_batch(bytes((BATCH_VERSION_MARKER, 9)))
+
     def test_for_log(self):
         data = ['/tmp/006b8b4567/platform_count.csv', 'WINDOWS,722', 'MAC,133', 'LINUX,85']
         msg_ids = ['006b8b4567', '729,L', '773,L', '770,W', '771,W', '772,W', '773,W', '775,W', '776,W', '729,L', '773,L', '773,M', '776,M', '729,L', '773,L']
@@ -0,0 +1,143 @@
+import logging
+from collections import OrderedDict
+from typing import *
+
+from common.bloom_filter.bloom_filter import BloomFilter
+
+if TYPE_CHECKING:
+    # Solo para los tipos, asi los tests corren sin pika
+    from common.middleware.middleware import Middleware
+
+EXCHANGE_PREFIX = "semi_join"
+# Clients that already finished, filters that arrive after their END or
+# TIMEOUT are ignored. Only the most recent ones are remembered
+MAX_FINISHED_CLIENTS = 10000
+
+# [CLIENT_ID, JOIN_NODE_ID, ENCODED_FILTER]
+FILTER_CLIENT_ID_INDEX = 0
+FILTER_NODE_ID_INDEX = 1
+FILTER_DATA_INDEX = 2
+
+
+def semi_join_exchange(filter_name: str) -> str:
+    return f"{EXCHANGE_PREFIX}_{filter_name}"
+
+
+def normalize_app_id(app_id: str) -> str:
+    # Games and reviews app_ids are compared as ints by the join
+    return str(int(app_id))
+
+
+def parse_semi_join_filter(spec: str) -> Optional[Tuple[str, int]]:
+    """
+    Parses a "filter_name:amount_of_join_instances" config value, an empty
+    value means the semi join is disabled.
+    """
+    if spec == "":
+        return None
+
+    filter_name, amount_of_joins = spec.split(":")
+    return filter_name, int(amount_of_joins)
+
+
+def publish_semi_join_filter(
+    middleware: "Middleware",
+    filter_name: str,
+    client_id: str,
+    join_node_id: str,
+    app_ids: Iterable[str],
+    false_positive_rate: float,
+) -> BloomFilter:
+    """
+    Published by each join instance once it has all the games of a client
+    """
+    app_ids = list(app_ids)
+    bloom_filter = BloomFilter.for_capacity(len(app_ids), false_positive_rate)
+    for app_id in app_ids:
+        bloom_filter.add(app_id)
+
+    middleware.publish_message(
+        [client_id, join_node_id, bloom_filter.encode()],
+        exchange_name=semi_join_exchange(filter_name),
+    )
+    return bloom_filter
+
+
+class SemiJoinReducer:
+    """
+    Consumes the Bloom filters that the join instances publish once they have
+    all the games of a client, and answers whether a review could still be
+    joined. Until every join instance sent its filter the answer is always
+    yes, so losing a filter (or this state) only means less reviews are dropped.
+    """
+
+    def __init__(self, middleware: "Middleware", filter_name: str, amount_of_joins: int):
+        self._middleware = middleware
+        self._filter_name = filter_name
+        self._amount_of_joins = amount_of_joins
+
+        # client_id -> {join_node_id: filter}
+        self._filters_per_client: Dict[str, Dict[str, BloomFilter]] = {}
+        self._finished_clients: OrderedDict[str, None] = OrderedDict()
+        self._dropped = 0
+
+    def start(self):
+        """
+        Binds an exclusive queue to the filter exchange, has to be called
+        before start_consuming
+        """
+        queue_name = self._middleware.create_anonymous_queue()
+        self._middleware.bind_queue_to_exchange(
+            semi_join_exchange(self._filter_name), queue_name
+        )
+        callback = self._middleware.__class__.generate_callback(self.__handle_filter)
+        self._middleware.attach_callback(queue_name, callback)
+
+    def __handle_filter(self, delivery_tag: int, body: bytes):
+        for message in self._middleware.get_rows_from_message(body):
+            client_id = message[FILTER_CLIENT_ID_INDEX]
+            join_node_id = message[FILTER_NODE_ID_INDEX]
+            if client_id in self._finished_clients:
+                logging.debug(
+                    f"[SEMI JOIN] Ignored {self._filter_name} filter of join {join_node_id} "
+                    f"for finished client {client_id}"
+                )
+                continue
+
+            filters = self._filters_per_client.setdefault(client_id, {})
+            filters[join_node_id] = BloomFilter.decode(message[FILTER_DATA_INDEX])
+            logging.debug(
+                f"[SEMI JOIN] Got {self._filter_name} filter of join {join_node_id} "
+                f"for client {client_id} ({len(filters)}/{self._amount_of_joins})"
+            )
+
+        self._middleware.ack(delivery_tag)
+
+    def might_join(self, client_id: str, app_id: str) -> bool:
+        filters = self._filters_per_client.get(client_id)
+        if filters is None or len(filters) < self._amount_of_joins:
+            return True
+
+        try:
+            key = normalize_app_id(app_id)
+        except ValueError:
+            return True
+
+        # Cada join guarda un subconjunto disjunto de los app_ids, alcanza con uno
+        key_hash = BloomFilter.hash_key(key)
+        for bloom_filter in filters.values():
+            if bloom_filter.contains_hash(key_hash):
+                return True
+
+        self._dropped += 1
+        return False
+
+    def remove_client(self, client_id: str):
+        self._finished_clients[client_id] = None
+        if len(self._finished_clients) > MAX_FINISHED_CLIENTS:
+            self._finished_clients.popitem(last=False)
+
+        if self._filters_per_client.pop(client_id, None) is not None:
+            logging.info(
+                f"[SEMI JOIN] Dropped {self._dropped} unjoinable reviews up to client {client_id}"
+            )
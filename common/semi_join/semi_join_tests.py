@@ -0,0 +1,108 @@
+import unittest
+
+from common.bloom_filter.bloom_filter import BloomFilter
+from common.protocol.protocol import Protocol
+from common.semi_join.semi_join import (
+    SemiJoinReducer,
+    publish_semi_join_filter,
+    semi_join_exchange,
+)
+
+FILTER_NAME = "q4_games"
+
+
+class FakeMiddleware:
+    """
+    Keeps what is published per exchange and delivers it by hand, with the
+    same encoding as the Middleware
+    """
+
+    def __init__(self):
+        self.published = {}
+        self.acked = []
+        self.callback = None
+
+    @classmethod
+    def generate_callback(cls, callback, *args):
+        return lambda delivery_tag, body: callback(delivery_tag, body, *args)
+
+    def create_anonymous_queue(self):
+        return "anonymous"
+
+    def bind_queue_to_exchange(self, exchange_name, queue_name):
+        pass
+
+    def attach_callback(self, queue_name, callback):
+        self.callback = callback
+
+    def publish_message(self, message, queue_name="", exchange_name=""):
+        body = Protocol.add_to_batch(current_batch=b"", row=message)
+        self.published.setdefault(exchange_name, []).append(body)
+
+    def get_rows_from_message(self, message):
+        return Protocol.decode_batch(message)
+
+    def ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def deliver(self, body):
+        self.callback(len(self.acked) + 1, body)
+
+
+class SemiJoinTests(unittest.TestCase):
+    def setUp(self):
+        self.middleware = FakeMiddleware()
+        self.reducer = SemiJoinReducer(self.middleware, FILTER_NAME, amount_of_joins=2)
+        self.reducer.start()
+
+    def publish_filter(self, client_id, join_node_id, app_ids):
+        publish_semi_join_filter(
+            self.middleware, FILTER_NAME, client_id, join_node_id, app_ids, 0.01
+        )
+        return self.middleware.published[semi_join_exchange(FILTER_NAME)][-1]
+
+    def test_01_join_filter_contains_its_app_ids(self):
+        body = self.publish_filter("client", "0", ["10", "20"])
+
+        [message] = Protocol.decode_batch(body)
+        self.assertEqual(message[:2], ["client", "0"])
+        bloom_filter = BloomFilter.decode(message[2])
+        self.assertIn("10", bloom_filter)
+        self.assertIn("20", bloom_filter)
+
+    def test_02_reviews_pass_until_every_join_sent_its_filter(self):
+        self.middleware.deliver(self.publish_filter("client", "0", ["10"]))
+
+        self.assertTrue(self.reducer.might_join("client", "99999"))
+        self.assertEqual(self.middleware.acked, [1])
+
+    def test_03_unjoinable_reviews_are_dropped_once_every_filter_arrived(self):
+        self.middleware.deliver(self.publish_filter("client", "0", ["10"]))
+        self.middleware.deliver(self.publish_filter("client", "1", ["21"]))
+
+        self.assertTrue(self.reducer.might_join("client", "10"))
+        self.assertTrue(self.reducer.might_join("client", "021"))
+        self.assertFalse(self.reducer.might_join("client", "99999"))
+        # App ids that aren't numbers can't be compared, they are never dropped
+        self.assertTrue(self.reducer.might_join("client", "not a number"))
+        self.assertTrue(self.reducer.might_join("other client", "99999"))
+
+    def test_04_filters_after_the_client_finished_are_ignored(self):
+        self.middleware.deliver(self.publish_filter("client", "0", ["10"]))
+        self.reducer.remove_client("client")
+
+        self.middleware.deliver(self.publish_filter("client", "1", ["21"]))
+        self.middleware.deliver(self.publish_filter("client", "0", ["10"]))
+
+        self.assertEqual(self.reducer._filters_per_client, {})
+        self.assertEqual(self.middleware.acked, [1, 2, 3])
+
+    def test_05_filters_of_a_client_that_never_sent_one_are_ignored_after_it_finished(self):
+        self.reducer.remove_client("client")
+        self.middleware.deliver(self.publish_filter("client", "0", ["10"]))
+
+        self.assertEqual(self.reducer._filters_per_client, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -104,6 +104,34 @@ def read_all_files(dir: str):
                 yield line
 
 
+def read_partitions(dir: str):
+    """
+    Generator that returns (partition_number, records) for every partition
+    file of the dir, in ascending partition order. records is a generator
+    over the lines of that partition.
+    """
+    if not os.path.exists(dir):
+        return  # No partitions on this dir.
+
+    partitions = []
+    for filename in os.listdir(dir):
+        name, extension = os.path.splitext(filename)
+        if not name.startswith("partition_") or extension != ".csv":
+            continue
+        partitions.append(int(name[len("partition_"):]))
+
+    for partition in sorted(partitions):
+        file_path = os.path.join(dir, f"partition_{partition}.csv")
+        yield partition, _read_lines(file_path)
+
+
+def _read_lines(file_path: str):
+    with open(file_path, "r") as f:
+        reader = csv.reader(f)
+        for line in reader:
+            yield line
+
+
 def add_to_sorted_file(dir: str, record: str):
     # TODO: add parameter for ascending or descending order. Current order is ascending order
     # TODO: batch processing
@@ -498,10 +526,8 @@ def add_batch_to_sorted_file_per_client(
 def _remove_duplicate_msg_ids_from_records(
     sorted_records: list[list[str]], read_msg_id: str
 ):
-    for record in sorted_records:
-
-        if read_msg_id in record[2]:
-            sorted_records.remove(record)
+    # Comparacion exacta, no por substring, y sin borrar mientras se itera
+    sorted_records[:] = [record for record in sorted_records if record[2] != read_msg_id]
 
 
 def _add_batch_to_sorted_file(
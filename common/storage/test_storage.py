@@ -273,6 +273,24 @@ class TestStorage(unittest.TestCase):
         self.assertEqual(records[1], original_record_1)
 
 
+    def test_read_partitions_in_ascending_order(self):
+        records = [["1", "25", "a"], ["2", "5", "b"], ["3", "105", "c"], ["4", "7", "d"]]
+        storage._write_batch_by_range(self._dir, self._range, records, 1)
+
+        partitions = [
+            (partition, list(lines))
+            for partition, lines in storage.read_partitions(self._dir)
+        ]
+
+        self.assertEqual(
+            partitions,
+            [
+                (0, [["2", "5", "b"], ["4", "7", "d"]]),
+                (2, [["1", "25", "a"]]),
+                (10, [["3", "105", "c"]]),
+            ],
+        )
+
     def test_add_to_sorted_file_creates_file(self):
         record = ["5", "10"]
         top_path = os.path.join(self._dir, f"sorted_file.csv")
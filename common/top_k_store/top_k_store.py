@@ -0,0 +1,144 @@
+import csv
+import heapq
+import logging
+import os
+from typing import *
+
+from utils.utils import group_batch_by_field
+
+SORTED_FILE_NAME = "sorted_file.csv"
+TEMP_SORTED_FILE_NAME = "temp_sorted_file.csv"
+
+
+class _TopEntry:
+    """
+    Heap entry, the root of the heap is always the worst record of the top
+    (lowest value, highest name) so it's the first one to be evicted.
+    """
+
+    __slots__ = ("sort_key", "name", "value", "msg_id")
+
+    def __init__(self, name: str, value: int, msg_id: str, ascending: bool):
+        self.name = name
+        self.value = value
+        self.msg_id = msg_id
+        self.sort_key = (value if ascending else -value, name, msg_id)
+
+    def __lt__(self, other: "_TopEntry") -> bool:
+        return self.sort_key > other.sort_key
+
+
+class TopKStore:
+    """
+    Bounded top k per client, kept as a heap of at most k records plus the set
+    of msg_ids it contains (for duplicate filtering).
+
+    Each batch costs O(batch * log k). The top is persisted to sorted_file.csv
+    only when it changes.
+    """
+
+    def __init__(self, storage_dir: str, k: int, ascending: bool = False):
+        self._storage_dir = storage_dir
+        self._k = k
+        self._ascending = ascending
+
+        self._tops: Dict[str, List[_TopEntry]] = {}
+        self._msg_ids_in_top: Dict[str, Set[str]] = {}
+
+    def _client_dir(self, client_id: str) -> str:
+        return os.path.join(self._storage_dir, client_id)
+
+    def __get_top(self, client_id: str) -> List[_TopEntry]:
+        if client_id not in self._tops:
+            self.__load_snapshot(client_id)
+
+        return self._tops[client_id]
+
+    def __load_snapshot(self, client_id: str):
+        top = []
+        file_path = os.path.join(self._client_dir(client_id), SORTED_FILE_NAME)
+        if os.path.exists(file_path):
+            with open(file_path, "r", newline="") as f:
+                for name, value, msg_id in csv.reader(f):
+                    top.append(_TopEntry(name, int(value), msg_id, self._ascending))
+            logging.debug(f"Loaded top of {len(top)} records for client {client_id}")
+
+        heapq.heapify(top)
+        self._tops[client_id] = top
+        self._msg_ids_in_top[client_id] = {entry.msg_id for entry in top}
+
+    def __save_snapshot(self, client_id: str):
+        client_dir = self._client_dir(client_id)
+        os.makedirs(client_dir, exist_ok=True)
+
+        temp_file = os.path.join(client_dir, TEMP_SORTED_FILE_NAME)
+        with open(temp_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            for entry in self.__sorted_entries(client_id):
+                writer.writerow([entry.name, str(entry.value), entry.msg_id])
+
+        os.replace(temp_file, os.path.join(client_dir, SORTED_FILE_NAME))
+
+    def __sorted_entries(self, client_id: str) -> List[_TopEntry]:
+        return sorted(self.__get_top(client_id), key=lambda entry: entry.sort_key)
+
+    def add_batch_per_client(self, records: List[List[str]]):
+        """
+        Records need to have the following format:
+
+            [[CLIENT_ID, MSG_ID, NAME, VALUE], ...]
+        """
+        for client_id, batch in group_batch_by_field(records).items():
+            self.add_batch(client_id, batch)
+
+    def add_batch(self, client_id: str, records: List[List[str]]):
+        """
+        Records need to have the following format:
+
+            [[MSG_ID, NAME, VALUE], ...]
+
+        Records whose MSG_ID is already in the top are discarded.
+        """
+        if self._k <= 0:
+            logging.error(f"Error, K must be > 0. Got: {self._k}")
+            return
+
+        top = self.__get_top(client_id)
+        msg_ids_in_top = self._msg_ids_in_top[client_id]
+
+        top_changed = False
+        for msg_id, name, value in records:
+            if msg_id in msg_ids_in_top:
+                continue
+
+            entry = _TopEntry(name, int(value), msg_id, self._ascending)
+            if len(top) < self._k:
+                heapq.heappush(top, entry)
+            elif entry < top[0]:
+                # Es peor que el peor del top
+                continue
+            else:
+                evicted = heapq.heapreplace(top, entry)
+                msg_ids_in_top.discard(evicted.msg_id)
+
+            msg_ids_in_top.add(msg_id)
+            top_changed = True
+
+        if top_changed:
+            self.__save_snapshot(client_id)
+
+    def read_top(self, client_id: str):
+        """
+        Generator that returns the top of the client, best record first,
+        as [NAME, VALUE, MSG_ID]
+        """
+        for entry in self.__sorted_entries(client_id):
+            yield [entry.name, str(entry.value), entry.msg_id]
+
+    def remove_client(self, client_id: str):
+        """
+        Removes the in memory top, the snapshot is removed along with the client
+        storage dir
+        """
+        self._tops.pop(client_id, None)
+        self._msg_ids_in_top.pop(client_id, None)
@@ -0,0 +1,77 @@
+import csv
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from common.top_k_store.top_k_store import TopKStore
+
+
+class TopKStoreTests(unittest.TestCase):
+    def setUp(self):
+        self._dir = "./tmp_top_k_store"
+        if Path(self._dir).exists():
+            shutil.rmtree(self._dir)
+
+        self._store = TopKStore(self._dir, k=3)
+
+    def tearDown(self):
+        if Path(self._dir).exists():
+            shutil.rmtree(self._dir)
+
+    def _read_snapshot(self, client_id: str):
+        with open(os.path.join(self._dir, client_id, "sorted_file.csv"), "r") as f:
+            return list(csv.reader(f))
+
+    def test_01_keeps_only_the_k_best_records(self):
+        self._store.add_batch_per_client(
+            [
+                ["1", "1", "a", "10"],
+                ["1", "2", "b", "50"],
+                ["1", "3", "c", "30"],
+                ["1", "4", "d", "40"],
+                ["1", "5", "e", "5"],
+            ]
+        )
+
+        expected = [["b", "50", "2"], ["d", "40", "4"], ["c", "30", "3"]]
+        self.assertEqual(list(self._store.read_top("1")), expected)
+        self.assertEqual(self._read_snapshot("1"), expected)
+
+    def test_02_ties_are_sorted_by_name(self):
+        self._store.add_batch_per_client(
+            [["1", "1", "z", "10"], ["1", "2", "a", "10"], ["1", "3", "m", "10"]]
+        )
+        self._store.add_batch_per_client([["1", "4", "b", "10"]])
+
+        self.assertEqual(
+            list(self._store.read_top("1")),
+            [["a", "10", "2"], ["b", "10", "4"], ["m", "10", "3"]],
+        )
+
+    def test_03_duplicated_msg_ids_are_discarded(self):
+        self._store.add_batch_per_client([["1", "1", "a", "10"]])
+        self._store.add_batch_per_client([["1", "1", "a", "10"], ["1", "11", "b", "5"]])
+
+        # "1" no es substring-match de "11"
+        self.assertEqual(
+            list(self._store.read_top("1")), [["a", "10", "1"], ["b", "5", "11"]]
+        )
+
+    def test_04_top_is_recovered_from_snapshot(self):
+        self._store.add_batch_per_client(
+            [["1", "1", "a", "10"], ["1", "2", "b", "20"], ["2", "3", "c", "30"]]
+        )
+
+        store = TopKStore(self._dir, k=3)
+        store.add_batch_per_client([["1", "1", "a", "10"], ["1", "4", "d", "15"]])
+
+        self.assertEqual(
+            list(store.read_top("1")),
+            [["b", "20", "2"], ["d", "15", "4"], ["a", "10", "1"]],
+        )
+        self.assertEqual(list(store.read_top("2")), [["c", "30", "3"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
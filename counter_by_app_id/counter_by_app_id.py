@@ -6,6 +6,8 @@ from typing import *
 import threading
 
 from common.activity_log.activity_log import ActivityLog
+from common.combiner.combiner import expand_combined_rows
+from common.counter_store.counter_store import CounterStore
 from common.middleware.middleware import Middleware, MiddlewareError
 from common.storage import storage
 from common.watchdog_client.watchdog_client import WatchdogClient
@@ -51,6 +53,15 @@ class CounterByAppId:
         self._needed_ends = config["NEEDED_ENDS"]
         self._activity_log = activity_log
 
+        self._counter_store = None
+        if config["IN_MEMORY_COUNTERS"]:
+            self._counter_store = CounterStore(
+                self._storage_dir,
+                self._activity_log,
+                range_for_partition=self._range_for_partition,
+                max_keys_in_memory=config["MAX_KEYS_IN_MEMORY"],
+            )
+
         signal.signal(signal.SIGTERM, self.__sigterm_handler)
 
         self.__recover_state()
@@ -139,14 +150,19 @@ class CounterByAppId:
 
             return
 
+        # Rows pre aggregated by a combiner come as [client_id, msg_id_ranges, app_id]
+        body = expand_combined_rows(body)
         body = self.__purge_duplicates(body)
 
-        storage.sum_batch_to_records_per_client(
-            self._storage_dir,
-            body,
-            self._activity_log,
-            range_for_partition=self._range_for_partition,
-        )
+        if self._counter_store:
+            self._counter_store.add_batch_per_client(body)
+        else:
+            storage.sum_batch_to_records_per_client(
+                self._storage_dir,
+                body,
+                self._activity_log,
+                range_for_partition=self._range_for_partition,
+            )
 
         self._middleware.ack(delivery_tag)
 
@@ -169,6 +185,10 @@ class CounterByAppId:
 
     def __recover_state(self):
         full_file_path, file_state = self._activity_log.recover()
+        if self._counter_store:
+            self._counter_store.recover(full_file_path, file_state)
+            return
+
         if not full_file_path or not file_state:
             logging.debug("General log was corrupted, not recovering any state.")
             return
@@ -198,6 +218,8 @@ class CounterByAppId:
         os.replace(temp_file, full_file_path)
 
     def __purge_duplicates(self, batch: List[str]) -> List[str]:
+        already_processed_per_client = self.__get_already_processed_per_client(batch)
+
         batch_msg_ids = set()
         filtered_batch = []
         for msg in batch:
@@ -207,13 +229,13 @@ class CounterByAppId:
             app_id = msg[REGULAR_MESSAGE_APP_ID]
 
             if (
-                not self._activity_log.is_msg_id_already_processed(client_id, msg_id)
+                not msg_id in already_processed_per_client[client_id]
                 and not (client_id, msg_id) in batch_msg_ids
             ):
                 filtered_batch.append(msg)
                 batch_msg_ids.add((client_id, msg_id))
             else:
-                if msg_id in batch_msg_ids:
+                if (client_id, msg_id) in batch_msg_ids:
                     logging.debug(
                         f"[DUPLICATE FILTER] Filtered {msg_id} beacause it was repeated (inside batch)"
                     )
@@ -224,9 +246,26 @@ class CounterByAppId:
 
         return filtered_batch
 
+    def __get_already_processed_per_client(self, batch: List[str]) -> Dict[str, Set[str]]:
+        # Una sola consulta al activity log por cliente en vez de una por mensaje
+        msg_ids_per_client = {}
+        for msg in batch:
+            client_id = msg[REGULAR_MESSAGE_CLIENT_ID]
+            msg_ids_per_client.setdefault(client_id, []).append(
+                msg[REGULAR_MESSAGE_MSG_ID]
+            )
+
+        return {
+            client_id: self._activity_log.filter_already_processed(client_id, msg_ids)
+            for client_id, msg_ids in msg_ids_per_client.items()
+        }
+
     def __send_results(self, client_id: str):
         storage_dir = f"{self._storage_dir}/{client_id}"
-        reader = storage.read_all_files(storage_dir)
+        if self._counter_store:
+            reader = self._counter_store.read_results(client_id)
+        else:
+            reader = storage.read_all_files(storage_dir)
 
         for app_id, msg_id, value in reader:
             record = [client_id, msg_id, app_id, value]
@@ -280,6 +319,9 @@ class CounterByAppId:
         else:
             logging.debug(f"Deleted directory: {storage_dir}")
 
+        if self._counter_store:
+            self._counter_store.remove_client(client_id)
+
         if client_id in self._ends_received_per_client:
             del self._ends_received_per_client[client_id]
         if client_id in self.__total_timeouts_received_per_client:
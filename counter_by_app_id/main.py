@@ -39,6 +39,21 @@ def get_config():
         config_params["STORAGE_DIR"] = os.getenv(
             "STORAGE_DIR", config["DEFAULT"]["STORAGE_DIR"]
         )
+        config_params["IN_MEMORY_COUNTERS"] = (
+            os.getenv("IN_MEMORY_COUNTERS", config["DEFAULT"]["IN_MEMORY_COUNTERS"]).lower()
+            == "true"
+        )
+        config_params["MAX_KEYS_IN_MEMORY"] = int(
+            os.getenv("MAX_KEYS_IN_MEMORY", config["DEFAULT"]["MAX_KEYS_IN_MEMORY"])
+        )
+
+        # acks
+        config_params["ACK_EVERY"] = int(
+            os.getenv("ACK_EVERY", config["DEFAULT"]["ACK_EVERY"])
+        )
+        config_params["ACK_LINGER_MS"] = int(
+            os.getenv("ACK_LINGER_MS", config["DEFAULT"]["ACK_LINGER_MS"])
+        )
 
         # logging
         config_params["LOGGING_LEVEL"] = os.getenv(
@@ -96,14 +111,19 @@ def main():
     [logging.debug(f"{key}: {value}") for key, value in config.items()]
 
     broker_ip = config.pop("RABBIT_IP")
-    middleware = Middleware(broker_ip)
+    activity_log = ActivityLog()
+    middleware = Middleware(
+        broker_ip,
+        ack_every=config.pop("ACK_EVERY"),
+        ack_linger_ms=config.pop("ACK_LINGER_MS"),
+        before_ack=activity_log.sync,
+    )
 
     monitor_ip = config.pop("WATCHDOGS_IP")
     monitor_port = config.pop("WATCHDOG_PORT")
     node_name = config.pop("NODE_NAME")
     discovery_port = config.pop("LEADER_DISCOVERY_PORT")
     monitor = WatchdogClient(monitor_ip, monitor_port, node_name, discovery_port, middleware)
-    activity_log = ActivityLog()
 
     counter = CounterByAppId(config, middleware, monitor, activity_log)
     logging.info("RUNNING COUNTER")
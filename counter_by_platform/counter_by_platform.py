@@ -8,8 +8,10 @@ from common.watchdog_client.watchdog_client import WatchdogClient
 import threading
 from common.protocol.protocol import Protocol
 from common.activity_log.activity_log import ActivityLog
+from common.combiner.combiner import expand_combined_rows
+from common.counter_store.counter_store import CounterStore
 from typing import *
-from utils.utils import group_msg_ids_per_client_by_field
+from utils.utils import derive_msg_id, group_msg_ids_per_client_by_field
 
 END_TRANSMISSION_MESSAGE = "END"
 SESSION_TIMEOUT_MESSAGE = "TIMEOUT"
@@ -46,6 +48,14 @@ class CounterByPlatform:
         self.publish_queue = config["PUBLISH_QUEUE"]
         self.storage_dir = config["STORAGE_DIR"]
 
+        self._counter_store = None
+        if config["IN_MEMORY_COUNTERS"]:
+            self._counter_store = CounterStore(
+                self.storage_dir,
+                self._activity_log,
+                max_keys_in_memory=config["MAX_KEYS_IN_MEMORY"],
+            )
+
         signal.signal(signal.SIGTERM, self.__sigterm_handler)
 
         self.__recover_state()
@@ -75,6 +85,10 @@ class CounterByPlatform:
 
     def __recover_state(self):
         full_file_path, file_state = self._activity_log.recover()
+        if self._counter_store:
+            self._counter_store.recover(full_file_path, file_state)
+            return
+
         if not full_file_path or not file_state:
             logging.debug("General log was corrupted, not recovering any state.")
             return
@@ -115,6 +129,8 @@ class CounterByPlatform:
 
             client_dir = f"{self.storage_dir}/{session_id}"
             storage.delete_directory(client_dir)
+            if self._counter_store:
+                self._counter_store.remove_client(session_id)
             self._middleware.ack(delivery_tag)
 
             return
@@ -137,45 +153,61 @@ class CounterByPlatform:
         #   Linux: [MSG_ID1, MSG_ID2, ...],
         #   Mac: [MSG_ID1, MSG_ID2, ...]},
         # ...}
+        # Rows pre aggregated by a combiner come as [client_id, msg_id_ranges, platform]
+        body = expand_combined_rows(body)
         body = self.__purge_duplicates_and_add_unique_msg_id(body)
 
-        storage.sum_batch_to_records_per_client(
-            self.storage_dir, body, self._activity_log
-        )
+        if self._counter_store:
+            self._counter_store.add_batch_per_client(body)
+        else:
+            storage.sum_batch_to_records_per_client(
+                self.storage_dir, body, self._activity_log
+            )
 
         self._middleware.ack(delivery_tag)
 
     def __generate_unique_msg_id(self, platform: str, msg_id: str) -> str:
         """
-        Generated msg id is just the first char of platform as ascii concatenated
-        to the msg id.
+        Generated msg id is derived from the first char of platform as ascii
+        and the msg id.
 
         This assumes that platform initial is unique for each platform.
         """
-        return str(ord(platform[0])) + msg_id
+        return derive_msg_id(str(ord(platform[0])), msg_id)
 
     def __purge_duplicates_and_add_unique_msg_id(self, batch: List[str]) -> List[str]:
         # CADA mensaje individual me tengo que fijar si esta duplicado, incluido dentro del mismo batch
         # (se puede optimizar en el middleware y cambiarlo aca tmb dsps)
-        batch_msg_ids = set()
-        filtered_batch = []
+        msg_ids_per_client = {}
         for msg in batch:
             # Add a custom msg id based on plaftorm
             platform = msg[REGULAR_MESSAGE_FIELD_TO_COUNT_BY]
             msg[REGULAR_MESSAGE_MSG_ID] = self.__generate_unique_msg_id(
                 platform, msg[REGULAR_MESSAGE_MSG_ID]
             )
+            msg_ids_per_client.setdefault(msg[REGULAR_MESSAGE_CLIENT_ID], []).append(
+                msg[REGULAR_MESSAGE_MSG_ID]
+            )
+
+        # Una sola consulta al activity log por cliente en vez de una por mensaje
+        already_processed_per_client = {
+            client_id: self._activity_log.filter_already_processed(client_id, msg_ids)
+            for client_id, msg_ids in msg_ids_per_client.items()
+        }
 
+        batch_msg_ids = set()
+        filtered_batch = []
+        for msg in batch:
             msg_id = msg[REGULAR_MESSAGE_MSG_ID]
             client_id = msg[REGULAR_MESSAGE_CLIENT_ID]
             if (
-                not self._activity_log.is_msg_id_already_processed(client_id, msg_id)
+                not msg_id in already_processed_per_client[client_id]
                 and not (client_id, msg_id) in batch_msg_ids
             ):
                 filtered_batch.append(msg)
                 batch_msg_ids.add((client_id, msg_id))
             else:
-                if msg_id in batch_msg_ids:
+                if (client_id, msg_id) in batch_msg_ids:
                     logging.debug(
                         f"Filtered {msg_id} beacause it was duplicated (inside batch)"
                     )
@@ -194,7 +226,10 @@ class CounterByPlatform:
         self._middleware.create_queue(self.publish_queue)
 
         client_dir = f"{self.storage_dir}/{session_id}"
-        reader = storage.read_all_files(client_dir)
+        if self._counter_store:
+            reader = self._counter_store.read_results(session_id)
+        else:
+            reader = storage.read_all_files(client_dir)
 
         for record in reader:
             if self._got_sigterm:
@@ -222,6 +257,8 @@ class CounterByPlatform:
         logging.debug(f"Sent results to queue {self.publish_queue}")
 
         storage.delete_directory(client_dir)
+        if self._counter_store:
+            self._counter_store.remove_client(session_id)
 
     def __sigterm_handler(self, signal, frame):
         logging.debug("Got SIGTERM")
@@ -24,6 +24,12 @@ def get_config():
         config_params["RANGE_FOR_PARTITION"] = int(os.getenv('RANGE_FOR_PARTITION', config["DEFAULT"]["RANGE_FOR_PARTITION"]))
         config_params["SAVE_AFTER_MESSAGES"] = int(os.getenv('SAVE_AFTER_MESSAGES', config["DEFAULT"]["SAVE_AFTER_MESSAGES"]))
         config_params["STORAGE_DIR"] = os.getenv('STORAGE_DIR', config["DEFAULT"]["STORAGE_DIR"])
+        config_params["IN_MEMORY_COUNTERS"] = os.getenv('IN_MEMORY_COUNTERS', config["DEFAULT"]["IN_MEMORY_COUNTERS"]).lower() == "true"
+        config_params["MAX_KEYS_IN_MEMORY"] = int(os.getenv('MAX_KEYS_IN_MEMORY', config["DEFAULT"]["MAX_KEYS_IN_MEMORY"]))
+
+        # acks
+        config_params["ACK_EVERY"] = int(os.getenv('ACK_EVERY', config["DEFAULT"]["ACK_EVERY"]))
+        config_params["ACK_LINGER_MS"] = int(os.getenv('ACK_LINGER_MS', config["DEFAULT"]["ACK_LINGER_MS"]))
 
         # logging
         config_params["LOGGING_LEVEL"] = os.getenv('LOGGING_LEVEL', config["DEFAULT"]["LOGGING_LEVEL"])
@@ -70,15 +76,20 @@ def main():
     [logging.debug(f"{key}: {value}") for key, value in config.items()]
     
     broker_ip = config.pop("RABBIT_IP")
-    middleware = Middleware(broker_ip)
+    logger = ActivityLog()
+    middleware = Middleware(
+        broker_ip,
+        ack_every=config.pop("ACK_EVERY"),
+        ack_linger_ms=config.pop("ACK_LINGER_MS"),
+        before_ack=logger.sync,
+    )
 
     monitor_ip = config.pop("WATCHDOGS_IP")
     monitor_port = config.pop("WATCHDOG_PORT")
     node_name = config.pop("NODE_NAME")
     discovery_port = config.pop("LEADER_DISCOVERY_PORT")
     monitor = WatchdogClient(monitor_ip, monitor_port, node_name, discovery_port, middleware)
-    logger = ActivityLog()
-    
+
     counter = CounterByPlatform(config, middleware, monitor, logger)
     logging.info("RUNNING COUNTER")
     counter.run()
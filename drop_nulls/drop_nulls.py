@@ -9,6 +9,8 @@ from common.middleware.middleware import Middleware, MiddlewareError
 from utils.utils import node_id_to_send_to
 from constants import *
 from common.watchdog_client.watchdog_client import WatchdogClient
+from common.semi_join.semi_join import SemiJoinReducer, parse_semi_join_filter
+from common.combiner.combiner import Combiner
 import threading
 
 import signal
@@ -44,6 +46,21 @@ class DropNulls:
         self.node_id = config["NODE_ID"]
         self.instances_of_myself = int(config["INSTANCES_OF_MYSELF"])
 
+        # The platforms of each games batch are sent to the counters as
+        # [client_id, msg_id_ranges, platform] rows
+        self.platforms_combiner = Combiner() if config["COMBINE_PLATFORMS"] else None
+
+        # Reviews queue -> semi join of that query, reviews that can't be joined aren't sent
+        self.semi_joins: Dict[str, SemiJoinReducer] = {}
+        for queue, semi_join_filter in [
+            (self.q3_reviews, config["Q3_SEMI_JOIN_FILTER"]),
+            (self.q4_reviews, config["Q4_SEMI_JOIN_FILTER"]),
+            (self.q5_reviews, config["Q5_SEMI_JOIN_FILTER"]),
+        ]:
+            semi_join_filter = parse_semi_join_filter(semi_join_filter)
+            if semi_join_filter is not None:
+                self.semi_joins[queue] = SemiJoinReducer(middleware, *semi_join_filter)
+
         signal.signal(signal.SIGINT, self.__signal_handler)
         signal.signal(signal.SIGTERM, self.__signal_handler)
 
@@ -82,6 +99,8 @@ class DropNulls:
         self._middleware.attach_callback(
             self.reviews_receiving_queue_name, reviews_callback
         )
+        for semi_join in self.semi_joins.values():
+            semi_join.start()
 
         try:
             self._middleware.start_consuming()
@@ -213,6 +232,7 @@ class DropNulls:
 
             if message[1] == SESSION_TIMEOUT_TRANSMISSION_MESSAGE:
                 logging.info(f"Received timeout while processing reviews")
+                self.__publish_combined_platforms()
                 self.__handle_timeout(
                     message, self.games_receiving_queue_name, GAMES_MESSAGE_TYPE
                 )
@@ -221,6 +241,7 @@ class DropNulls:
 
             if message[END_TRANSMISSION_END_INDEX] == END_TRANSMISSION_MESSAGE:
                 logging.debug(f"Received games END: {message}")
+                self.__publish_combined_platforms()
                 self.__handle_end_transmission(
                     message,
                     self.games_receiving_queue_name,
@@ -243,6 +264,12 @@ class DropNulls:
                         client_id, platform, self.count_by_platform_nodes
                     )
                     message_to_send = [client_id, msg_id, platform]
+                    if self.platforms_combiner is not None:
+                        self.platforms_combiner.add(
+                            message_to_send, f"{node_id}_{self.q1_platform}"
+                        )
+                        continue
+
                     self._middleware.publish(
                         message_to_send,
                         f"{node_id}_{self.q1_platform}",
@@ -261,20 +288,27 @@ class DropNulls:
                 self.q2_games,
             )
 
-            for queue in [self.q3_games, self.q4_games, self.q5_games]:
-                self._middleware.publish(
-                    [
-                        client_id,
-                        message[GAMES_MSG_ID],
-                        message[GAMES_APP_ID],
-                        message[GAMES_NAME],
-                        message[GAMES_GENRE],
-                    ],
-                    queue,
-                )
+            self._middleware.publish_to_queues(
+                [
+                    client_id,
+                    message[GAMES_MSG_ID],
+                    message[GAMES_APP_ID],
+                    message[GAMES_NAME],
+                    message[GAMES_GENRE],
+                ],
+                [self.q3_games, self.q4_games, self.q5_games],
+            )
 
+        self.__publish_combined_platforms()
         self._middleware.ack(delivery_tag)
 
+    def __publish_combined_platforms(self):
+        if self.platforms_combiner is None:
+            return
+
+        for message_to_send, queue_name in self.platforms_combiner.drain():
+            self._middleware.publish(message_to_send, queue_name)
+
     def __handle_reviews_end_transmission_by_query(self, client_id: str, msg_id: str):
         for queue in [self.q3_reviews, self.q5_reviews, self.q4_reviews]:
             self._middleware.send_end(
@@ -294,6 +328,7 @@ class DropNulls:
                 self.__handle_timeout(
                     message, self.reviews_receiving_queue_name, REVIEWS_MESSAGE_TYPE
                 )
+                self.__forget_semi_join_client(message[REVIEW_SESSION_ID])
                 self._middleware.ack(delivery_tag)
                 return
 
@@ -304,6 +339,7 @@ class DropNulls:
                     self.reviews_receiving_queue_name,
                     REVIEWS_MESSAGE_TYPE,
                 )
+                self.__forget_semi_join_client(message[REVIEW_SESSION_ID])
                 self._middleware.ack(delivery_tag)
                 return
 
@@ -313,34 +349,49 @@ class DropNulls:
                 continue
 
             client_id = message[0]
-            for queue in [self.q3_reviews, self.q5_reviews]:
-                self._middleware.publish(
+            app_id = message[REVIEW_APP_ID]
+            score_queues = [
+                queue
+                for queue in [self.q3_reviews, self.q5_reviews]
+                if self.__might_join(queue, client_id, app_id)
+            ]
+            if score_queues:
+                self._middleware.publish_to_queues(
                     [
                         client_id,
                         message[REVIEW_MSG_ID],
-                        message[REVIEW_APP_ID],
+                        app_id,
                         message[REVIEW_SCORE],
                     ],
-                    queue,
+                    score_queues,
                 )
                 logging.debug(
-                    f"Sent: {[client_id, message[REVIEW_APP_ID], message[REVIEW_SCORE]]} to: {queue}"
+                    f"Sent: {[client_id, app_id, message[REVIEW_SCORE]]} to: {score_queues}"
                 )
 
             self.r += 1
-            self._middleware.publish(
-                [
-                    client_id,
-                    message[REVIEW_MSG_ID],
-                    message[REVIEW_APP_ID],
-                    message[REVIEW_TEXT],
-                    message[REVIEW_SCORE],
-                ],
-                self.q4_reviews,
-            )
+            if self.__might_join(self.q4_reviews, client_id, app_id):
+                self._middleware.publish(
+                    [
+                        client_id,
+                        message[REVIEW_MSG_ID],
+                        app_id,
+                        message[REVIEW_TEXT],
+                        message[REVIEW_SCORE],
+                    ],
+                    self.q4_reviews,
+                )
 
         self._middleware.ack(delivery_tag)
 
+    def __might_join(self, queue: str, client_id: str, app_id: str) -> bool:
+        semi_join = self.semi_joins.get(queue)
+        return semi_join is None or semi_join.might_join(client_id, app_id)
+
+    def __forget_semi_join_client(self, client_id: str):
+        for semi_join in self.semi_joins.values():
+            semi_join.remove_client(client_id)
+
     def __signal_handler(self, sig, frame):
         logging.debug(f"[NULL DROP {self.node_id}] Gracefully shutting down...")
         self._middleware.shutdown()
@@ -34,6 +34,10 @@ def get_config():
         config_params["INSTANCES_OF_MYSELF"] = os.getenv(
             "INSTANCES_OF_MYSELF", config["DEFAULT"]["INSTANCES_OF_MYSELF"]
         )
+        config_params["COMBINE_PLATFORMS"] = (
+            os.getenv("COMBINE_PLATFORMS", config["DEFAULT"]["COMBINE_PLATFORMS"]).lower()
+            == "true"
+        )
 
         # Reciving queues
         config_params["GAMES_RECIVING_QUEUE_NAME"] = os.getenv(
@@ -57,18 +61,27 @@ def get_config():
         config_params["Q3_REVIEWS"] = os.getenv(
             "Q3_REVIEWS", config["DEFAULT"]["Q3_REVIEWS"]
         )
+        config_params["Q3_SEMI_JOIN_FILTER"] = os.getenv(
+            "Q3_SEMI_JOIN_FILTER", config["DEFAULT"]["Q3_SEMI_JOIN_FILTER"]
+        )
 
         # Q4
         config_params["Q4_GAMES"] = os.getenv("Q4_GAMES", config["DEFAULT"]["Q4_GAMES"])
         config_params["Q4_REVIEWS"] = os.getenv(
             "Q4_REVIEWS", config["DEFAULT"]["Q4_REVIEWS"]
         )
+        config_params["Q4_SEMI_JOIN_FILTER"] = os.getenv(
+            "Q4_SEMI_JOIN_FILTER", config["DEFAULT"]["Q4_SEMI_JOIN_FILTER"]
+        )
 
         # Q5
         config_params["Q5_GAMES"] = os.getenv("Q5_GAMES", config["DEFAULT"]["Q5_GAMES"])
         config_params["Q5_REVIEWS"] = os.getenv(
             "Q5_REVIEWS", config["DEFAULT"]["Q5_REVIEWS"]
         )
+        config_params["Q5_SEMI_JOIN_FILTER"] = os.getenv(
+            "Q5_SEMI_JOIN_FILTER", config["DEFAULT"]["Q5_SEMI_JOIN_FILTER"]
+        )
 
         # # Monitor
         config_params["WATCHDOGS_IP"] = os.getenv("WATCHDOGS_IP").split(",")
@@ -9,6 +9,8 @@ from common.protocol.protocol import Protocol
 from common.middleware.middleware import Middleware, MiddlewareError
 from utils.utils import node_id_to_send_to
 from common.watchdog_client.watchdog_client import WatchdogClient
+from common.semi_join.semi_join import SemiJoinReducer, parse_semi_join_filter
+from common.combiner.combiner import Combiner
 
 import signal
 import logging
@@ -42,6 +44,19 @@ class FilterColumnByValue:
             "AMOUNT_OF_FORWARDING_QUEUES"
         ]
         self._columns_to_keep: List[int] = config["COLUMNS_TO_KEEP"]
+        # Every instance of a broadcast queue, precomputed as they get every row
+        self._broadcast_queues: Dict[str, List[str]] = {
+            queue_name: [
+                f"{queue_number}_{queue_name}" for queue_number in range(amount)
+            ]
+            for queue_name, amount in zip(
+                self._forwarding_queue_names, self._amount_of_forwarding_queues
+            )
+            if queue_name in config["BROADCAST_FORWARDING_QUEUES"]
+        }
+        # Rows for these queues (counters) are pre aggregated per delivery
+        self._combined_queues: Set[str] = set(config["COMBINED_FORWARDING_QUEUES"])
+        self._combiner = Combiner()
         self._column_number_to_use: int = config["COLUMN_NUMBER_TO_USE"]
         self._value_to_filter_by: str = config["VALUE_TO_FILTER_BY"]
         self._node_id: str = config["NODE_ID"]
@@ -49,6 +64,12 @@ class FilterColumnByValue:
         self._instances_of_myself = config["INSTANCES_OF_MYSELF"]
         self._criteria = config["CRITERIA"]
 
+        # Reviews whose game can't be joined are dropped here
+        self._semi_join: Optional[SemiJoinReducer] = None
+        semi_join_filter = parse_semi_join_filter(config["SEMI_JOIN_FILTER"])
+        if semi_join_filter is not None:
+            self._semi_join = SemiJoinReducer(middleware, *semi_join_filter)
+
         signal.signal(signal.SIGINT, self.__signal_handler)
         signal.signal(signal.SIGTERM, self.__signal_handler)
 
@@ -69,6 +90,8 @@ class FilterColumnByValue:
             self.__handle_message,
         )
         self._middleware.attach_callback(self._receiving_queue_name, callback)
+        if self._semi_join is not None:
+            self._semi_join.start()
 
         try:
             self._middleware.start_consuming()
@@ -203,22 +226,32 @@ class FilterColumnByValue:
             if message[1] == SESSION_TIMEOUT_MESSAGE:
                 session_id = body[0]
                 logging.info(f"Received TIMEOUT for client: {session_id}")
+                self.__publish_combined_rows()
                 self.__send_last_batch_to_fowarding_queues()
                 self.__handle_consensus_tranmission(message, SESSION_TIMEOUT_MESSAGE)
+                self.__forget_semi_join_client(message[CLIENT_ID])
                 self._middleware.ack(delivery_tag)
 
                 return
 
             if message[END_TRANSMISSION_END_INDEX] == END_TRANSMISSION_MESSAGE:
                 logging.debug(f"GOT END: {body}")
+                self.__publish_combined_rows()
                 self.__send_last_batch_to_fowarding_queues()
                 self.__handle_end_transmission(message)
+                self.__forget_semi_join_client(message[CLIENT_ID])
                 self._middleware.ack(delivery_tag)
 
                 return
 
+            if self._semi_join is not None and not self._semi_join.might_join(
+                message[CLIENT_ID], message[APP_ID]
+            ):
+                continue
+
             self._filter_by_criteria(message)
 
+        self.__publish_combined_rows()
         self._middleware.ack(delivery_tag)
 
     def __set_callback_according_to_criteria(self):
@@ -290,16 +323,36 @@ class FilterColumnByValue:
             amount_of_current_queue = self._amount_of_forwarding_queues[i]
             queue_name = self._forwarding_queue_names[i]
 
+            if queue_name in self._broadcast_queues:
+                # Broadcast join, every join instance keeps the whole (small) side
+                self._middleware.publish_to_queues(
+                    message, self._broadcast_queues[queue_name]
+                )
+                continue
+
             node_id = node_id_to_send_to(
                 client_id, message[APP_ID], amount_of_current_queue
             )
 
             queue_to_send_to = f"{node_id}_{queue_name}"
 
+            if queue_name in self._combined_queues:
+                self._combiner.add(message, queue_to_send_to)
+                continue
+
             logging.debug(f"Sending message: {message} to queue: {queue_to_send_to}")
             # TODO: Use batches here?
             self._middleware.publish(message, queue_to_send_to)
 
+    def __publish_combined_rows(self):
+        for combined_row, queue_name in self._combiner.drain():
+            logging.debug(f"Sending combined row: {combined_row} to queue: {queue_name}")
+            self._middleware.publish(combined_row, queue_name)
+
+    def __forget_semi_join_client(self, client_id: str):
+        if self._semi_join is not None:
+            self._semi_join.remove_client(client_id)
+
     def __signal_handler(self, sig, frame):
         logging.debug("Gracefully shutting down...")
         self._middleware.shutdown()
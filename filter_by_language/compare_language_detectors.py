@@ -0,0 +1,89 @@
+"""
+Compares the staged LanguageDetector against plain langid.classify (what the
+filter did before) on a sample of reviews: time of each one and how many
+filter decisions (is / isn't LANGUAGE) change.
+
+Usage (from filter_by_language/):
+
+    python3 compare_language_detectors.py ../data/reviews.csv --limit 50000 \\
+        --fast-path --tiny-text-max-letters 2 --max-chars 500 --candidates en,es,fr,de,pt,ru,zh
+"""
+import argparse
+import csv
+import sys
+import time
+
+import langid
+
+from language_detector import LanguageDetector
+
+
+def read_texts(file_path: str, column: str, limit: int):
+    csv.field_size_limit(sys.maxsize)
+    texts = []
+    with open(file_path, newline="") as f:
+        for row in csv.DictReader(f):
+            texts.append(row[column] or "")
+            if len(texts) == limit:
+                break
+
+    return texts
+
+
+def timed(classify, texts):
+    start = time.perf_counter()
+    languages = [classify(text) for text in texts]
+    return languages, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_path")
+    parser.add_argument("--column", default="review_text")
+    parser.add_argument("--limit", type=int, default=20000)
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--fast-path", action="store_true")
+    parser.add_argument("--tiny-text-max-letters", type=int, default=0)
+    parser.add_argument("--tiny-text-language", default="en")
+    parser.add_argument("--max-chars", type=int, default=0)
+    parser.add_argument("--candidates", default="")
+    args = parser.parse_args()
+
+    texts = read_texts(args.file_path, args.column, args.limit)
+    print(f"Texts: {len(texts)}")
+
+    # La linea base va primero, el detector puede restringir los idiomas de langid
+    langid.classify("")
+    baseline, baseline_time = timed(lambda text: langid.classify(text)[0], texts)
+
+    detector = LanguageDetector(
+        args.language,
+        fast_path=args.fast_path,
+        tiny_text_max_letters=args.tiny_text_max_letters,
+        tiny_text_language=args.tiny_text_language,
+        max_chars=args.max_chars,
+        candidate_languages=[c for c in args.candidates.split(",") if c],
+    )
+    staged, staged_time = timed(detector.classify, texts)
+
+    false_negatives = sum(
+        b == args.language and s != args.language for b, s in zip(baseline, staged)
+    )
+    false_positives = sum(
+        b != args.language and s == args.language for b, s in zip(baseline, staged)
+    )
+    same_language = sum(b == s for b, s in zip(baseline, staged))
+    in_language = sum(b == args.language for b in baseline)
+
+    print(f"langid.classify: {baseline_time:.2f}s")
+    print(f"LanguageDetector: {staged_time:.2f}s ({baseline_time / max(staged_time, 1e-9):.2f}x)")
+    print(f"Stages: {detector.stats()}")
+    print(f"Same language: {same_language}/{len(texts)}")
+    print(
+        f"'{args.language}' decisions changed: {false_negatives + false_positives}/{len(texts)} "
+        f"(lost {false_negatives} of {in_language}, added {false_positives})"
+    )
+
+
+if __name__ == "__main__":
+    main()
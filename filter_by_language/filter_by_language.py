@@ -9,6 +9,10 @@ from common.protocol.protocol import Protocol
 from common.middleware.middleware import Middleware, MiddlewareError
 from utils.utils import node_id_to_send_to
 from common.watchdog_client.watchdog_client import WatchdogClient
+from common.semi_join.semi_join import SemiJoinReducer, parse_semi_join_filter
+from common.language_cache.language_cache import LanguageCache
+from common.combiner.combiner import Combiner
+from language_detector import LanguageDetector
 
 END_TRANSMISSION_CLIENT_ID_INDEX = 0
 END_TRANSMISSION_END_INDEX = 2
@@ -19,6 +23,26 @@ import signal
 import logging
 import langid
 import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+# Detector of the process, the one of the node is copied to each worker
+_language_detector: Optional[LanguageDetector] = None
+
+
+def _init_language_worker(language_detector: LanguageDetector):
+    global _language_detector
+    _language_detector = language_detector
+
+    # Los workers no manejan senales, el nodo es el que cierra el pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _classify_languages(texts: List[str]) -> List[str]:
+    return _language_detector.classify_many(texts)
 
 
 class FilterByLanguage:
@@ -49,12 +73,55 @@ class FilterByLanguage:
         self._receiving_queue_name = config["RECIVING_QUEUE_NAME"]
         self._instances_of_myself = config["INSTANCES_OF_MYSELF"]
 
-        self._language = config["LANGUAGE"]
+        self._language = config["LANGUAGE"].lower()
+        self._language_detector = LanguageDetector(
+            self._language,
+            fast_path=config["LANGUAGE_FAST_PATH"],
+            tiny_text_max_letters=config["TINY_TEXT_MAX_LETTERS"],
+            tiny_text_language=config["TINY_TEXT_LANGUAGE"],
+            max_chars=config["LANGUAGE_MAX_CHARS"],
+            candidate_languages=config["LANGUAGE_CANDIDATES"],
+        )
+
+        # With LANGUAGE_WORKERS > 0 the texts of each delivery that aren't cached
+        # are classified as a whole by a process of the pool, and
+        # (delivery_tag, rows, languages, future) waits here so results are
+        # published and acked in the same order they arrived
+        self._language_workers: int = config["LANGUAGE_WORKERS"]
+        self._language_pool: Optional[ProcessPoolExecutor] = None
+        self._pending_classifications: Deque[
+            Tuple[int, List[List[str]], List[Optional[str]], Optional[Future]]
+        ] = deque()
+
+        # Equal texts (duplicated reviews, redeliveries, clients sending the same
+        # dataset) are classified only once
+        self._language_cache: Optional[LanguageCache] = None
+        if config["LANGUAGE_CACHE_SIZE"] > 0:
+            self._language_cache = LanguageCache(
+                config["LANGUAGE_CACHE_SIZE"],
+                config["LANGUAGE_CACHE_PATH"] or None,
+                fingerprint=self._language_detector.fingerprint(),
+            )
+
+        # Rows for these queues (counters) are pre aggregated per delivery
+        self._combined_queues: Set[str] = set(config["COMBINED_FORWARDING_QUEUES"])
+        self._combiner = Combiner()
+
+        # Reviews whose game can't be joined are dropped here
+        self._semi_join: Optional[SemiJoinReducer] = None
+        semi_join_filter = parse_semi_join_filter(config["SEMI_JOIN_FILTER"])
+        if semi_join_filter is not None:
+            self._semi_join = SemiJoinReducer(middleware, *semi_join_filter)
 
+        # Forked workers inherit the handlers until _init_language_worker runs
+        self._pid = os.getpid()
         signal.signal(signal.SIGINT, self.__signal_handler)
         signal.signal(signal.SIGTERM, self.__signal_handler)
 
     def start(self):
+        # The pool is forked before any other thread of the node is running
+        if self._language_workers > 0:
+            self.__start_language_pool()
 
         monitor_thread = threading.Thread(target=self._client_monitor.start)
         monitor_thread.start()
@@ -70,6 +137,8 @@ class FilterByLanguage:
             self.__handle_message,
         )
         self._middleware.attach_callback(self._receiving_queue_name, callback)
+        if self._semi_join is not None:
+            self._semi_join.start()
 
         try:
             self._middleware.start_consuming()
@@ -80,9 +149,32 @@ class FilterByLanguage:
         except SystemExit:
             logging.info("Exiting")
         finally:
+            if self._language_pool is not None:
+                self._language_pool.shutdown(wait=False, cancel_futures=True)
+            if self._language_cache is not None:
+                self._language_cache.flush()
             self._middleware.shutdown()
             # monitor_thread.join()
 
+    def __start_language_pool(self):
+        # langid carga el modelo la primera vez que se usa, se carga antes del
+        # fork asi los workers lo comparten (copy on write) en vez de cargarlo cada uno
+        langid.classify("")
+        self._language_pool = ProcessPoolExecutor(
+            max_workers=self._language_workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_language_worker,
+            initargs=(self._language_detector,),
+        )
+        # The workers are forked on submit, one task per worker forks all of them now
+        warm_up = [
+            self._language_pool.submit(_classify_languages, [""])
+            for _ in range(self._language_workers)
+        ]
+        for future in warm_up:
+            future.result()
+        logging.info(f"Started {self._language_workers} language workers")
+
     def __create_all_forwarding_queues(self):
         """
         If amount_of_forwarding_queues = [2, 3] and forwarding_queue_names = ['pablo', 'rabbit']
@@ -197,34 +289,139 @@ class FilterByLanguage:
 
     def __handle_message(self, delivery_tag: int, body: bytes):
         body = self._middleware.get_rows_from_message(body)
+        rows_to_classify = []
         for message in body:
             logging.debug(f"Recived message: {message}")
 
-            if message[1] == SESSION_TIMEOUT_MESSAGE:
-                session_id = body[0]
-                logging.info(f"Received TIMEOUT for client: {session_id}")
-                self.__send_last_batch_to_fowarding_queues()
-                self.__handle_consensus_tranmission(message, SESSION_TIMEOUT_MESSAGE)
+            if message[1] == SESSION_TIMEOUT_MESSAGE or message[2] == END_TRANSMISSION_MESSAGE:
+                # Everything before it has to be sent before the END/TIMEOUT
+                self.__drain_pending_classifications(wait=True)
+                self.__filter_language(rows_to_classify)
+                self.__handle_control_message(message)
                 self._middleware.ack(delivery_tag)
 
                 return
-            if message[2] == END_TRANSMISSION_MESSAGE:
-                logging.debug(f"GOT END: {body}")
-                self.__send_last_batch_to_fowarding_queues()
-                self.__handle_end_transmission(message)
-                self._middleware.ack(delivery_tag)
 
+            if self._semi_join is not None and not self._semi_join.might_join(
+                message[CLIENT_ID], message[APP_ID]
+            ):
+                continue
+
+            rows_to_classify.append(message)
+
+        if self._language_pool is None:
+            self.__filter_language(rows_to_classify)
+            self._middleware.ack(delivery_tag)
+            return
+
+        languages, texts_to_classify = self.__get_cached_languages(rows_to_classify)
+        future = None
+        if texts_to_classify:
+            future = self._language_pool.submit(_classify_languages, texts_to_classify)
+        self._pending_classifications.append(
+            (delivery_tag, rows_to_classify, languages, future)
+        )
+
+        if future is None:
+            self.__drain_pending_classifications()
+            return
+
+        # The pool thread can't use the channel, the results are published
+        # from the consumer thread
+        future.add_done_callback(
+            lambda _: self._middleware.execute_from_another_thread(
+                self.__drain_pending_classifications
+            )
+        )
+
+    def __handle_control_message(self, message: List[str]):
+        if message[1] == SESSION_TIMEOUT_MESSAGE:
+            logging.info(f"Received TIMEOUT for client: {message[CLIENT_ID]}")
+            self.__send_last_batch_to_fowarding_queues()
+            self.__handle_consensus_tranmission(message, SESSION_TIMEOUT_MESSAGE)
+        else:
+            logging.debug(f"GOT END: {message}")
+            self.__send_last_batch_to_fowarding_queues()
+            self.__handle_end_transmission(message)
+
+        self.__forget_semi_join_client(message[CLIENT_ID])
+        if self._language_cache is not None:
+            self._language_cache.flush()
+            self._language_cache.log_stats()
+        if self._language_pool is None:
+            # Los workers del pool llevan sus propias estadisticas
+            logging.info(f"[LANGUAGE DETECTOR] {self._language_detector.stats()}")
+
+    def __drain_pending_classifications(self, wait: bool = False):
+        """
+        Publishes and acks the classified deliveries, oldest first, stopping at
+        the first one that is still being classified (unless wait is set)
+        """
+        while self._pending_classifications:
+            delivery_tag, rows, languages, future = self._pending_classifications[0]
+            if future is not None and not wait and not future.done():
                 return
 
-            self.__filter_language(message)
+            self._pending_classifications.popleft()
+            classified_languages = future.result() if future is not None else []
+            self.__send_rows_in_language(rows, languages, classified_languages)
+            self._middleware.ack(delivery_tag)
+
+    def __get_cached_languages(
+        self, rows: List[List[str]]
+    ) -> Tuple[List[Optional[str]], List[str]]:
+        """
+        Returns the cached language of each row (None if it has to be
+        classified) and the texts that have to be classified, in order
+        """
+        languages = []
+        texts_to_classify = []
+        for row in rows:
+            text = row[self._column_number_to_use]
+            language = None
+            if self._language_cache is not None:
+                language = self._language_cache.get(text)
+
+            if language is None:
+                texts_to_classify.append(text)
+            languages.append(language)
+
+        return languages, texts_to_classify
 
-        self._middleware.ack(delivery_tag)
+    def __send_rows_in_language(
+        self,
+        rows: List[List[str]],
+        languages: List[Optional[str]],
+        classified_languages: List[str],
+    ):
+        classified_languages = iter(classified_languages)
+        for row, language in zip(rows, languages):
+            if language is None:
+                language = next(classified_languages)
+                if self._language_cache is not None:
+                    self._language_cache.put(row[self._column_number_to_use], language)
+
+            if language == self._language:
+                self.__send_message(row)
+
+        for combined_row, queue_name in self._combiner.drain():
+            self._middleware.publish(combined_row, queue_name)
+
+    def __filter_language(self, rows: List[List[str]]):
+        if not rows:
+            return
+
+        languages, texts_to_classify = self.__get_cached_languages(rows)
+        if self._language_pool is not None and texts_to_classify:
+            classified_languages = self._language_pool.submit(
+                _classify_languages, texts_to_classify
+            ).result()
+        else:
+            classified_languages = self._language_detector.classify_many(
+                texts_to_classify
+            )
 
-    def __filter_language(self, body: List[str]):
-        column_to_use = body[self._column_number_to_use]
-        detected_language, _ = langid.classify(column_to_use)
-        if detected_language == self._language.lower():
-            self.__send_message(body)
+        self.__send_rows_in_language(rows, languages, classified_languages)
 
     def __filter_columns(self, data: List[str]):
         # No filter needed
@@ -250,11 +447,24 @@ class FilterByLanguage:
 
             queue_to_send_to = f"{node_id}_{queue_name}"
 
+            if queue_name in self._combined_queues:
+                self._combiner.add(message, queue_to_send_to)
+                continue
+
             logging.debug(f"Sending message: {message} to queue: {queue_to_send_to}")
             # TODO: Use batches here?
             self._middleware.publish(message, queue_to_send_to)
 
+    def __forget_semi_join_client(self, client_id: str):
+        if self._semi_join is not None:
+            self._semi_join.remove_client(client_id)
+
     def __signal_handler(self, sig, frame):
+        if os.getpid() != self._pid:
+            # A worker that didn't run _init_language_worker yet, the
+            # middleware connection belongs to the node
+            return
+
         logging.debug("Gracefully shutting down...")
         self._middleware.shutdown()
         self._client_monitor.stop()
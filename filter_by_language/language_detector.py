@@ -0,0 +1,131 @@
+import hashlib
+import re
+from typing import *
+
+import langid
+
+# Returned for texts that can't be in a Latin script language, it never
+# matches a language of langid
+UNDETERMINED_LANGUAGE = "und"
+
+# Languages of langid written in Latin script
+LATIN_SCRIPT_LANGUAGES = {
+    "af", "an", "az", "br", "bs", "ca", "cs", "cy", "da", "de", "en", "eo",
+    "es", "et", "eu", "fi", "fo", "fr", "ga", "gl", "hr", "ht", "hu", "id",
+    "is", "it", "jv", "ku", "la", "lb", "lt", "lv", "mg", "ms", "mt", "nb",
+    "nl", "nn", "no", "oc", "pl", "pt", "qu", "ro", "rw", "sk", "sl", "sq",
+    "sv", "sw", "tl", "tr", "vi", "vo", "wa", "xh", "zu",
+}
+
+# Any unicode letter / Latin letters (ASCII, Latin-1 and Latin Extended A/B)
+LETTER_REGEX = re.compile(r"[^\W\d_]")
+LATIN_LETTER_REGEX = re.compile(r"[A-Za-zÀ-ÖØ-öø-ɏ]")
+
+
+class LanguageDetector:
+    """
+    Staged language detection, langid.classify is only called when the cheap
+    stages can't decide:
+
+    1) With fast_path, texts are scanned (one regex pass, in C) for letters.
+       Texts with at most tiny_text_max_letters letters (empty ones, scores,
+       emojis...) are always tiny_text_language. If the target language is
+       written in Latin script, texts with letters but no Latin ones are
+       UNDETERMINED_LANGUAGE without running langid.
+    2) With max_chars > 0 langid only sees the first max_chars characters
+       (cut at a whitespace), its cost is linear in the text length.
+    3) With candidate_languages, langid only chooses among them.
+
+    With the defaults it behaves exactly like langid.classify.
+    """
+
+    def __init__(
+        self,
+        target_language: str,
+        fast_path: bool = False,
+        tiny_text_max_letters: int = 0,
+        tiny_text_language: str = "en",
+        max_chars: int = 0,
+        candidate_languages: Optional[List[str]] = None,
+    ):
+        self._fast_path = fast_path
+        self._reject_non_latin = target_language.lower() in LATIN_SCRIPT_LANGUAGES
+        self._tiny_text_max_letters = tiny_text_max_letters
+        self._tiny_text_language = tiny_text_language
+        self._max_chars = max_chars
+        self._candidate_languages = sorted(candidate_languages or [])
+
+        if candidate_languages:
+            # Global for the langid module, it's inherited by the forked workers
+            langid.set_languages(candidate_languages)
+
+        # Stats
+        self.tiny_texts = 0
+        self.non_latin_texts = 0
+        self.truncated_texts = 0
+        self.langid_calls = 0
+
+    def fingerprint(self) -> str:
+        """
+        Short hash of the settings that can change the detected language, for
+        caches that outlive the process
+        """
+        settings = [
+            self._fast_path,
+            self._reject_non_latin,
+            self._tiny_text_max_letters,
+            self._tiny_text_language,
+            self._max_chars,
+            ",".join(self._candidate_languages),
+            getattr(langid, "__version__", ""),
+        ]
+        return hashlib.blake2b(repr(settings).encode(), digest_size=6).hexdigest()
+
+    def classify(self, text: str) -> str:
+        if self._fast_path:
+            language = self.__pre_classify(text)
+            if language is not None:
+                return language
+
+        if self._max_chars > 0 and len(text) > self._max_chars:
+            self.truncated_texts += 1
+            text = self.__truncate(text)
+
+        self.langid_calls += 1
+        language, _ = langid.classify(text)
+        return language
+
+    def classify_many(self, texts: List[str]) -> List[str]:
+        return [self.classify(text) for text in texts]
+
+    def __pre_classify(self, text: str) -> Optional[str]:
+        letters = 0
+        for _ in LETTER_REGEX.finditer(text):
+            letters += 1
+            if letters > self._tiny_text_max_letters:
+                break
+
+        if letters <= self._tiny_text_max_letters:
+            self.tiny_texts += 1
+            return self._tiny_text_language
+
+        if self._reject_non_latin and LATIN_LETTER_REGEX.search(text) is None:
+            self.non_latin_texts += 1
+            return UNDETERMINED_LANGUAGE
+
+        return None
+
+    def __truncate(self, text: str) -> str:
+        prefix = text[: self._max_chars]
+        last_space = prefix.rfind(" ")
+        # Si no hay espacios (o esta muy al principio) se corta en el medio de la palabra
+        if last_space > self._max_chars // 2:
+            return prefix[:last_space]
+
+        return prefix
+
+    def stats(self) -> str:
+        return (
+            f"tiny: {self.tiny_texts} | non latin: {self.non_latin_texts} | "
+            f"truncated: {self.truncated_texts} | langid calls: {self.langid_calls}"
+        )
@@ -69,6 +69,16 @@ def get_config():
         ]
         config_params["AMOUNT_OF_FORWARDING_QUEUES"] = amount_of_forwarding_queues
 
+        # Forwarding queues (of FORWARDING_QUEUE_NAMES) that go to a counter, the
+        # rows of each delivery are sent as [client_id, msg_id_ranges, key]
+        combined_queues_env_var = os.getenv(
+            "COMBINED_FORWARDING_QUEUES",
+            config["DEFAULT"]["COMBINED_FORWARDING_QUEUES"],
+        )
+        config_params["COMBINED_FORWARDING_QUEUES"] = [
+            queue_name for queue_name in combined_queues_env_var.split(",") if queue_name
+        ]
+
         config_params["BATCH_SIZE"] = int(
             os.getenv(
                 "BATCH_SIZE",
@@ -83,6 +93,117 @@ def get_config():
             )
         )
 
+        config_params["MAX_BATCH_BYTES"] = int(
+            os.getenv(
+                "MAX_BATCH_BYTES",
+                config["DEFAULT"]["MAX_BATCH_BYTES"],
+            )
+        )
+
+        config_params["BATCH_LINGER_MS"] = int(
+            os.getenv(
+                "BATCH_LINGER_MS",
+                config["DEFAULT"]["BATCH_LINGER_MS"],
+            )
+        )
+
+        config_params["SESSION_DICTIONARY_BATCHES"] = (
+            os.getenv(
+                "SESSION_DICTIONARY_BATCHES",
+                config["DEFAULT"]["SESSION_DICTIONARY_BATCHES"],
+            ).lower()
+            == "true"
+        )
+
+        config_params["PUBLISHER_CONFIRMS"] = (
+            os.getenv(
+                "PUBLISHER_CONFIRMS",
+                config["DEFAULT"]["PUBLISHER_CONFIRMS"],
+            ).lower()
+            == "true"
+        )
+
+        config_params["CONFIRM_WINDOW"] = int(
+            os.getenv(
+                "CONFIRM_WINDOW",
+                config["DEFAULT"]["CONFIRM_WINDOW"],
+            )
+        )
+
+        config_params["ACK_EVERY"] = int(
+            os.getenv(
+                "ACK_EVERY",
+                config["DEFAULT"]["ACK_EVERY"],
+            )
+        )
+
+        config_params["ACK_LINGER_MS"] = int(
+            os.getenv(
+                "ACK_LINGER_MS",
+                config["DEFAULT"]["ACK_LINGER_MS"],
+            )
+        )
+
+        config_params["LANGUAGE_WORKERS"] = int(
+            os.getenv(
+                "LANGUAGE_WORKERS",
+                config["DEFAULT"]["LANGUAGE_WORKERS"],
+            )
+        )
+
+        # Language detection stages
+        config_params["LANGUAGE_FAST_PATH"] = (
+            os.getenv(
+                "LANGUAGE_FAST_PATH",
+                config["DEFAULT"]["LANGUAGE_FAST_PATH"],
+            ).lower()
+            == "true"
+        )
+
+        config_params["TINY_TEXT_MAX_LETTERS"] = int(
+            os.getenv(
+                "TINY_TEXT_MAX_LETTERS",
+                config["DEFAULT"]["TINY_TEXT_MAX_LETTERS"],
+            )
+        )
+
+        config_params["TINY_TEXT_LANGUAGE"] = os.getenv(
+            "TINY_TEXT_LANGUAGE",
+            config["DEFAULT"]["TINY_TEXT_LANGUAGE"],
+        )
+
+        config_params["LANGUAGE_MAX_CHARS"] = int(
+            os.getenv(
+                "LANGUAGE_MAX_CHARS",
+                config["DEFAULT"]["LANGUAGE_MAX_CHARS"],
+            )
+        )
+
+        language_candidates_env_var = os.getenv(
+            "LANGUAGE_CANDIDATES",
+            config["DEFAULT"]["LANGUAGE_CANDIDATES"],
+        )
+        config_params["LANGUAGE_CANDIDATES"] = [
+            language for language in language_candidates_env_var.split(",") if language
+        ]
+
+        config_params["LANGUAGE_CACHE_SIZE"] = int(
+            os.getenv(
+                "LANGUAGE_CACHE_SIZE",
+                config["DEFAULT"]["LANGUAGE_CACHE_SIZE"],
+            )
+        )
+
+        config_params["LANGUAGE_CACHE_PATH"] = os.getenv(
+            "LANGUAGE_CACHE_PATH",
+            config["DEFAULT"]["LANGUAGE_CACHE_PATH"],
+        )
+
+        config_params["SEMI_JOIN_FILTER"] = os.getenv(
+            "SEMI_JOIN_FILTER",
+            config["DEFAULT"]["SEMI_JOIN_FILTER"],
+        )
+
         # # Monitor
         config_params["WATCHDOGS_IP"] = os.getenv("WATCHDOGS_IP").split(",")
 
@@ -123,7 +244,14 @@ def main():
         config["RABBIT_IP"],
         prefetch_count=config["PREFETCH_COUNT"],
         batch_size=config["BATCH_SIZE"],
-        use_logging=True
+        use_logging=True,
+        max_batch_bytes=config["MAX_BATCH_BYTES"],
+        linger_ms=config["BATCH_LINGER_MS"],
+        session_dictionary_batches=config["SESSION_DICTIONARY_BATCHES"],
+        publisher_confirms=config["PUBLISHER_CONFIRMS"],
+        confirm_window=config["CONFIRM_WINDOW"],
+        ack_every=config["ACK_EVERY"],
+        ack_linger_ms=config["ACK_LINGER_MS"],
     )
     config.pop("RABBIT_IP", None)
     config.pop("LOGGING_LEVEL", None)
@@ -35,17 +35,42 @@ Q4_AMOUNT_OF_NEGATIVE_REVIEWS_FILTERS = 3
 Q4_AMOUNT_OF_FIRST_COUNTER_BY_APP_ID = 8
 Q4_AMOUNT_OF_SECOND_COUNTER_BY_APP_ID = 4
 Q4_AMOUNT_OF_ENGLISH_REVIEWS_FILTERS = 3
+Q4_ENGLISH_REVIEWS_FILTER_LANGUAGE_WORKERS = 4  # Processes per filter running langid
 Q4_AMOUNT_OF_FIRST_MORE_THAN_5000_FILTERS = 3
 Q4_AMOUNT_OF_SECOND_MORE_THAN_5000_FILTERS = 3
 Q4_AMOUNT_OF_FIRST_JOINS = 5
 Q4_AMOUNT_OF_SECOND_JOINS = 5
-Q4_AMOUNT_OF_THIRD_JOINS = 1  # TODO: NEEDS AGGREGATOR FOR SCALING THIS NODE
+Q4_AMOUNT_OF_THIRD_JOINS = 3
+# The action games are replicated to every third join (broadcast join), the
+# reviews stay hashed by app_id and the joins outputs meet at an aggregator
+Q4_THIRD_JOIN_BROADCAST = True
 # Q5
 Q5_AMOUNT_OF_ACTION_GAMES_FILTERS = 3
 Q5_AMOUNT_OF_NEGATIVE_REVIEWS_FILTERS = 3
 Q5_AMOUNT_OF_COUNTERS = 8
 Q5_AMOUNT_OF_JOINS = 3
 Q5_AMOUNT_OF_PERCENTILES = 1
+# Joins publish a Bloom filter of their games once all of them arrived, so the
+# reviews that can't be joined are dropped before the counters
+SEMI_JOIN_REDUCTION = True
+# Nodes before the counters send one row per (client_id, key) and delivery
+# with its msg_ids as ranges, instead of one row per msg_id
+COMBINE_BEFORE_COUNTERS = True
+# Filters and counters ack every ACK_EVERY deliveries with multiple=True. A
+# crash redelivers up to that many deliveries (ENDs included), 1 turns it off
+ACK_EVERY = 50
+# Filters and joins also send a batch before it exceeds MAX_BATCH_BYTES, or
+# BATCH_LINGER_MS after its first row (0 turns them off, as in the other nodes)
+MAX_BATCH_BYTES = 512 * 1024
+BATCH_LINGER_MS = 500
+
+
+def semi_join_filter(filter_name: str, amount_of_joins: int) -> str:
+    return f"{filter_name}:{amount_of_joins}" if SEMI_JOIN_REDUCTION else ""
+
+
+def combined_forwarding_queues(*queue_names: str) -> str:
+    return ",".join(queue_names) if COMBINE_BEFORE_COUNTERS else ""
 
 
 def create_file(output, file_name):
@@ -128,6 +153,10 @@ def add_drop_nulls(output: Dict, num: int, debug: bool):
             f"NODE_ID={num}",
             "COUNT_BY_PLATFORM_NODES=1",  # TODO: change when scaling
             f"INSTANCES_OF_MYSELF={AMOUNT_OF_DROP_NULLS}",
+            f"Q3_SEMI_JOIN_FILTER={semi_join_filter('q3', Q3_AMOUNT_OF_JOINS)}",
+            f"Q4_SEMI_JOIN_FILTER={semi_join_filter('q4', Q4_AMOUNT_OF_FIRST_JOINS)}",
+            f"Q5_SEMI_JOIN_FILTER={semi_join_filter('q5', Q5_AMOUNT_OF_JOINS)}",
+            f"COMBINE_PLATFORMS={COMBINE_BEFORE_COUNTERS}",
             f"LOGGING_LEVEL={'INFO' if not debug else 'DEBUG'}",
             f"WATCHDOG_PORT={WATCHDOG_PORT}",
             f"WATCHDOGS_IP={','.join([f'watchdog_{i}' for i in range(AMOUNT_OF_WATCHDOGS)])}",
@@ -159,6 +188,7 @@ def add_counter_by_platform(
             f"CONSUME_QUEUE_SUFIX={consume_queue_sufix}",
             f"PUBLISH_QUEUE={publish_queue}",
             f"LOGGING_LEVEL={'DEBUG' if debug else 'INFO'}",
+            f"ACK_EVERY={ACK_EVERY}",
             f"WATCHDOG_PORT={WATCHDOG_PORT}",
             f"WATCHDOGS_IP={','.join([f'watchdog_{i}' for i in range(AMOUNT_OF_WATCHDOGS)])}",
             f"NODE_NAME={f'{query}_counter{num}'}",
@@ -193,6 +223,7 @@ def add_counter_by_app_id(
             f"LOGGING_LEVEL={'INFO' if not debug else 'DEBUG'}",
             f"AMOUNT_OF_FORWARDING_QUEUES={amount_of_forwarding_queues}",
             f"NEEDED_ENDS={needed_ends}",
+            f"ACK_EVERY={ACK_EVERY}",
             f"WATCHDOG_PORT={WATCHDOG_PORT}",
             f"WATCHDOGS_IP={','.join([f'watchdog_{i}' for i in range(AMOUNT_OF_WATCHDOGS)])}",
             f"NODE_NAME={f'{query}_counter{num}'}",
@@ -286,6 +317,9 @@ def add_filter_by_language(
     node_names: list,
     batch_size: int = 10,
     prefetch_count=100,
+    semi_join_filter: str = "",
+    language_workers: int = 0,
+    combined_forwarding_queues: str = "",
 ):
     node_names.append(f"{query}_filter_{filter_name}{num}")
     output["services"][f"{query}_filter_{filter_name}{num}"] = {
@@ -303,6 +337,12 @@ def add_filter_by_language(
             f"INSTANCES_OF_MYSELF={instances_of_myself}",
             f"BATCH_SIZE={batch_size}",
             f"PREFETCH_COUNT={prefetch_count}",
+            f"SEMI_JOIN_FILTER={semi_join_filter}",
+            f"LANGUAGE_WORKERS={language_workers}",
+            f"COMBINED_FORWARDING_QUEUES={combined_forwarding_queues}",
+            f"ACK_EVERY={ACK_EVERY}",
+            f"MAX_BATCH_BYTES={MAX_BATCH_BYTES}",
+            f"BATCH_LINGER_MS={BATCH_LINGER_MS}",
             f"WATCHDOG_PORT={WATCHDOG_PORT}",
             f"WATCHDOGS_IP={','.join([f'watchdog_{i}' for i in range(AMOUNT_OF_WATCHDOGS)])}",
             f"NODE_NAME={f'{query}_filter_{filter_name}{num}'}",
@@ -331,6 +371,9 @@ def add_filter_by_value(
     node_names: list,
     batch_size: int = 10,
     prefetch_count=100,
+    semi_join_filter: str = "",
+    broadcast_forwarding_queues: str = "",
+    combined_forwarding_queues: str = "",
 ):
     node_names.append(f"{query}_filter_{filter_name}{num}")
     output["services"][f"{query}_filter_{filter_name}{num}"] = {
@@ -349,6 +392,12 @@ def add_filter_by_value(
             f"INSTANCES_OF_MYSELF={instances_of_myself}",
             f"BATCH_SIZE={batch_size}",
             f"PREFETCH_COUNT={prefetch_count}",
+            f"SEMI_JOIN_FILTER={semi_join_filter}",
+            f"BROADCAST_FORWARDING_QUEUES={broadcast_forwarding_queues}",
+            f"COMBINED_FORWARDING_QUEUES={combined_forwarding_queues}",
+            f"ACK_EVERY={ACK_EVERY}",
+            f"MAX_BATCH_BYTES={MAX_BATCH_BYTES}",
+            f"BATCH_LINGER_MS={BATCH_LINGER_MS}",
             f"WATCHDOG_PORT={WATCHDOG_PORT}",
             f"WATCHDOGS_IP={','.join([f'watchdog_{i}' for i in range(AMOUNT_OF_WATCHDOGS)])}",
             f"NODE_NAME={f'{query}_filter_{filter_name}{num}'}",
@@ -375,6 +424,7 @@ def add_join(
     debug: bool,
     instances_of_myself: int,
     node_names: list,
+    semi_join_filter: str = "",
 ):
     node_names.append(f"{query}_join{num}")
     output["services"][f"{query}_join{num}"] = {
@@ -392,6 +442,9 @@ def add_join(
             f"GAMES_COLUMNS_TO_KEEP={games_columns_to_keep}",
             f"REVIEWS_COLUMNS_TO_KEEP={reviews_columns_to_keep}",
             f"INSTANCES_OF_MYSELF={instances_of_myself}",
+            f"SEMI_JOIN_FILTER={semi_join_filter}",
+            f"MAX_BATCH_BYTES={MAX_BATCH_BYTES}",
+            f"BATCH_LINGER_MS={BATCH_LINGER_MS}",
             f"WATCHDOG_PORT={WATCHDOG_PORT}",
             f"WATCHDOGS_IP={','.join([f'watchdog_{i}' for i in range(AMOUNT_OF_WATCHDOGS)])}",
             f"NODE_NAME={f'{query}_join{num}'}",
@@ -403,6 +456,39 @@ def add_join(
     }
 
 
+def add_join_aggregator(
+    output: Dict,
+    query: str,
+    num: int,
+    input_queue_name: str,
+    output_queue_name: str,
+    amount_of_joins: int,
+    debug: bool,
+    node_names: list,
+):
+    node_names.append(f"{query}_join_aggregator{num}")
+    output["services"][f"{query}_join_aggregator{num}"] = {
+        "container_name": f"{query}_join_aggregator{num}",
+        "image": "join_aggregator:latest",
+        "environment": [
+            f"NODE_ID={num}",
+            f"INPUT_QUEUE_NAME={input_queue_name}",
+            f"OUTPUT_QUEUE_NAME={output_queue_name}",
+            f"AMOUNT_OF_JOINS={amount_of_joins}",
+            f"LOGGING_LEVEL={'INFO' if not debug else 'DEBUG'}",
+            f"MAX_BATCH_BYTES={MAX_BATCH_BYTES}",
+            f"BATCH_LINGER_MS={BATCH_LINGER_MS}",
+            f"WATCHDOG_PORT={WATCHDOG_PORT}",
+            f"WATCHDOGS_IP={','.join([f'watchdog_{i}' for i in range(AMOUNT_OF_WATCHDOGS)])}",
+            f"NODE_NAME={f'{query}_join_aggregator{num}'}",
+            f"LEADER_DISCOVERY_PORT={LEADER_DISCOVERY_PORT}",
+        ],
+        "depends_on": {"rabbitmq": {"condition": "service_healthy"}},
+        "networks": ["net"],
+        "restart": "on-failure",
+    }
+
+
 def add_percentile(
     output: Dict,
     query: str,
@@ -705,6 +791,8 @@ def generate_q3(node_names: list, output: Dict, debug=False):
         "criteria": "EQUAL_FLOAT",
         "columns_to_keep": "0,1,2",  # client_id, app_id, msg_id
         "instances_of_myself": Q3_AMOUNT_OF_POSITIVE_REVIEWS_FILTERS,
+        "semi_join_filter": semi_join_filter("q3", Q3_AMOUNT_OF_JOINS),
+        "combined_forwarding_queues": combined_forwarding_queues("q3_positive_reviews"),
     }
     generate_filters_by_value(
         Q3_AMOUNT_OF_POSITIVE_REVIEWS_FILTERS,
@@ -739,6 +827,7 @@ def generate_q3(node_names: list, output: Dict, debug=False):
         "needed_games_ends": 1,
         "needed_reviews_ends": Q3_AMOUNT_OF_COUNTERS_BY_APP_ID,
         "amount_of_forwarding_queues": Q3_AMOUNT_OF_TOP_K_NODES,
+        "semi_join_filter": "q3" if SEMI_JOIN_REDUCTION else "",
     }
     # See handle_reviews in join to see that client_id is not needed in reviews/games_columns_to_keep
 
@@ -927,6 +1016,9 @@ def generate_q4(node_names: list, output: Dict, debug=False):
         "criteria": "CONTAINS",
         "columns_to_keep": "0,1,2,3",  # client_id, msg_id, app_id, name
         "instances_of_myself": Q4_AMOUNT_OF_ACTION_GAMES_FILTERS,
+        "broadcast_forwarding_queues": (
+            "q4_action_games_for_join2" if Q4_THIRD_JOIN_BROADCAST else ""
+        ),
     }
 
     generate_filters_by_value(
@@ -955,6 +1047,12 @@ def generate_q4(node_names: list, output: Dict, debug=False):
         "criteria": "EQUAL_FLOAT",
         "columns_to_keep": "0,1,2,3",  # client_id, msg_id, app_id, review
         "instances_of_myself": Q4_AMOUNT_OF_NEGATIVE_REVIEWS_FILTERS,
+        # Both outputs only matter for action games (games of the first join)
+        "semi_join_filter": semi_join_filter("q4", Q4_AMOUNT_OF_FIRST_JOINS),
+        # Only the counter, the join needs the review
+        "combined_forwarding_queues": combined_forwarding_queues(
+            "q4_negative_reviews_for_counter0"
+        ),
         # "batch_size": ,
     }
 
@@ -1011,6 +1109,7 @@ def generate_q4(node_names: list, output: Dict, debug=False):
         "amount_of_forwarding_queues": Q4_AMOUNT_OF_SECOND_JOINS,
         "games_columns_to_keep": "1,2",  # app_id, name
         "reviews_columns_to_keep": "",
+        "semi_join_filter": "q4" if SEMI_JOIN_REDUCTION else "",
     }
 
     generate_joins(
@@ -1064,7 +1163,10 @@ def generate_q4(node_names: list, output: Dict, debug=False):
         "language": "en",
         "columns_to_keep": "0,1,2",  # client_id, msg_id, app_id
         "instances_of_myself": Q4_AMOUNT_OF_ENGLISH_REVIEWS_FILTERS,
-        "prefetch_count": 1,
+        # Enough deliveries in flight to keep every language worker busy
+        "prefetch_count": max(1, 2 * Q4_ENGLISH_REVIEWS_FILTER_LANGUAGE_WORKERS),
+        "language_workers": Q4_ENGLISH_REVIEWS_FILTER_LANGUAGE_WORKERS,
+        "combined_forwarding_queues": combined_forwarding_queues("q4_english_reviews"),
     }
 
     generate_filters_by_language(
@@ -1114,7 +1216,8 @@ def generate_q4(node_names: list, output: Dict, debug=False):
         "query": "q4_third",
         "input_games_queue_name": "q4_action_games_for_join2",
         "input_reviews_queue_name": "q4_second_filter_more_than_5000",
-        "output_queue_name": "Q4",
+        # A single END has to reach the client handler, the aggregator waits for all of them
+        "output_queue_name": "q4_third_join",
         # Counter followed by filter breaks filter algorithm,
         # now filters sends as many ENDs as instances of itself there are
         "needed_games_ends": 1,  # Q4_AMOUNT_OF_ACTION_GAMES_FILTERS,
@@ -1131,6 +1234,17 @@ def generate_q4(node_names: list, output: Dict, debug=False):
         **q4_third_join_args,
     )
 
+    add_join_aggregator(
+        output=output,
+        query="q4_third",
+        num=0,
+        input_queue_name="0_q4_third_join",
+        output_queue_name="Q4",
+        amount_of_joins=Q4_AMOUNT_OF_THIRD_JOINS,
+        debug=debug,
+        node_names=node_names,
+    )
+
     # add_join(
     #     output=output,
     #     query="q4",
@@ -1178,6 +1292,8 @@ def generate_q5(node_names: list, output: Dict, debug=False):
         "criteria": "EQUAL_FLOAT",
         "columns_to_keep": "0,1,2",  # client_id, msg_id, app_id,
         "instances_of_myself": Q5_AMOUNT_OF_NEGATIVE_REVIEWS_FILTERS,
+        "semi_join_filter": semi_join_filter("q5", Q5_AMOUNT_OF_JOINS),
+        "combined_forwarding_queues": combined_forwarding_queues("q5_negative_reviews"),
     }
     generate_filters_by_value(
         Q5_AMOUNT_OF_NEGATIVE_REVIEWS_FILTERS,
@@ -1214,6 +1330,7 @@ def generate_q5(node_names: list, output: Dict, debug=False):
         # TODO: esto se tiene que cambiar para que coincida con los demas nodos
         "games_columns_to_keep": "2",  # client_id, msg_id, app_id, name -> NO TENER EN CUENTA EL CLIENT ID PARA EL NUM
         "reviews_columns_to_keep": "2",  # client_id, msg_id, count -> IDEM ARRIBA
+        "semi_join_filter": "q5" if SEMI_JOIN_REDUCTION else "",
     }
 
     generate_joins(
@@ -0,0 +1,276 @@
+import logging
+import os
+import shutil
+from collections import OrderedDict
+from typing import *
+
+from common.protocol.protocol import Protocol
+from common.storage.storage import read_partitions
+from utils.utils import group_batch_by_field
+
+# Games are stored as [MSG_ID, APP_ID, ...]
+GAME_MSG_ID_INDEX = 0
+GAME_APP_ID_INDEX = 1
+
+SPILL_DIR_NAME = "spill"
+
+
+class GamesIndex:
+    """
+    Build side of a hybrid hash join over the stored games of each client,
+    grouped by partition (same partitions as the files, app_id // partition_range).
+
+    Partitions are kept resident as hash tables ({app_id: {msg_id: game}}) while
+    the games in memory fit in max_games_in_memory. Past that, the biggest
+    resident partition is evicted to <client>/spill/partition_<n>.bin (rows
+    encoded with Protocol.encode_many) and its later games are appended there.
+    A spilled partition is read back whole when probed. The ones read are
+    kept in an LRU of up to max_loaded_spilled_games games, so the probes of
+    EAGER_JOIN (in app_id order, not partition order) don't read the same
+    spill again for every review. The partition by partition replay at END
+    needs a single one.
+
+    The csv partition files are still the source of truth. Spills are only a
+    cache of them, they are discarded and rebuilt when a client is loaded
+    after a restart.
+    """
+
+    def __init__(
+        self,
+        games_dir: str,
+        partition_range: int,
+        max_games_in_memory: int,
+        max_loaded_spilled_games: int = 0,
+    ):
+        self._games_dir = games_dir
+        self._partition_range = partition_range
+        self._max_games_in_memory = max_games_in_memory
+        self._max_loaded_spilled_games = max_loaded_spilled_games
+
+        # client_id -> partition -> app_id -> msg_id -> game
+        self._resident: Dict[str, Dict[int, Dict[int, Dict[str, List[str]]]]] = {}
+        # (client_id, partition) -> (amount of games, estimated bytes)
+        self._resident_sizes: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        self._spilled: Dict[str, Set[int]] = {}
+        self._games_in_memory = 0
+        self._bytes_in_memory = 0
+
+        # Particiones spilleadas leidas, de la menos a la mas usada:
+        # (client_id, partition) -> (amount of games, app_id -> msg_id -> game)
+        self._loaded_spills: OrderedDict[
+            Tuple[str, int], Tuple[int, Dict[int, Dict[str, List[str]]]]
+        ] = OrderedDict()
+        self._loaded_spilled_games = 0
+
+        # Stats
+        self._spilled_bytes = 0
+        self._spill_bytes_read = 0
+        self._probes = 0
+        self._probe_hits = 0
+
+    def _client_dir(self, client_id: str) -> str:
+        return os.path.join(self._games_dir, client_id)
+
+    def _spill_path(self, client_id: str, partition: int) -> str:
+        return os.path.join(
+            self._client_dir(client_id), SPILL_DIR_NAME, f"partition_{partition}.bin"
+        )
+
+    def partition_of(self, app_id: int) -> int:
+        return app_id // self._partition_range
+
+    def __load(self, client_id: str):
+        if client_id in self._resident:
+            return
+
+        self._resident[client_id] = {}
+        self._spilled[client_id] = set()
+
+        # Spills of a previous run may be incomplete, they are rebuilt from the csvs
+        spill_dir = os.path.join(self._client_dir(client_id), SPILL_DIR_NAME)
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+        amount_of_games = 0
+        for partition, games in read_partitions(self._client_dir(client_id)):
+            games = list(games)
+            amount_of_games += len(games)
+            self.__add_to_partition(client_id, partition, games)
+
+        if amount_of_games > 0:
+            logging.debug(f"Loaded {amount_of_games} games of client {client_id}")
+
+    def __add_to_partition(self, client_id: str, partition: int, games: List[List[str]]):
+        if partition in self._spilled[client_id]:
+            self.__append_to_spill(client_id, partition, games)
+            return
+
+        partition_games = self._resident[client_id].setdefault(partition, {})
+        amount, size = self._resident_sizes.get((client_id, partition), (0, 0))
+        for game in games:
+            games_with_app_id = partition_games.setdefault(int(game[GAME_APP_ID_INDEX]), {})
+            if game[GAME_MSG_ID_INDEX] in games_with_app_id:
+                # Already indexed (duplicated batch)
+                continue
+
+            games_with_app_id[game[GAME_MSG_ID_INDEX]] = game
+            game_size = sum(len(field) for field in game)
+            amount += 1
+            size += game_size
+            self._games_in_memory += 1
+            self._bytes_in_memory += game_size
+
+        self._resident_sizes[(client_id, partition)] = (amount, size)
+
+        while self._games_in_memory > self._max_games_in_memory and self._resident_sizes:
+            self.__evict_biggest_partition()
+
+    def __evict_biggest_partition(self):
+        client_id, partition = max(
+            self._resident_sizes, key=lambda key: self._resident_sizes[key][0]
+        )
+        amount, size = self._resident_sizes.pop((client_id, partition))
+        partition_games = self._resident[client_id].pop(partition)
+        self._games_in_memory -= amount
+        self._bytes_in_memory -= size
+
+        games = [
+            game
+            for games_with_app_id in partition_games.values()
+            for game in games_with_app_id.values()
+        ]
+        self._spilled[client_id].add(partition)
+        self.__append_to_spill(client_id, partition, games)
+        logging.info(
+            f"Spilled partition {partition} of client {client_id} ({amount} games) to disk"
+        )
+
+    def __append_to_spill(self, client_id: str, partition: int, games: List[List[str]]):
+        spill_path = self._spill_path(client_id, partition)
+        os.makedirs(os.path.dirname(spill_path), exist_ok=True)
+
+        encoded_games = Protocol.encode_many(games)
+        with open(spill_path, "ab") as spill:
+            spill.write(encoded_games)
+        self._spilled_bytes += len(encoded_games)
+        self.__unload_spill((client_id, partition))
+
+    def __read_spill(self, client_id: str, partition: int) -> Dict[int, Dict[str, List[str]]]:
+        loaded_spill = self._loaded_spills.get((client_id, partition))
+        if loaded_spill is not None:
+            self._loaded_spills.move_to_end((client_id, partition))
+            return loaded_spill[1]
+
+        with open(self._spill_path(client_id, partition), "rb") as spill:
+            data = spill.read()
+        self._spill_bytes_read += len(data)
+
+        partition_games = {}
+        amount = 0
+        for game in Protocol.decode_batch(data):
+            games_with_app_id = partition_games.setdefault(int(game[GAME_APP_ID_INDEX]), {})
+            games_with_app_id[game[GAME_MSG_ID_INDEX]] = game
+            amount += 1
+
+        # The one just read is kept even if it's bigger than the limit
+        while (
+            self._loaded_spills
+            and self._loaded_spilled_games + amount > self._max_loaded_spilled_games
+        ):
+            self.__unload_spill(next(iter(self._loaded_spills)))
+
+        self._loaded_spills[(client_id, partition)] = (amount, partition_games)
+        self._loaded_spilled_games += amount
+        return partition_games
+
+    def __unload_spill(self, key: Tuple[str, int]):
+        loaded_spill = self._loaded_spills.pop(key, None)
+        if loaded_spill is not None:
+            self._loaded_spilled_games -= loaded_spill[0]
+
+    def __get_partition(self, client_id: str, partition: int) -> Dict[int, Dict[str, List[str]]]:
+        self.__load(client_id)
+
+        if partition in self._spilled[client_id]:
+            return self.__read_spill(client_id, partition)
+
+        return self._resident[client_id].get(partition, {})
+
+    def add_batch_per_client(self, records: List[List[str]]):
+        """
+        Records need to have the following format (same as the games input):
+
+            [[CLIENT_ID, MSG_ID, APP_ID, ...], ...]
+
+        They have to be already stored on the partition files.
+        """
+        for client_id, games in group_batch_by_field(records).items():
+            self.__load(client_id)
+
+            games_per_partition = {}
+            for game in games:
+                partition = self.partition_of(int(game[GAME_APP_ID_INDEX]))
+                games_per_partition.setdefault(partition, []).append(game)
+
+            for partition, partition_games in games_per_partition.items():
+                self.__add_to_partition(client_id, partition, partition_games)
+
+    def has_partition(self, client_id: str, partition: int) -> bool:
+        self.__load(client_id)
+
+        return (
+            partition in self._spilled[client_id]
+            or partition in self._resident[client_id]
+        )
+
+    def get_games(self, client_id: str, app_id: int) -> List[List[str]]:
+        """
+        Returns every stored game of the client with the given app_id
+        """
+        games = self.__get_partition(client_id, self.partition_of(app_id)).get(app_id)
+
+        self._probes += 1
+        if not games:
+            return []
+
+        self._probe_hits += 1
+        return list(games.values())
+
+    def get_app_ids(self, client_id: str) -> Set[str]:
+        """
+        Returns the app_ids of every stored game of the client
+        """
+        self.__load(client_id)
+
+        app_ids = set()
+        for partition in list(self._resident[client_id]) + list(self._spilled[client_id]):
+            app_ids.update(
+                str(app_id) for app_id in self.__get_partition(client_id, partition)
+            )
+
+        return app_ids
+
+    def log_stats(self, client_id: str):
+        hit_rate = self._probe_hits / self._probes if self._probes else 0
+        logging.info(
+            f"[JOIN STATS] client {client_id} | "
+            f"resident partitions: {len(self._resident.get(client_id, {}))} | "
+            f"spilled partitions: {len(self._spilled.get(client_id, set()))} | "
+            f"games in memory: {self._games_in_memory} (~{self._bytes_in_memory} bytes) | "
+            f"spilled bytes: {self._spilled_bytes} | spill bytes read: {self._spill_bytes_read} | "
+            f"loaded spilled games: {self._loaded_spilled_games} | "
+            f"probe hit rate: {hit_rate:.2%} ({self._probe_hits}/{self._probes})"
+        )
+
+    def remove_client(self, client_id: str):
+        """
+        Removes the in memory state of the client, spills are removed along
+        with the client games dir
+        """
+        for partition in self._resident.pop(client_id, {}):
+            amount, size = self._resident_sizes.pop((client_id, partition), (0, 0))
+            self._games_in_memory -= amount
+            self._bytes_in_memory -= size
+
+        self._spilled.pop(client_id, None)
+        for key in [key for key in self._loaded_spills if key[0] == client_id]:
+            self.__unload_spill(key)
@@ -0,0 +1,86 @@
+import shutil
+import unittest
+
+from join.games_index import GamesIndex
+
+TEST_DIR = "tmp_games_index"
+PARTITION_RANGE = 10
+
+
+def games(client_id: str, app_ids: range):
+    # [CLIENT_ID, MSG_ID, APP_ID, NAME], the index keeps them without the client_id
+    return [[client_id, str(app_id), str(app_id), f"game {app_id}"] for app_id in app_ids]
+
+
+def stored_game(app_id: int):
+    return [str(app_id), str(app_id), f"game {app_id}"]
+
+
+class GamesIndexTests(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_01_spilled_partitions_are_probed_like_resident_ones(self):
+        index = GamesIndex(TEST_DIR, PARTITION_RANGE, max_games_in_memory=10)
+        index.add_batch_per_client(games("1", range(30)))
+
+        for app_id in range(30):
+            self.assertEqual(index.get_games("1", app_id), [stored_game(app_id)])
+        self.assertEqual(index.get_games("1", 99), [])
+        self.assertEqual(index.get_app_ids("1"), {str(app_id) for app_id in range(30)})
+
+    def test_02_probes_across_spilled_partitions_read_each_spill_once(self):
+        index = GamesIndex(
+            TEST_DIR, PARTITION_RANGE, max_games_in_memory=10, max_loaded_spilled_games=30
+        )
+        index.add_batch_per_client(games("1", range(30)))
+        index.get_app_ids("1")
+        bytes_read = index._spill_bytes_read
+
+        # Probes of EAGER_JOIN alternate between partitions
+        for _ in range(5):
+            for app_id in [1, 11, 21]:
+                index.get_games("1", app_id)
+
+        self.assertEqual(index._spill_bytes_read, bytes_read)
+
+    def test_03_least_recently_probed_spill_is_unloaded(self):
+        index = GamesIndex(
+            TEST_DIR, PARTITION_RANGE, max_games_in_memory=10, max_loaded_spilled_games=10
+        )
+        index.add_batch_per_client(games("1", range(30)))
+        index.get_games("1", 1)
+        index.get_games("1", 11)
+        bytes_read = index._spill_bytes_read
+
+        index.get_games("1", 11)
+        self.assertEqual(index._spill_bytes_read, bytes_read)
+        index.get_games("1", 1)
+        self.assertGreater(index._spill_bytes_read, bytes_read)
+        self.assertLessEqual(index._loaded_spilled_games, 10)
+
+    def test_04_games_appended_to_a_loaded_spill_are_found(self):
+        index = GamesIndex(
+            TEST_DIR, PARTITION_RANGE, max_games_in_memory=10, max_loaded_spilled_games=30
+        )
+        index.add_batch_per_client(games("1", range(25)))
+        self.assertEqual(index.get_games("1", 25), [])
+
+        index.add_batch_per_client(games("1", range(25, 30)))
+
+        self.assertEqual(index.get_games("1", 25), [stored_game(25)])
+
+    def test_05_removed_clients_free_their_loaded_spills(self):
+        index = GamesIndex(
+            TEST_DIR, PARTITION_RANGE, max_games_in_memory=10, max_loaded_spilled_games=30
+        )
+        index.add_batch_per_client(games("1", range(30)))
+        index.get_app_ids("1")
+
+        index.remove_client("1")
+
+        self.assertEqual(index._loaded_spilled_games, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,13 +10,14 @@ from common.storage.storage import (
     _write_batch_by_range,
     delete_directory,
     read,
-    read_all_files,
-    read_by_range,
+    read_partitions,
     write_batch_by_range_per_client,
 )
 from common.activity_log.activity_log import ActivityLog
-from utils.utils import node_id_to_send_to
+from utils.utils import derive_msg_id, node_id_to_send_to
 from common.watchdog_client.watchdog_client import WatchdogClient
+from common.semi_join.semi_join import publish_semi_join_filter, semi_join_exchange
+from join.games_index import GamesIndex
 
 
 REGULAR_MESSAGE_CLIENT_ID_INDEX = 0 
@@ -60,10 +61,19 @@ class Join:
         self._reviews_columns_to_keep = config["REVIEWS_COLUMNS_TO_KEEP"]
         self._needed_timeouts = self._needed_games_ends + self._needed_reviews_ends
         self._node_id = config["NODE_ID"]
+        self._eager_join = config["EAGER_JOIN"]
+        self._semi_join_filter = config["SEMI_JOIN_FILTER"]
+        self._semi_join_false_positive_rate = config["SEMI_JOIN_FALSE_POSITIVE_RATE"]
 
         self._activity_log = activity_log
         self._games_dir = "tmp_games/"
         self._reviews_dir = "tmp_reviews/"
+        self._games_index = GamesIndex(
+            self._games_dir,
+            int(self._partition_range),
+            config["MAX_GAMES_IN_MEMORY"],
+            config["MAX_LOADED_SPILLED_GAMES"],
+        )
 
         self._amount_of_games_ends_recived, self._amount_of_reviews_ends_recived = (
             self._activity_log.recover_ends_state()
@@ -125,6 +135,9 @@ class Join:
         else:
             self.__middleware.create_queue(self._output_queue_name)
 
+        if self._semi_join_filter:
+            self.__middleware.create_exchange(semi_join_exchange(self._semi_join_filter))
+
         # callback, inputq, outputq
         games_callback = self.__middleware.generate_callback(
             self.__games_callback, self._input_games_queue_name, self._output_queue_name
@@ -215,6 +228,7 @@ class Join:
                 body, 
                 REGULAR_MESSAGE_APP_ID_INDEX
             )
+            self._games_index.add_batch_per_client(body)
 
         except ValueError as e:
             logging.error(
@@ -242,6 +256,9 @@ class Join:
             )
         )
         if self._amount_of_games_ends_recived[client_id] == self._needed_games_ends:
+            if self._semi_join_filter:
+                self.__publish_semi_join_filter(client_id)
+
             if "Q" in forwarding_queue_name:
                 # Created here, otherwise each review that is joined must created the queue
                 self.__middleware.create_queue(forwarding_queue_name)
@@ -315,6 +332,16 @@ class Join:
             if not client_id in self._amount_of_games_ends_recived or not (
                 self._amount_of_games_ends_recived[client_id] == self._needed_games_ends
             ):
+                if self._eager_join:
+                    # app_id identifica a un unico juego, si ya llego se puede joinear
+                    # sin esperar a los ENDs de games
+                    games = self._games_index.get_games(client_id, int(review[1]))
+                    if games:
+                        self.__join_and_send(
+                            review, client_id, forwarding_queue_name, games
+                        )
+                        continue
+
                 # Havent received all ends, save in disk
                 # TODO: Se puede hacer una funcion aparte para esto para no generarse la lista todo el rato
                 
@@ -331,7 +358,8 @@ class Join:
                 # # TODO: use write_batch_by_range  
                 # atomically_append_to_file(client_dir, "reviews.csv", [review])
             else:
-                self.__join_and_send(review, client_id, forwarding_queue_name)
+                games = self._games_index.get_games(client_id, int(review[1]))
+                self.__join_and_send(review, client_id, forwarding_queue_name, games)
 
         self.__middleware.ack(delivery_tag)
 
@@ -382,6 +410,22 @@ class Join:
             )
             logging.debug(f"Sent {message} to: {i}_{forwarding_queue_name}")
 
+    def __publish_semi_join_filter(self, client_id: str):
+        # Todos los games del cliente ya llegaron, los nodos de antes pueden
+        # descartar las reviews que este join nunca va a poder joinear
+        app_ids = self._games_index.get_app_ids(client_id)
+        publish_semi_join_filter(
+            self.__middleware,
+            self._semi_join_filter,
+            client_id,
+            str(self._node_id),
+            app_ids,
+            self._semi_join_false_positive_rate,
+        )
+        logging.debug(
+            f"Published {self._semi_join_filter} semi join filter of {len(app_ids)} app_ids for client {client_id}"
+        )
+
     def __games_columns_to_keep(self, games_record: list[str]):
         return [games_record[i] for i in self._games_columns_to_keep]
 
@@ -389,35 +433,26 @@ class Join:
         return [reviews_record[i] for i in self._reviews_columns_to_keep]
 
     def __send_stored_reviews(self, client_id, forwarding_queue_name):
+        # Merge join por particion: games y reviews usan el mismo rango de particion,
+        # asi que cada particion de games (residente o spilleada) se carga una sola
+        # vez y se recorre secuencialmente la particion de reviews que le corresponde
         client_reviews_dir = os.path.join(self._reviews_dir, client_id)
-        for record in read_all_files(client_reviews_dir):
-            self.__join_and_send(
-                review=record,
-                client_id=client_id,
-                forwarding_queue_name=forwarding_queue_name,
-            )
+        for partition, reviews in read_partitions(client_reviews_dir):
+            if not self._games_index.has_partition(client_id, partition):
+                logging.debug(f"No games for partition {partition}, skipping its reviews")
+                continue
 
-    @staticmethod
-    def __generate_unique_msg_id(game_msg_id: str, review_msg_id: str) -> str:
-        """
-        games_msg_id > reviews_msg_id
-        """
-        return (
-            str(len(game_msg_id))
-            + game_msg_id
-            + str(len(review_msg_id))
-            + review_msg_id
-        )
+            for review in reviews:
+                games = self._games_index.get_games(client_id, int(review[1]))
+                self.__join_and_send(review, client_id, forwarding_queue_name, games)
+
+        self._games_index.log_stats(client_id)
 
-    def __join_and_send(self, review, client_id, forwarding_queue_name):
+    def __join_and_send(self, review, client_id, forwarding_queue_name, games):
         # TODO: handle conversion error
         review_msg_id = review[0]
         review_app_id = int(review[1])
-        for record in read_by_range(
-            f"{self._games_dir}/{client_id}", 
-            int(self._partition_range), 
-            review_app_id
-        ):
+        for record in games:
             # record_splitted = record.split(",", maxsplit=1)
             record_msg_id = record[0]
             record_app_id = record[1]
@@ -430,9 +465,9 @@ class Join:
             if review_app_id == int(record_app_id):
                 joined_message = [
                     client_id,
-                    # New id that's generated is just the concatenation of
-                    # both previous ids
-                    Join.__generate_unique_msg_id(record_msg_id, str(review_msg_id)),
+                    # Derived from both ids with a bounded width, chained joins
+                    # (Q4) don't make it grow on every hop
+                    derive_msg_id(record_msg_id, str(review_msg_id)),
                 ]
                 logging.debug(f"record: {record}")
                 logging.debug(f"review: {review}")
@@ -463,12 +498,16 @@ class Join:
                         f"Sending message: {joined_message} to queue: {node_id}_{forwarding_queue_name}"
                     )
 
-                    self.__middleware.publish_message(
+                    # Batched per destination, the batch is flushed on END/TIMEOUT
+                    # (__send_to_forward_queues) or by the middleware linger timer
+                    self.__middleware.publish(
                         joined_message,
                         f"{node_id}_{forwarding_queue_name}",
                     )
 
     def __clear_client_data(self, client_id: str):
+        self._games_index.remove_client(client_id)
+
         client_games_dir = f"{self._games_dir}/{client_id}"
         if not delete_directory(client_games_dir):
             logging.debug(f"Couldn't delete directory: {client_games_dir}")
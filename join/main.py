@@ -49,6 +49,26 @@ def get_config():
         config_params["PARTITION_RANGE"] = os.getenv(
             "PARTITION_RANGE", config["DEFAULT"]["PARTITION_RANGE"]
         )
+        config_params["MAX_GAMES_IN_MEMORY"] = int(
+            os.getenv("MAX_GAMES_IN_MEMORY", config["DEFAULT"]["MAX_GAMES_IN_MEMORY"])
+        )
+        config_params["MAX_LOADED_SPILLED_GAMES"] = int(
+            os.getenv(
+                "MAX_LOADED_SPILLED_GAMES", config["DEFAULT"]["MAX_LOADED_SPILLED_GAMES"]
+            )
+        )
+        config_params["EAGER_JOIN"] = (
+            os.getenv("EAGER_JOIN", config["DEFAULT"]["EAGER_JOIN"]).lower() == "true"
+        )
+        config_params["SEMI_JOIN_FILTER"] = os.getenv(
+            "SEMI_JOIN_FILTER", config["DEFAULT"]["SEMI_JOIN_FILTER"]
+        )
+        config_params["SEMI_JOIN_FALSE_POSITIVE_RATE"] = float(
+            os.getenv(
+                "SEMI_JOIN_FALSE_POSITIVE_RATE",
+                config["DEFAULT"]["SEMI_JOIN_FALSE_POSITIVE_RATE"],
+            )
+        )
         config_params["NEEDED_REVIEWS_ENDS"] = int(
             os.getenv("NEEDED_REVIEWS_ENDS", config["DEFAULT"]["NEEDED_REVIEWS_ENDS"])
         )
@@ -56,6 +76,21 @@ def get_config():
             os.getenv("NEEDED_GAMES_ENDS", config["DEFAULT"]["NEEDED_GAMES_ENDS"])
         )
 
+        # Output batches
+        config_params["MAX_BATCH_BYTES"] = int(
+            os.getenv("MAX_BATCH_BYTES", config["DEFAULT"]["MAX_BATCH_BYTES"])
+        )
+        config_params["BATCH_LINGER_MS"] = int(
+            os.getenv("BATCH_LINGER_MS", config["DEFAULT"]["BATCH_LINGER_MS"])
+        )
+        config_params["SESSION_DICTIONARY_BATCHES"] = (
+            os.getenv(
+                "SESSION_DICTIONARY_BATCHES",
+                config["DEFAULT"]["SESSION_DICTIONARY_BATCHES"],
+            ).lower()
+            == "true"
+        )
+
         # For forwarding to the client
         config_params["INSTANCES_OF_MYSELF"] = int(
             os.getenv("INSTANCES_OF_MYSELF", config["DEFAULT"]["INSTANCES_OF_MYSELF"])
@@ -117,7 +152,13 @@ def main():
     logging.debug("Logging configuration:")
     [logging.info(f"{key}: {value}") for key, value in config.items()]
 
-    middleware = Middleware(config["RABBIT_IP"], use_logging=True)
+    middleware = Middleware(
+        config["RABBIT_IP"],
+        use_logging=True,
+        max_batch_bytes=config.pop("MAX_BATCH_BYTES"),
+        linger_ms=config.pop("BATCH_LINGER_MS"),
+        session_dictionary_batches=config.pop("SESSION_DICTIONARY_BATCHES"),
+    )
     config.pop("RABBIT_IP", None)
     config.pop("LOGGING_LEVEL", None)
 
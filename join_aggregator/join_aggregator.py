@@ -0,0 +1,154 @@
+import logging
+import signal
+import threading
+
+from common.activity_log.activity_log import ActivityLog
+from common.middleware.middleware import Middleware, MiddlewareError
+from common.watchdog_client.watchdog_client import WatchdogClient
+
+from typing import *
+
+END_TRANSMISSION_MESSAGE = "END"
+SESSION_TIMEOUT_MESSAGE = "TIMEOUT"
+
+END_TRANSMISSION_MESSAGE_CLIENT_ID_INDEX = 0
+END_TRANSMISSION_MESSAGE_MSG_ID_INDEX = 1
+END_TRANSMISSION_MESSAGE_END_INDEX = 2
+
+
+class JoinAggregator:
+    """
+    Fan-in of the outputs of several join instances into a single queue.
+
+    Joined rows are forwarded as they arrive (batched), the END of a client is
+    sent only once every join instance sent its own, so the next node (e.g.
+    the client handler for the Q<x> queues) sees a single END per client.
+    """
+
+    def __init__(
+        self,
+        middleware: Middleware,
+        monitor: WatchdogClient,
+        config: dict[str, str],
+        activity_log: ActivityLog,
+    ):
+        self.__middleware = middleware
+        self._client_monitor = monitor
+
+        self._got_sigterm = False
+        self._node_id = config["NODE_ID"]
+        self._input_queue_name = config["INPUT_QUEUE_NAME"]
+        self._output_queue_name = config["OUTPUT_QUEUE_NAME"]
+        self._amount_of_joins = config["AMOUNT_OF_JOINS"]
+        self._activity_log = activity_log
+
+        self.__total_timeouts_received_per_client = {}
+        self.__total_ends_received_per_client = self._activity_log.recover_ends_state()
+
+        signal.signal(signal.SIGINT, self.__signal_handler)
+        signal.signal(signal.SIGTERM, self.__signal_handler)
+
+    def __signal_handler(self, sig, frame):
+        logging.debug(f"Gracefully shutting down...")
+        self._got_sigterm = True
+        self.__middleware.shutdown()
+        self._client_monitor.stop()
+
+    def start(self):
+        monitor_thread = threading.Thread(target=self._client_monitor.start)
+        monitor_thread.start()
+
+        self.__middleware.create_queue(self._input_queue_name)
+        self.__middleware.create_queue(self._output_queue_name)
+
+        callback = self.__middleware.generate_callback(self.__callback)
+        self.__middleware.attach_callback(self._input_queue_name, callback)
+
+        self.__resume_end_if_necesary()
+        try:
+            self.__middleware.start_consuming()
+        except MiddlewareError as e:
+            if not self._got_sigterm:
+                logging.error(e)
+        finally:
+            self.__middleware.shutdown()
+
+    def __resume_end_if_necesary(self):
+        # Si me cai despues de loggear el ultimo END pero antes de mandarlo,
+        # lo mando ahora (las filas ya se reenviaron antes de cada ack)
+        for client_id, amount in list(self.__total_ends_received_per_client.items()):
+            if amount == self._amount_of_joins:
+                logging.debug(f"Sending END of client {client_id} [Restart]")
+                self.__send_end(client_id)
+
+    def __callback(self, delivery_tag, body):
+        body = self.__middleware.get_rows_from_message(body)
+
+        if len(body) == 1 and body[0][1] == SESSION_TIMEOUT_MESSAGE:
+            self.__handle_timeout(body[0][END_TRANSMISSION_MESSAGE_CLIENT_ID_INDEX])
+            self.__middleware.ack(delivery_tag)
+            return
+
+        if (
+            len(body) == 1
+            and len(body[0]) > END_TRANSMISSION_MESSAGE_END_INDEX
+            and body[0][END_TRANSMISSION_MESSAGE_END_INDEX] == END_TRANSMISSION_MESSAGE
+        ):
+            client_id = body[0][END_TRANSMISSION_MESSAGE_CLIENT_ID_INDEX]
+            msg_id = body[0][END_TRANSMISSION_MESSAGE_MSG_ID_INDEX]
+            logging.debug(f"END of join {msg_id} received for client {client_id}")
+
+            self.__handle_end_transmission(client_id, msg_id)
+            self.__middleware.ack(delivery_tag)
+            return
+
+        for row in body:
+            self.__middleware.publish(row, self._output_queue_name)
+
+        self.__middleware.ack(delivery_tag)
+
+    def __handle_timeout(self, client_id: str):
+        logging.info(f"Timeout received for session: {client_id}")
+        self.__total_timeouts_received_per_client[client_id] = (
+            self.__total_timeouts_received_per_client.get(client_id, 0) + 1
+        )
+
+        if self.__total_timeouts_received_per_client[client_id] < self._amount_of_joins:
+            return
+
+        self.__middleware.publish_batch(self._output_queue_name)
+        # If it contains Q<x>, then the client handler is next, shouldn't forward the timeout
+        if "Q" not in self._output_queue_name:
+            self.__middleware.publish_message(
+                [client_id, SESSION_TIMEOUT_MESSAGE], self._output_queue_name
+            )
+
+        self.__clear_client_data(client_id)
+
+    def __handle_end_transmission(self, client_id: str, msg_id: str):
+        end_was_duplicated = self._activity_log.log_end(client_id, msg_id)
+        if end_was_duplicated:
+            return
+
+        self.__total_ends_received_per_client[client_id] = (
+            self.__total_ends_received_per_client.get(client_id, 0) + 1
+        )
+
+        if self.__total_ends_received_per_client[client_id] == self._amount_of_joins:
+            self.__send_end(client_id)
+
+    def __send_end(self, client_id: str):
+        # Las filas que quedaron en el batch tienen que salir antes que el END
+        self.__middleware.publish_batch(self._output_queue_name)
+        self.__middleware.send_end(
+            queue=self._output_queue_name,
+            end_message=[client_id, self._node_id, END_TRANSMISSION_MESSAGE],
+        )
+        logging.info(f"Sent END of client {client_id} to {self._output_queue_name}")
+
+        self.__clear_client_data(client_id)
+
+    def __clear_client_data(self, client_id: str):
+        self.__total_ends_received_per_client.pop(client_id, None)
+        self.__total_timeouts_received_per_client.pop(client_id, None)
+        self._activity_log.remove_client_logs(client_id)
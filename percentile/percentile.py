@@ -1,7 +1,6 @@
 import os
 import signal
 import logging
-import math
 import threading
 
 from common.watchdog_client.watchdog_client import WatchdogClient
@@ -10,9 +9,7 @@ from typing import *
 from common.middleware.middleware import Middleware, MiddlewareError
 from common.storage import storage
 from common.activity_log.activity_log import ActivityLog
-
-FILE_NAME = "percentile_data.csv"
-NO_RECORDS = 0
+from common.percentile_store.percentile_store import PercentileStore
 
 END_TRANSMISSION_MESSAGE = "END"
 SESSION_TIMEOUT_MESSAGE = "TIMEOUT"
@@ -44,6 +41,7 @@ class Percentile:
         self._node_id = config["NODE_ID"]
 
         self._activity_log = activity_log
+        self._percentile_store = PercentileStore(self._storage_dir)
 
         self._recived_ends = self._activity_log.recover_ends_state()
 
@@ -126,7 +124,7 @@ class Percentile:
 
             return
 
-        storage.add_batch_to_sorted_file_per_client(self._storage_dir, body)
+        self._percentile_store.add_batch_per_client(body)
 
         self._middleware.ack(delivery_tag)
 
@@ -157,21 +155,16 @@ class Percentile:
         logging.debug(f"Percentile is: {percentile}")
 
         forwarding_queue_name = self._publish_queue
-        storage_dir = f"{self._storage_dir}/{client_id}"
 
-        reader = storage.read_sorted_file(storage_dir)
+        reader = self._percentile_store.read_records_from(client_id, percentile)
         for row in reader:
-
-            record_value = int(row[1])
-            if record_value >= percentile:
-                logging.debug(f"row: {row}")
-                # row.insert(0, client_id)
-                # TODO: fix the way this is being saved, as we now get: [game, amount, msg_id].
-                # It should be [game, msg_id, amount]
-                logging.debug(f"Sending: {[client_id, row[-1], row[0], row[1]]}")
-                self._middleware.publish(
-                    [client_id, row[-1], row[0], row[1]], forwarding_queue_name
-                )
+            logging.debug(f"row: {row}")
+            # TODO: fix the way this is being saved, as we now get: [game, amount, msg_id].
+            # It should be [game, msg_id, amount]
+            logging.debug(f"Sending: {[client_id, row[-1], row[0], row[1]]}")
+            self._middleware.publish(
+                [client_id, row[-1], row[0], row[1]], forwarding_queue_name
+            )
 
         self._middleware.publish_batch(forwarding_queue_name)
         self._middleware.send_end(
@@ -180,33 +173,8 @@ class Percentile:
         )
 
     def _get_percentile(self, client_id):
-        # to get the rank, i need to read the file if i do not have a countera (i need the amount of messages)
-        rank = self._get_rank(client_id)
-
-        logging.debug(f"Ordinal rank is {rank}")
-
-        storage_dir = f"{self._storage_dir}/{client_id}"
-        reader = storage.read_sorted_file(storage_dir)
-        for i, row in enumerate(reader):
-            if (i + 1) == rank:
-                name, value, msg_id = row
-                logging.debug(f"VALUE: {value}")
-                return int(value)
-
-        return NO_RECORDS
-
-    def _get_rank(self, client_id):
-        amount_of_records = 0
-
-        storage_dir = f"{self._storage_dir}/{client_id}"
-        reader = storage.read_sorted_file(storage_dir)
-        for _ in reader:
-            amount_of_records += 1
-
-        rank = (self._percentile / 100) * amount_of_records
-        rank = math.ceil(rank)  # instead of interpolating, round the number
-
-        return rank
+        # The store keeps a running count, so the rank is known without reading the runs
+        return self._percentile_store.get_percentile(client_id, self._percentile)
 
     def _clear_client_data(self, client_id: str, storage_dir: str):
 
@@ -215,6 +183,8 @@ class Percentile:
         else:
             logging.debug(f"Deleted directory: {storage_dir}")
 
+        self._percentile_store.remove_client(client_id)
+
         if client_id in self._recived_ends:
             del self._recived_ends[client_id]
         if client_id in self._received_client_timeouts:
@@ -5,11 +5,8 @@ import threading
 
 from common.activity_log.activity_log import ActivityLog
 from common.middleware.middleware import Middleware, MiddlewareError
-from common.storage.storage import (
-    read_sorted_file,
-    add_batch_to_sorted_file_per_client,
-    delete_directory,
-)
+from common.storage.storage import delete_directory
+from common.top_k_store.top_k_store import TopKStore
 from common.watchdog_client.watchdog_client import WatchdogClient
 
 from typing import *
@@ -42,6 +39,7 @@ class TopK:
         self._output_top_k_queue_name = config["OUTPUT_TOP_K_QUEUE_NAME"]
         self._k = int(config["K"])
         self._activity_log = activity_log
+        self._top_k_store = TopKStore("tmp", self._k, ascending=False)
 
         self.__total_ends_received_per_client = self._activity_log.recover_ends_state()
 
@@ -156,12 +154,7 @@ class TopK:
             return
 
         try:
-            add_batch_to_sorted_file_per_client(
-                "tmp",
-                body,
-                ascending=False,
-                limit=self._k,
-            )
+            self._top_k_store.add_batch_per_client(body)
 
         except ValueError as e:
             logging.error(
@@ -205,7 +198,7 @@ class TopK:
         COUNT = 1
         MSG_ID = 2
         logging.debug("Sending the following top:")
-        for record in read_sorted_file(f"tmp/{client_id}"):
+        for record in self._top_k_store.read_top(client_id):
             # Si no se lo paso a un agregador, sino que se lo estoy mandando al cliente,
             # le tengo que mandar solo lo que le interesa
             if "Q" in forwarding_queue_name:
@@ -228,6 +221,8 @@ class TopK:
         else:
             logging.debug(f"Deleted directory: {storage_dir}")
 
+        self._top_k_store.remove_client(client_id)
+
         if client_id in self.__total_ends_received_per_client:
             del self.__total_ends_received_per_client[client_id]
         if client_id in self.__total_timeouts_received_per_client:
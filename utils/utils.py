@@ -1,6 +1,13 @@
 import hashlib
 from typing import * 
 
+# Derived msg_ids (see derive_msg_id)
+PACKED_MSG_ID_BITS = 32
+WIDE_PACKED_MSG_ID_BITS = 64
+WIDE_PACKED_MSG_ID_FLAG = 1 << 127
+HASHED_MSG_ID_FLAG = 1 << 126
+HASHED_MSG_ID_BYTES = 16
+
 
 def node_id_to_send_to(client_id: str, app_id: str, nodes: int) -> int:
     """
@@ -77,4 +84,32 @@ def group_msg_ids_per_client_by_field(
     
         msg_ids_per_record_by_client_id[client_id][record_id].append(msg_id)
 
-    return msg_ids_per_record_by_client_id
\ No newline at end of file
+    return msg_ids_per_record_by_client_id
+
+
+def derive_msg_id(left_msg_id: str, right_msg_id: str) -> str:
+    '''
+    Deterministic msg_id for a row built from two others (a game and a review
+    in a join, a platform and a game...). Its width is bounded instead of
+    growing with every derivation:
+
+        - Both fit in 31 / 32 bits (msg_ids of the client files):
+          (left << 32) | right, a 64 bit id (below 2^63)
+        - Both fit in 63 / 64 bits: 2^127 | (left << 64) | right
+        - Any other (ids derived several times): 2^126 | hash of 126 bits of both
+
+    The three ranges don't overlap and the first two are injective, the last
+    one is a 126 bit hash (collisions are negligible within a session).
+    '''
+    left, right = int(left_msg_id), int(right_msg_id)
+
+    if left < (1 << (PACKED_MSG_ID_BITS - 1)) and right < (1 << PACKED_MSG_ID_BITS):
+        return str((left << PACKED_MSG_ID_BITS) | right)
+
+    if left < (1 << (WIDE_PACKED_MSG_ID_BITS - 1)) and right < (1 << WIDE_PACKED_MSG_ID_BITS):
+        return str(WIDE_PACKED_MSG_ID_FLAG | (left << WIDE_PACKED_MSG_ID_BITS) | right)
+
+    digest = hashlib.blake2b(
+        f"{left}|{right}".encode(), digest_size=HASHED_MSG_ID_BYTES
+    ).digest()
+    return str(HASHED_MSG_ID_FLAG | (int.from_bytes(digest, "big") & (HASHED_MSG_ID_FLAG - 1)))
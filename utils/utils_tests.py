@@ -0,0 +1,86 @@
+import unittest
+
+from utils.utils import (
+    HASHED_MSG_ID_FLAG,
+    PACKED_MSG_ID_BITS,
+    WIDE_PACKED_MSG_ID_BITS,
+    WIDE_PACKED_MSG_ID_FLAG,
+    derive_msg_id,
+)
+
+MAX_MSG_ID_DIGITS = 39
+
+
+def derive(left: int, right: int) -> int:
+    return int(derive_msg_id(str(left), str(right)))
+
+
+class DeriveMsgIdTests(unittest.TestCase):
+    def test_01_packed_ids_round_trip_at_the_32_bit_boundary(self):
+        max_left = (1 << (PACKED_MSG_ID_BITS - 1)) - 1
+        max_right = (1 << PACKED_MSG_ID_BITS) - 1
+        for left, right in [(0, 0), (1, 2), (max_left, max_right), (max_left, 0), (0, max_right)]:
+            msg_id = derive(left, right)
+
+            self.assertLess(msg_id, 1 << 63)
+            self.assertEqual(msg_id >> PACKED_MSG_ID_BITS, left)
+            self.assertEqual(msg_id & ((1 << PACKED_MSG_ID_BITS) - 1), right)
+
+    def test_02_wide_packed_ids_round_trip_at_the_64_bit_boundary(self):
+        max_left = (1 << (WIDE_PACKED_MSG_ID_BITS - 1)) - 1
+        max_right = (1 << WIDE_PACKED_MSG_ID_BITS) - 1
+        # Justo por encima del limite de 31 / 32 bits pasan al rango ancho
+        for left, right in [
+            (1 << (PACKED_MSG_ID_BITS - 1), 0),
+            (0, 1 << PACKED_MSG_ID_BITS),
+            (max_left, max_right),
+        ]:
+            msg_id = derive(left, right)
+
+            self.assertTrue(msg_id & WIDE_PACKED_MSG_ID_FLAG)
+            self.assertLess(msg_id, WIDE_PACKED_MSG_ID_FLAG << 1)
+            msg_id ^= WIDE_PACKED_MSG_ID_FLAG
+            self.assertEqual(msg_id >> WIDE_PACKED_MSG_ID_BITS, left)
+            self.assertEqual(msg_id & ((1 << WIDE_PACKED_MSG_ID_BITS) - 1), right)
+
+    def test_03_ids_past_64_bits_are_hashed(self):
+        for left, right in [(1 << (WIDE_PACKED_MSG_ID_BITS - 1), 0), (0, 1 << WIDE_PACKED_MSG_ID_BITS)]:
+            msg_id = derive(left, right)
+
+            self.assertTrue(msg_id & HASHED_MSG_ID_FLAG)
+            self.assertFalse(msg_id & WIDE_PACKED_MSG_ID_FLAG)
+            self.assertEqual(msg_id, derive(left, right))
+
+    def test_04_ranges_do_not_overlap(self):
+        packed = [derive(0, 0), derive((1 << 31) - 1, (1 << 32) - 1)]
+        wide_packed = [derive(1 << 31, 0), derive((1 << 63) - 1, (1 << 64) - 1)]
+        hashed = [derive(1 << 63, 0), derive(0, 1 << 64), derive(1 << 100, 1 << 100)]
+
+        # packed < 2^63 <= 2^126 <= hashed < 2^127 <= wide_packed
+        self.assertLess(max(packed), 1 << 63)
+        self.assertTrue(all(HASHED_MSG_ID_FLAG <= m < WIDE_PACKED_MSG_ID_FLAG for m in hashed))
+        self.assertTrue(all(m >= WIDE_PACKED_MSG_ID_FLAG for m in wide_packed))
+
+    def test_05_boundary_pairs_get_distinct_ids(self):
+        boundaries = [0, 1, (1 << 31) - 1, 1 << 31, (1 << 32) - 1, 1 << 32, (1 << 63) - 1, 1 << 63]
+        pairs = [(left, right) for left in boundaries for right in boundaries]
+
+        msg_ids = [derive(left, right) for left, right in pairs]
+
+        self.assertEqual(len(set(msg_ids)), len(pairs))
+
+    def test_06_q4_triple_derivation_stays_within_39_digits(self):
+        # Q4 encadena tres joins, cada uno deriva el msg_id del anterior con
+        # el de una fila (que puede venir de cualquiera de los dos lados)
+        client_msg_ids = [0, (1 << 31) - 1, (1 << 32) - 1]
+        for game in client_msg_ids:
+            for review in client_msg_ids:
+                first = derive(game, review)
+                for second in (derive(first, review), derive(game, first)):
+                    for third in (derive(second, review), derive(game, second)):
+                        for msg_id in (first, second, third):
+                            self.assertLessEqual(len(str(msg_id)), MAX_MSG_ID_DIGITS)
+
+
+if __name__ == "__main__":
+    unittest.main()